@@ -1,3 +1,4 @@
+import concurrent.futures as cf
 import logging as lg
 import subprocess as sp
 
@@ -6,6 +7,8 @@ from typing import Optional, Union
 
 import ffmpy
 
+from vmaf_job_engine import VMAF_Job_Engine
+
 # from vmaf_file_handler import VMAF_File_Handler
 
 
@@ -18,10 +21,12 @@ class FFmpy_Handler:
         self,
         executable_ffmpeg: str,
         log: Optional[lg.RootLogger],
+        engine: Optional[VMAF_Job_Engine] = None,
     ):
         self._executable_ffmpeg = None
         self._libraries = []
         self._log = log
+        self._engine = engine
         # super.__init__(
         #     file=executable,
         #     file_type="config",
@@ -56,7 +61,9 @@ class FFmpy_Handler:
         ff_inputs: Optional[dict] = None,
         ff_outputs: Optional[dict] = None,
         get_cmd: Optional[bool] = False,
-    ) -> Union[str, tuple]:
+        timeout: Optional[float] = None,
+        wait: Optional[bool] = True,
+    ) -> Union[str, tuple, cf.Future]:
         ff_exec = None
 
         try:
@@ -82,6 +89,12 @@ class FFmpy_Handler:
 
             if get_cmd:
                 return ff.cmd
+            elif self._engine is not None:
+                # Keep the complete output, since callers parse all of it
+                task = self._engine.submit(ff._cmd, timeout=timeout, keep_lines=None)
+                if wait:
+                    return task.result()
+                return task
             else:
                 return ff.run(stdout=sp.PIPE, stderr=sp.PIPE)
         except ffmpy.FFExecutableNotFoundError as ffenfe:
@@ -0,0 +1,131 @@
+import os
+import subprocess as sp
+import sys
+from time import time
+from typing import Optional
+
+from vmaf_common import bytes2human
+
+# Resource usage recorded for every FFmpeg process, in the order they are
+# written to the aggregate logs
+USAGE_FIELDS = ["wall", "user", "sys", "max_rss", "read_bytes", "disk_read_bytes"]
+
+# Fields of USAGE_FIELDS that add up when a job is split into several processes
+ADDITIVE_FIELDS = ["wall", "user", "sys", "read_bytes", "disk_read_bytes"]
+
+
+def read_proc_io(pid: int) -> dict:
+    """Read the bytes a process read through system calls ("rchar") and from storage ("read_bytes") from /proc."""
+    counters = {}
+    try:
+        with open("/proc/{}/io".format(pid), "r") as io:
+            for line in io:
+                name, value = line.split(":", 1)
+                counters[name.strip()] = int(value)
+    except (OSError, ValueError):
+        pass
+    return counters
+
+
+def _exit_code(status: int) -> int:
+    if hasattr(os, "waitstatus_to_exitcode"):
+        return os.waitstatus_to_exitcode(status)
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def wait_process(
+    process: sp.Popen,
+    started: float,
+    block: Optional[bool] = True,
+) -> Optional[dict]:
+    """Wait for a child process to exit and reap it, collecting its resource usage.
+
+    The exited process is first waited for without being reaped, so its I/O
+    counters can still be read from /proc, and then reaped with os.wait4 for
+    its CPU times and peak memory. Where os.wait4 does not exist only the wall
+    time is known. Sets process.returncode like Popen.wait does.
+
+    Args:
+        process (sp.Popen): The child process, which nothing else may wait for.
+        started (float): When the process was started, as returned by time.time.
+        block (Optional[bool]): Wait for the process to exit. Defaults to True, and False returns None right away if
+            it is still running.
+
+    Returns:
+        Optional[dict]: The process's usage with every field of USAGE_FIELDS, None for the ones that are unknown.
+    """
+    if process.returncode is not None:
+        return None
+    usage = {field: None for field in USAGE_FIELDS}
+    if not hasattr(os, "wait4"):
+        if not block and process.poll() is None:
+            return None
+        process.wait()
+        usage["wall"] = time() - started
+        return usage
+
+    flags = 0 if block else os.WNOHANG
+    if hasattr(os, "waitid") and hasattr(os, "WNOWAIT"):
+        if os.waitid(os.P_PID, process.pid, os.WEXITED | os.WNOWAIT | flags) is None:
+            return None
+        counters = read_proc_io(process.pid)
+        if "rchar" in counters:
+            usage["read_bytes"] = counters["rchar"]
+            usage["disk_read_bytes"] = counters.get("read_bytes")
+        flags = 0
+    pid, status, rusage = os.wait4(process.pid, flags)
+    if pid == 0:
+        return None
+    process.returncode = _exit_code(status)
+    usage["wall"] = time() - started
+    usage["user"] = rusage.ru_utime
+    usage["sys"] = rusage.ru_stime
+    # Linux counts the peak resident memory in KiB, macOS in bytes
+    usage["max_rss"] = rusage.ru_maxrss if sys.platform == "darwin" else rusage.ru_maxrss * 1024
+    return usage
+
+
+def add_usage(
+    total: Optional[dict],
+    usage: Optional[dict],
+    share: Optional[float] = 1.0,
+) -> Optional[dict]:
+    """Add a process's usage to a running total, like the segments of one encoded video file.
+
+    Args:
+        total (Optional[dict]): The usage so far, or None to start a new total.
+        usage (Optional[dict]): The usage to add, from wait_process.
+        share (Optional[float]): Share of the additive fields that belongs to the total, for processes that
+            calculated several encoded video files at once. Defaults to 1.0.
+
+    Returns:
+        Optional[dict]: The new total.
+    """
+    if usage is None:
+        return total
+    total = dict(total) if total is not None else {field: None for field in USAGE_FIELDS}
+    for field in USAGE_FIELDS:
+        if usage.get(field) is None:
+            continue
+        if field in ADDITIVE_FIELDS:
+            total[field] = (total[field] or 0) + usage[field] * share
+        else:
+            total[field] = max(total[field] or 0, usage[field])
+    return total
+
+
+def format_usage(usage: Optional[dict]) -> str:
+    """Describe a usage from wait_process in a single line."""
+    if usage is None:
+        return "Resource usage: unknown"
+    parts = ["wall {:.1f}s".format(usage["wall"] or 0.0)]
+    if usage.get("user") is not None:
+        parts.append("user {:.1f}s".format(usage["user"]))
+        parts.append("sys {:.1f}s".format(usage["sys"]))
+    if usage.get("max_rss") is not None:
+        parts.append("max RSS {}".format(bytes2human(usage["max_rss"])))
+    if usage.get("read_bytes") is not None:
+        parts.append("read {}".format(bytes2human(usage["read_bytes"])))
+    return "Resource usage: " + ", ".join(parts)
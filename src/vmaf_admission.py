@@ -0,0 +1,277 @@
+import asyncio
+import multiprocessing as mp
+import os
+import threading
+from time import sleep, time
+from typing import Optional
+
+from vmaf_common import get_available_memory
+from vmaf_scheduler import FEATURE_WEIGHTS
+
+# Fixed memory of every FFmpeg process, for its code, libvmaf's models and
+# the filter graph itself
+BASE_MEMORY = 96 * 1024 * 1024
+
+# Frames kept by every decoder, and frames converted to 12-bit 4:4:4 queued
+# up in front of every libvmaf filter
+DECODE_FRAMES = 16
+CONVERT_FRAMES = 8
+
+# Bytes per pixel of the float buffers every VMAF model's feature extractors
+# keep, and of a feature with a weight of 1.0 in FEATURE_WEIGHTS
+MODEL_BYTES_PER_PIXEL = 32
+FEATURE_BYTES_PER_PIXEL = 16
+
+# Measured peaks are scaled up by this much before they are used as estimates
+PEAK_MARGIN = 1.1
+
+# Memory that is always left available to the rest of the system
+MEMORY_HEADROOM = 512 * 1024 * 1024
+
+
+def pix_fmt_bytes(pix_fmt: Optional[str]) -> float:
+    """Get the bytes per pixel of a frame in an FFmpeg pixel format, assuming 4:2:0 8-bit for unknown formats."""
+    pix_fmt = pix_fmt or ""
+    if "444" in pix_fmt or pix_fmt.startswith(("rgb", "bgr", "gbr")):
+        size = 3.0
+    elif "422" in pix_fmt:
+        size = 2.0
+    else:
+        size = 1.5
+    if any([depth in pix_fmt for depth in ["p9", "p10", "p12", "p14", "p16"]]):
+        size *= 2
+    return size
+
+
+def estimate_memory(
+    width: int,
+    height: int,
+    pix_fmt: Optional[str],
+    models: int,
+    features: Optional[list] = None,
+    branches: Optional[int] = 1,
+) -> int:
+    """Estimate the peak memory of an FFmpeg process comparing encoded videos against one reference decode.
+
+    Args:
+        width (int): Width of the videos.
+        height (int): Height of the videos.
+        pix_fmt (Optional[str]): Pixel format of the videos.
+        models (int): Number of VMAF models calculated.
+        features (Optional[list]): Extra libvmaf features calculated. Defaults to None.
+        branches (Optional[int]): Number of encoded videos compared in the same process. Defaults to 1.
+
+    Returns:
+        int: Estimated peak memory in bytes.
+    """
+    pixels = width * height
+    decode = pixels * pix_fmt_bytes(pix_fmt) * DECODE_FRAMES
+    convert = pixels * pix_fmt_bytes("yuv444p12") * CONVERT_FRAMES
+    metrics = models * MODEL_BYTES_PER_PIXEL + sum(
+        [FEATURE_WEIGHTS.get(feature, 1.0) * FEATURE_BYTES_PER_PIXEL for feature in features or []]
+    )
+    return int(BASE_MEMORY + decode + branches * (decode + convert + pixels * metrics))
+
+
+def memory_key(
+    width: int,
+    height: int,
+    pix_fmt: Optional[str],
+    models: dict,
+    features: Optional[list] = None,
+    branches: Optional[int] = 1,
+) -> str:
+    """Describe a job's memory footprint, so measured peaks are only reused for the same kind of job."""
+    return "{}x{}|{}|{}|{}|branches={}".format(
+        width,
+        height,
+        pix_fmt,
+        ",".join(sorted(models.keys())),
+        ",".join(sorted(features or [])),
+        branches,
+    )
+
+
+def get_process_memory(pid: int) -> tuple:
+    """Read the current and peak resident memory of a running process in bytes, or (0, 0) if it can not be read."""
+    rss, peak = 0, 0
+    try:
+        with open("/proc/{}/status".format(pid), "r") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    rss = int(line.split()[1]) * 1024
+                elif line.startswith("VmHWM:"):
+                    peak = int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return rss, max(rss, peak)
+
+
+def read_cpu_times() -> Optional[tuple]:
+    """Read the busy and total CPU time of the whole system from /proc/stat, or None if it can not be read."""
+    try:
+        with open("/proc/stat", "r") as stat:
+            values = [int(value) for value in stat.readline().split()[1:]]
+    except (OSError, ValueError):
+        return None
+    # The idle and iowait columns are the time the CPUs had nothing to run
+    idle = sum(values[3:5])
+    return sum(values) - idle, sum(values)
+
+
+class VMAF_Admission_Ticket:
+    """One job's claim on the memory and CPU budget of a VMAF_Admission controller.
+
+    Job runners call wait (or wait_async) before starting the job's process,
+    start with its pid once it runs and finish once it exits. The peak resident
+    memory of the process is available as "peak" afterwards.
+    """
+
+    def __init__(
+        self,
+        admission,
+        estimate: int,
+        key: Optional[str] = None,
+    ):
+        self.admission = admission
+        self.estimate = estimate
+        self.key = key
+        self.pid = None
+        self.rss = 0
+        self.peak = 0
+
+    def wait(self):
+        while not self.admission.try_admit(self):
+            sleep(self.admission.get_poll())
+
+    async def wait_async(self):
+        while not self.admission.try_admit(self):
+            await asyncio.sleep(self.admission.get_poll())
+
+    def start(self, pid: int):
+        self.pid = pid
+        self.admission.sample()
+
+    def finish(self):
+        self.admission.release(self)
+
+
+class VMAF_Admission:
+    """Only lets new FFmpeg processes start while the system has the memory and CPU time to run them.
+
+    Every job asks for a ticket with its estimated peak memory. A job is
+    admitted once the available memory covers its estimate plus whatever the
+    running jobs are still expected to grow by, the CPUs are not already busy
+    and enough time has passed since the last admission for its effect to show
+    up. A job is always admitted when nothing else is running, so a single
+    oversized job can still run.
+
+    The peak resident memory of every running job is sampled from /proc, and
+    saved to the history under the ticket's key, so later estimates for the
+    same kind of job use the measured peak instead of the estimate.
+    """
+
+    def __init__(
+        self,
+        memory_limit: Optional[int] = 0,
+        load_limit: Optional[float] = 0.9,
+        ramp_up: Optional[float] = 2.0,
+        poll: Optional[float] = 0.5,
+        history=None,
+    ):
+        self._memory_limit = memory_limit
+        self._load_limit = load_limit
+        self._ramp_up = ramp_up
+        self._poll = poll
+        self._history = history
+        self._lock = threading.Lock()
+        self._history_lock = threading.Lock()
+        self._running = set()
+        self._last_admit = 0.0
+        self._cpu_times = read_cpu_times()
+        self._cpu_busy = 0.0
+        self._sampler = threading.Thread(target=self._sample_forever, name="VMAF_Admission", daemon=True)
+        self._sampler.start()
+
+    def get_poll(self) -> float:
+        return self._poll
+
+    def ticket(
+        self,
+        estimate: int,
+        key: Optional[str] = None,
+    ) -> VMAF_Admission_Ticket:
+        """Create the ticket of a job, using the peak measured for the same key in an earlier run if there is one."""
+        if self._history is not None and key is not None:
+            measured = self._history.get("memory", key)
+            if measured is not None:
+                estimate = int(measured["peak"] * PEAK_MARGIN)
+        return VMAF_Admission_Ticket(self, estimate, key)
+
+    def try_admit(self, ticket: VMAF_Admission_Ticket) -> bool:
+        with self._lock:
+            if len(self._running) > 0:
+                if time() - self._last_admit < self._ramp_up:
+                    return False
+                if self._load_limit > 0 and self._cpu_busy > self._load_limit:
+                    return False
+
+                # Running jobs that have not reached their estimate yet will
+                # still take that memory from what is available now
+                growth = sum([max(0, job.estimate - job.rss) for job in self._running])
+                if self._memory_limit > 0:
+                    used = sum([max(job.estimate, job.rss) for job in self._running])
+                    if used + ticket.estimate > self._memory_limit:
+                        return False
+                available = get_available_memory()
+                if available is not None and available - growth - MEMORY_HEADROOM < ticket.estimate:
+                    return False
+            self._running.add(ticket)
+            self._last_admit = time()
+            return True
+
+    def release(self, ticket: VMAF_Admission_Ticket):
+        self.sample()
+        with self._lock:
+            self._running.discard(ticket)
+        if self._history is not None and ticket.key is not None and ticket.peak > 0:
+            with self._history_lock:
+                measured = self._history.get("memory", ticket.key, {"peak": 0, "jobs": 0})
+                self._history.set(
+                    "memory",
+                    ticket.key,
+                    {"peak": max(measured["peak"], ticket.peak), "jobs": measured["jobs"] + 1},
+                )
+
+    def sample(self):
+        """Update the current and peak memory of every running job."""
+        with self._lock:
+            running = list(self._running)
+        for job in running:
+            if job.pid is not None:
+                rss, peak = get_process_memory(job.pid)
+                if peak > 0:
+                    job.rss = rss
+                    job.peak = max(job.peak, peak)
+
+    def _sample_cpu(self):
+        # Share of time the CPUs were busy since the last sample, falling back
+        # to the load average where /proc/stat does not exist
+        cpu_times = read_cpu_times()
+        if cpu_times is not None and self._cpu_times is not None:
+            if cpu_times[1] <= self._cpu_times[1]:
+                return
+            busy = (cpu_times[0] - self._cpu_times[0]) / (cpu_times[1] - self._cpu_times[1])
+            self._cpu_times = cpu_times
+        elif hasattr(os, "getloadavg"):
+            busy = os.getloadavg()[0] / mp.cpu_count()
+        else:
+            return
+        with self._lock:
+            self._cpu_busy = busy
+
+    def _sample_forever(self):
+        while True:
+            sleep(self._poll)
+            self.sample()
+            self._sample_cpu()
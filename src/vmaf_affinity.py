@@ -0,0 +1,257 @@
+import os
+import threading
+from pathlib import Path
+from time import time
+from typing import Optional, Union
+
+# Where Linux lists the CPUs of every NUMA node
+NUMA_ROOT = "/sys/devices/system/node"
+
+# CPU slot of every thread pool thread bound with VMAF_CPU_Slots.bind_thread
+_thread_slot = threading.local()
+
+
+def parse_cpu_list(text: str) -> list:
+    """Convert a Linux CPU list like "0-3,8-11" into a sorted list of CPU numbers."""
+    cpus = set()
+    for part in text.strip().split(","):
+        if part == "":
+            continue
+        if "-" in part:
+            first, last = part.split("-", 1)
+            cpus.update(range(int(first), int(last) + 1))
+        else:
+            cpus.add(int(part))
+    return sorted(cpus)
+
+
+def format_cpu_list(cpus: list) -> str:
+    """Convert CPU numbers into a Linux CPU list like "0-3,8-11"."""
+    ranges = []
+    for cpu in sorted(cpus):
+        if len(ranges) > 0 and ranges[-1][1] == cpu - 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ",".join(["{}-{}".format(*r) if r[0] != r[1] else str(r[0]) for r in ranges])
+
+
+def get_usable_cpus() -> list:
+    """Get the CPUs this process may run on."""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def read_numa_nodes(root: Optional[Union[str, Path]] = NUMA_ROOT) -> list:
+    """Read the CPUs of every NUMA node that this process may run on.
+
+    Returns:
+        list: One sorted list of CPU numbers per NUMA node, or a single list of every usable CPU when the NUMA
+            topology can not be read.
+    """
+    usable = set(get_usable_cpus())
+    nodes = []
+    node_dirs = (
+        sorted(Path(root).glob("node[0-9]*"), key=lambda node: int(node.name[4:])) if Path(root).exists() else []
+    )
+    for node_dir in node_dirs:
+        try:
+            cpus = [cpu for cpu in parse_cpu_list(node_dir.joinpath("cpulist").read_text()) if cpu in usable]
+        except (OSError, ValueError):
+            continue
+        if len(cpus) > 0:
+            nodes.append(cpus)
+    if len(nodes) == 0:
+        nodes = [sorted(usable)]
+    return nodes
+
+
+def plan_cpu_sets(
+    slots: int,
+    nodes: list,
+) -> list:
+    """Split the CPUs of the NUMA nodes into disjoint sets, one per worker slot.
+
+    Slots are spread over the nodes in proportion to their CPU counts, and
+    every node's CPUs are split into contiguous sets between its slots, so no
+    slot spans two nodes. With fewer slots than nodes, every slot gets whole
+    nodes instead.
+
+    Args:
+        slots (int): Number of worker slots.
+        nodes (list): CPU numbers of every NUMA node, from read_numa_nodes.
+
+    Returns:
+        list: Sorted CPU numbers of every slot.
+    """
+    slots = max(1, slots)
+    if slots <= len(nodes):
+        return [sorted([cpu for node in nodes[i::slots] for cpu in node]) for i in range(slots)]
+
+    # Largest remainder apportionment of the slots, with at least one per node
+    total = sum([len(node) for node in nodes])
+    shares = [slots * len(node) / total for node in nodes]
+    counts = [max(1, int(share)) for share in shares]
+    while sum(counts) < slots:
+        i = max(range(len(nodes)), key=lambda i: shares[i] - counts[i])
+        counts[i] += 1
+    while sum(counts) > slots:
+        i = max([i for i in range(len(nodes)) if counts[i] > 1], key=lambda i: counts[i] - shares[i])
+        counts[i] -= 1
+
+    cpu_sets = []
+    for node, count in zip(nodes, counts):
+        count = min(count, len(node))
+        for i in range(count):
+            cpu_sets.append(node[len(node) * i // count : len(node) * (i + 1) // count])
+    # Nodes with fewer CPUs than slots leave some slots to share a set
+    planned = len(cpu_sets)
+    while len(cpu_sets) < slots:
+        cpu_sets.append(cpu_sets[(len(cpu_sets) - planned) % planned])
+    return cpu_sets
+
+
+def pin_process(
+    pid: int,
+    cpus: list,
+):
+    """Pin a process, and every thread it already started, to a set of CPUs.
+
+    Threads started later inherit the affinity of the thread that starts them.
+    """
+    tids = [pid]
+    try:
+        tids += [int(task.name) for task in Path("/proc/{}/task".format(pid)).iterdir() if int(task.name) != pid]
+    except (OSError, ValueError):
+        pass
+    for tid in tids:
+        try:
+            os.sched_setaffinity(tid, cpus)
+        except (ProcessLookupError, PermissionError, OSError):
+            pass
+
+
+class VMAF_CPU_Slots:
+    """Hands out worker slots to running jobs, optionally pinning every slot's processes to its own set of CPUs.
+
+    Every job takes a free slot when its process starts and gives it back when
+    the process exits, so a slot never runs two jobs at once. The time every
+    slot spent running jobs is recorded, along with which job ran on it, so
+    per-slot throughput can be compared between pinned and unpinned runs.
+    """
+
+    def __init__(
+        self,
+        slots: int,
+        cpu_sets: Optional[list] = None,
+    ):
+        self._slots = max(1, slots)
+        self._cpu_sets = cpu_sets
+        self._lock = threading.Condition()
+        self._free = list(range(self._slots))
+        self._stats = [{"jobs": 0, "busy": 0.0, "keys": {}} for _ in range(self._slots)]
+        self._started = {}
+        self._next_thread_slot = 0
+        if cpu_sets is not None and not hasattr(os, "sched_setaffinity"):
+            print("This system does not support CPU affinity, processes will not be pinned.")
+            self._cpu_sets = None
+
+    def get_cpu_sets(self) -> Optional[list]:
+        return self._cpu_sets
+
+    def acquire(self, key=None) -> int:
+        """Take a free slot for a job, waiting for one if every slot is busy."""
+        with self._lock:
+            while len(self._free) == 0:
+                self._lock.wait()
+            slot = self._free.pop(0)
+            self._start_job(slot, key)
+            return slot
+
+    def release(self, slot: int):
+        with self._lock:
+            self._finish_job(slot)
+            self._free.append(slot)
+            self._free.sort()
+            self._lock.notify()
+
+    def pin(
+        self,
+        slot: int,
+        pid: int,
+    ):
+        """Pin a job's process to its slot's CPUs, if pinning is enabled."""
+        if self._cpu_sets is not None:
+            pin_process(pid, self._cpu_sets[slot])
+
+    def bind_thread(self):
+        """Give the calling thread pool thread a slot of its own, to be used as a ThreadPoolExecutor initializer.
+
+        The thread itself is pinned to the slot's CPUs, so every process it
+        starts inherits them from the moment it is created.
+        """
+        with self._lock:
+            slot = self._next_thread_slot % self._slots
+            self._next_thread_slot += 1
+            # The slot belongs to this thread for good
+            self._free.remove(slot)
+        _thread_slot.slots = self
+        _thread_slot.slot = slot
+        if self._cpu_sets is not None:
+            os.sched_setaffinity(0, self._cpu_sets[slot])
+
+    def start_thread_job(self, key=None) -> Optional[int]:
+        """Record a job starting on the calling thread's slot from bind_thread, returning the slot."""
+        if getattr(_thread_slot, "slots", None) is not self:
+            return None
+        slot = _thread_slot.slot
+        with self._lock:
+            self._start_job(slot, key)
+        return slot
+
+    def finish_thread_job(self, slot: int):
+        with self._lock:
+            self._finish_job(slot)
+
+    def _start_job(self, slot: int, key):
+        self._started[slot] = (time(), key)
+        self._stats[slot]["jobs"] += 1
+
+    def _finish_job(self, slot: int):
+        started, key = self._started.pop(slot)
+        busy = time() - started
+        self._stats[slot]["busy"] += busy
+        if key is not None:
+            self._stats[slot]["keys"][key] = self._stats[slot]["keys"].get(key, 0.0) + busy
+
+    def get_stats(self, frames: Optional[dict] = None) -> list:
+        """Get the jobs, busy seconds, frames and frames per second of every slot.
+
+        The frames per second only count the time spent on jobs with a known
+        number of frames.
+
+        Args:
+            frames (Optional[dict]): Frames processed by every job, keyed like the keys given to acquire.
+
+        Returns:
+            list: One dict per slot, with its "cpus" as a CPU list, or None when not pinned.
+        """
+        frames = frames or {}
+        stats = []
+        with self._lock:
+            for slot, slot_stats in enumerate(self._stats):
+                counted = [key for key in slot_stats["keys"] if key in frames]
+                slot_frames = sum([frames[key] for key in counted])
+                counted_busy = sum([slot_stats["keys"][key] for key in counted])
+                stats.append(
+                    {
+                        "slot": slot,
+                        "cpus": format_cpu_list(self._cpu_sets[slot]) if self._cpu_sets is not None else None,
+                        "jobs": slot_stats["jobs"],
+                        "busy": slot_stats["busy"],
+                        "frames": slot_frames,
+                        "fps": slot_frames / counted_busy if counted_busy > 0 else 0.0,
+                    }
+                )
+        return stats
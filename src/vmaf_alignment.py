@@ -0,0 +1,175 @@
+import subprocess as sp
+from typing import Optional
+
+import ffmpy
+import numpy as np
+
+# Size of the luma thumbnails every frame is reduced to
+THUMB_WIDTH = 32
+THUMB_HEIGHT = 18
+
+# Average distance between normalized thumbnails above which two frames are
+# considered different content, and the share by which the best offset has
+# to beat every other offset to be trusted
+MATCH_DISTANCE = 0.5
+MATCH_MARGIN = 0.1
+
+# Fewest frames two windows have to overlap by for an offset to be considered
+MIN_OVERLAP = 8
+
+
+def read_thumbnails(
+    ffmpeg: str,
+    file: str,
+    seconds: float,
+    from_end: Optional[bool] = False,
+    fps: Optional[float] = None,
+) -> np.ndarray:
+    """Decode the first or last seconds of a video into tiny luma thumbnails.
+
+    Args:
+        ffmpeg (str): Path to the FFmpeg executable.
+        file (str): Video file to decode.
+        seconds (float): Length of the window to decode.
+        from_end (Optional[bool]): Decode the last seconds instead of the first ones. Defaults to False.
+        fps (Optional[float]): Convert the video to this frame rate first, like the comparison itself does.
+            Defaults to None.
+
+    Returns:
+        np.ndarray: One normalized thumbnail per decoded frame, with a mean of 0 and a standard deviation of 1.
+    """
+    seek = "-sseof -{:.3f}".format(seconds) if from_end else ""
+    vf = "scale={}:{}:flags=area,format=gray".format(THUMB_WIDTH, THUMB_HEIGHT)
+    if fps:
+        vf = "fps={},{}".format(fps, vf)
+    ff = ffmpy.FFmpeg(
+        executable=ffmpeg,
+        global_options=["-hide_banner", "-nostats", "-v", "error"],
+        inputs={str(file): "{} -t {:.3f}".format(seek, seconds).strip()},
+        outputs={"-": "-an -sn -vf {} -f rawvideo".format(vf)},
+    )
+    out = ff.run(stdout=sp.PIPE, stderr=sp.PIPE)[0]
+    size = THUMB_WIDTH * THUMB_HEIGHT
+    frames = np.frombuffer(out[: len(out) // size * size], dtype=np.uint8).reshape(-1, size).astype(np.float32)
+    frames -= frames.mean(axis=1, keepdims=True)
+    frames /= frames.std(axis=1, keepdims=True) + 1.0
+    return frames
+
+
+def find_offset(
+    ref: np.ndarray,
+    enc: np.ndarray,
+    max_offset: int,
+) -> Optional[dict]:
+    """Find the frame offset at which two windows of thumbnails match best.
+
+    An offset of k means frame i + k of the encoded window shows frame i of
+    the reference window.
+
+    Returns:
+        Optional[dict]: The "offset", its average "distance" and whether the match is "confident", or None when
+            the windows are too short to compare.
+    """
+    distances = {}
+    for offset in range(-max_offset, max_offset + 1):
+        start = max(0, -offset)
+        end = min(len(ref), len(enc) - offset)
+        if end - start < min(MIN_OVERLAP, len(ref), len(enc)) or end - start <= 0:
+            continue
+        distances[offset] = float(np.abs(ref[start:end] - enc[start + offset : end + offset]).mean())
+    if len(distances) == 0:
+        return None
+
+    best = min(distances.keys(), key=lambda offset: (distances[offset], abs(offset)))
+    # Static content matches at every offset, so the best one only counts if
+    # offsets away from it match clearly worse
+    others = [distance for offset, distance in distances.items() if abs(offset - best) > 1]
+    confident = distances[best] <= MATCH_DISTANCE and (
+        len(others) == 0 or min(others) - distances[best] > MATCH_MARGIN * max(min(others), 1e-6)
+    )
+    return {"offset": best, "distance": distances[best], "confident": confident}
+
+
+def check_alignment(
+    ffmpeg: str,
+    ref_file: str,
+    enc_file: str,
+    ref_info: dict,
+    enc_info: dict,
+    seconds: Optional[float] = 2.0,
+    max_offset: Optional[int] = 12,
+    ref_thumbnails: Optional[tuple] = None,
+    fps: Optional[float] = None,
+) -> dict:
+    """Compare the first and last seconds of an encoded video against its reference video.
+
+    The offset found at the start tells how many frames the encoded video is
+    ahead of (or behind) the reference. The offset at the end, together with
+    the exact frame counts, tells whether that offset holds for the whole
+    video, or whether frames were dropped or duplicated in between.
+
+    Args:
+        ffmpeg (str): Path to the FFmpeg executable.
+        ref_file (str): Reference video file.
+        enc_file (str): Encoded video file.
+        ref_info (dict): Properties of the reference video from probe_video.
+        enc_info (dict): Properties of the encoded video from probe_video.
+        seconds (Optional[float]): Length of the windows at the start and end. Defaults to 2.0.
+        max_offset (Optional[int]): Largest offset in frames that is looked for. Defaults to 12.
+        ref_thumbnails (Optional[tuple]): Thumbnails of the reference's start and end windows from an earlier call,
+            so they are only decoded once. Defaults to None.
+        fps (Optional[float]): Frame rate the encoded video is converted to for the comparison. Defaults to None.
+
+    Returns:
+        dict: The "verdict" ("aligned", "offset", "drift", "mismatch" or "inconclusive"), the "offset" in frames,
+            the "length_difference" in frames left over after the offset and a readable "message".
+    """
+    if ref_thumbnails is None:
+        ref_thumbnails = (
+            read_thumbnails(ffmpeg, ref_file, seconds),
+            read_thumbnails(ffmpeg, ref_file, seconds, from_end=True),
+        )
+    enc_head = read_thumbnails(ffmpeg, enc_file, seconds, fps=fps)
+    head = find_offset(ref_thumbnails[0], enc_head, max_offset)
+    result = {"verdict": "inconclusive", "offset": 0, "length_difference": None}
+    if head is None:
+        result["message"] = "too few frames to compare"
+        return result
+    if head["distance"] > MATCH_DISTANCE:
+        result["verdict"] = "mismatch"
+        result["message"] = "the start does not match the reference (distance {:.2f})".format(head["distance"])
+        return result
+    if not head["confident"]:
+        result["message"] = "the start is too static to find an offset"
+        return result
+    result["offset"] = head["offset"]
+
+    # Absolute offset at the end, from where the last windows start
+    enc_frames = enc_info.get("frames", 0)
+    if fps and enc_info.get("fps"):
+        enc_frames = int(round(enc_frames * fps / enc_info["fps"]))
+    if ref_info.get("exact_frames") and enc_info.get("exact_frames"):
+        enc_tail = read_thumbnails(ffmpeg, enc_file, seconds, from_end=True, fps=fps)
+        tail = find_offset(ref_thumbnails[1], enc_tail, max_offset + abs(head["offset"]))
+        if tail is not None and tail["confident"]:
+            tail_offset = enc_frames - len(enc_tail) + tail["offset"] - (ref_info["frames"] - len(ref_thumbnails[1]))
+            if tail_offset != head["offset"]:
+                result["verdict"] = "drift"
+                result["message"] = "offset of {} frames at the start but {} frames at the end".format(
+                    head["offset"], tail_offset
+                )
+                return result
+        result["length_difference"] = enc_frames - head["offset"] - ref_info["frames"]
+
+    result["verdict"] = "offset" if head["offset"] != 0 else "aligned"
+    if head["offset"] > 0:
+        result["message"] = "the encoded video has {} extra frames at the start".format(head["offset"])
+    elif head["offset"] < 0:
+        result["message"] = "the encoded video is missing {} frames at the start".format(-head["offset"])
+    else:
+        result["message"] = "aligned"
+    if result["length_difference"]:
+        result["message"] += ", and {} {} frames at the end".format(
+            abs(result["length_difference"]), "extra" if result["length_difference"] > 0 else "missing"
+        )
+    return result
@@ -0,0 +1,143 @@
+import concurrent.futures as cf
+import multiprocessing as mp
+import subprocess as sp
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from time import time
+from typing import Callable, Optional
+
+import ffmpy
+
+
+def autotune_key(
+    width: int,
+    height: int,
+    models: dict,
+    features: list,
+    subsamples: Optional[int] = None,
+) -> str:
+    """Describe a calculation workload, so measurements are only reused for the same kind of calculation."""
+    return "{}x{}|{}|{}|n_subsample={}".format(
+        width,
+        height,
+        ",".join(sorted(models.keys())),
+        ",".join(sorted(features)),
+        subsamples or 1,
+    )
+
+
+def candidate_splits(
+    cpus: Optional[int] = None,
+    max_processes: Optional[int] = 16,
+) -> list:
+    """Create the (processes, n_threads, filter_threads) splits of the CPU threads to try.
+
+    Processes double from 1 up to the number of CPU threads, each getting an
+    equal share of the threads, and every split is tried with both full and
+    halved filter threading.
+    """
+    if cpus is None:
+        cpus = mp.cpu_count()
+    splits = []
+    processes = 1
+    while processes <= min(cpus, max_processes):
+        threads = max(1, cpus // processes)
+        for filter_threads in sorted(set([threads, max(1, threads // 2)]), reverse=True):
+            splits.append((processes, threads, filter_threads))
+        processes *= 2
+    return splits
+
+
+def calibrate(
+    make_ffmpeg: Callable[[int, int, str], ffmpy.FFmpeg],
+    frames: int,
+    splits: list,
+) -> list:
+    """Run a short calibration calculation for every split and measure its throughput.
+
+    Args:
+        make_ffmpeg (Callable[[int, int, str], ffmpy.FFmpeg]): Creates the calibration command from the n_threads,
+            filter_threads and log path to use.
+        frames (int): Number of frames a single calibration calculation processes.
+        splits (list): (processes, n_threads, filter_threads) splits to measure.
+
+    Returns:
+        list: Dicts with the split and its measured frames per second across all processes, in the order tried.
+    """
+    results = []
+    with tempfile.TemporaryDirectory(prefix="vmaf_autotune_") as tmp_dir:
+        for processes, threads, filter_threads in splits:
+            ffs = []
+            for i in range(processes):
+                log_path = str(Path(tmp_dir).joinpath("calibration_{}.log".format(i))).replace("\\", "/")
+                ffs.append(make_ffmpeg(threads, filter_threads, log_path))
+
+            msg = "Calibrating {} process(es) with {} threads and {} filter threads..."
+            print(msg.format(processes, threads, filter_threads))
+
+            start = time()
+            with cf.ThreadPoolExecutor(max_workers=processes) as pool:
+                tasks = [pool.submit(ff.run, stdout=sp.PIPE, stderr=sp.PIPE) for ff in ffs]
+                try:
+                    for task in cf.as_completed(tasks):
+                        task.result()
+                except ffmpy.FFRuntimeError as ffre:
+                    print("\tCalibration failed: {}".format(ffre))
+                    continue
+            elapsed = time() - start
+
+            fps = processes * frames / elapsed if elapsed > 0 else 0.0
+            print("\t{:.2f} frames per second".format(fps))
+            results.append(
+                {
+                    "processes": processes,
+                    "threads": threads,
+                    "filter_threads": filter_threads,
+                    "fps": fps,
+                }
+            )
+    return results
+
+
+def autotune(
+    history,
+    key: str,
+    make_ffmpeg: Callable[[int, int, str], ffmpy.FFmpeg],
+    frames: int,
+    cpus: Optional[int] = None,
+) -> Optional[dict]:
+    """Find the split of processes and threads with the best throughput for a workload.
+
+    A split that was already measured for the same workload on this host is
+    reused as-is, otherwise every candidate split is calibrated and the best one
+    is saved to the history for later runs.
+
+    Args:
+        history (VMAF_History): Persistent measurements of this host.
+        key (str): Workload description from autotune_key.
+        make_ffmpeg (Callable[[int, int, str], ffmpy.FFmpeg]): Creates the calibration command, see calibrate.
+        frames (int): Number of frames a single calibration calculation processes.
+        cpus (Optional[int]): Number of CPU threads to split. Defaults to all of them.
+
+    Returns:
+        Optional[dict]: The chosen "processes", "threads" and "filter_threads", or None if calibration failed.
+    """
+    saved = history.get("autotune", key)
+    if saved is not None:
+        msg = "Using saved autotune result for {} on {}: {} process(es), {} threads, {} filter threads."
+        print(msg.format(key, history.get_host(), saved["processes"], saved["threads"], saved["filter_threads"]))
+        return saved
+
+    results = calibrate(make_ffmpeg, frames, candidate_splits(cpus))
+    if len(results) == 0:
+        return None
+
+    best = max(results, key=lambda result: result["fps"])
+    best["date"] = datetime.now().isoformat(timespec="seconds")
+    best["results"] = results
+    history.set("autotune", key, best)
+
+    msg = "Autotune picked {} process(es), {} threads and {} filter threads at {:.2f} frames per second.\n"
+    print(msg.format(best["processes"], best["threads"], best["filter_threads"], best["fps"]))
+    return best
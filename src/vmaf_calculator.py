@@ -1,20 +1,76 @@
 import concurrent.futures as cf
 import multiprocessing as mp
 import os
+import signal
 import subprocess as sp
 import sys
 from argparse import RawTextHelpFormatter
+from copy import copy
 from datetime import timedelta
-from json import dump, load
+from json import dumps, load
 from pathlib import Path
-from time import time
+from time import sleep, time
 from traceback import print_exc
 
 import ffmpy
 from gooey import Gooey, GooeyParser
-from tqdm import tqdm
 
-from vmaf_common import bytes2human, print_dict, search_handler
+from vmaf_accounting import add_usage, format_usage
+from vmaf_admission import VMAF_Admission, estimate_memory, memory_key
+from vmaf_affinity import VMAF_CPU_Slots, format_cpu_list, plan_cpu_sets, read_numa_nodes
+from vmaf_alignment import check_alignment, read_thumbnails
+from vmaf_autotune import autotune, autotune_key
+from vmaf_checkpoint import (
+    check_checkpoints,
+    checkpoint_path,
+    checkpointed_frames,
+    finish_checkpoints,
+    remove_stale_checkpoints,
+    resume_segment,
+    save_checkpoint,
+)
+from vmaf_clip_batcher import clip_batch_size, estimate_overhead, group_clips, record_job_time
+from vmaf_common import (
+    ENCODED_EXTS,
+    REFERENCE_EXTS,
+    bytes2human,
+    escape_filter_value,
+    find_by_exts,
+    get_available_memory,
+    print_dict,
+    search_handler,
+)
+from vmaf_distributed import VMAF_Coordinator, VMAF_Worker
+from vmaf_frame_store import PIPE_FORMAT, STORE_FORMAT, VMAF_Log_Stream, VMAF_Streamed_Future, pipe_path
+from vmaf_history import VMAF_History
+from vmaf_job_engine import KILL_GRACE, VMAF_Job_Engine, VMAF_Job_Timeout, run_blocking
+from vmaf_job_store import VMAF_Job_Store, VMAF_Json_State, VMAF_Read_Only_State, read_completions
+from vmaf_log_merger import merge_logs, read_frames, read_pooled
+from vmaf_media_index import VMAF_Media_Index
+from vmaf_normalize import apply_offset, format_normalization, plan_normalization
+from vmaf_planner import fit_deadline, predict_plan, predict_rate, record_throughput
+from vmaf_probe import get_ffprobe
+from vmaf_progress import VMAF_Progress, VMAF_Progress_Display
+from vmaf_race import RACE_SEGMENTS, VMAF_Race, spread_order
+from vmaf_result_cache import VMAF_Result_Cache, cache_key, fingerprint
+from vmaf_sampler import ESTIMATE_PERCENTILES, estimate_scores, plan_samples
+from vmaf_scheduler import estimate_cost, estimate_makespan, order_jobs
+from vmaf_segmenter import detect_scene_changes, plan_segments, segment_input_options
+from vmaf_speculation import STRAGGLER_RATIO, VMAF_Speculator, speculative_job
+from vmaf_watcher import VMAF_Folder_Watcher
+
+# Every VMAF model that can be calculated, with the name used for it in the
+# log files
+VMAF_MODELS = {
+    "vmaf_v0.6.1": "vmaf",
+    "vmaf_v0.6.1neg": "vmaf_neg",
+    "vmaf_4k_v0.6.1": "vmaf_4k",
+}
+
+# Rough memory used by every encoded video in a batch, in bytes per pixel of
+# the reference resolution. This covers the decoder's frame pool, the 12-bit
+# 4:4:4 colorspace conversion and the frames queued up in front of libvmaf.
+BATCH_BYTES_PER_PIXEL = 128
 
 
 @Gooey(
@@ -43,6 +99,17 @@ def parse_arguments(curdir):
 
     ffmpeg_args = parser.add_argument_group("FFmpeg arguments")
     threading_args = parser.add_argument_group("Multithreading arguments")
+    segment_args = parser.add_argument_group("Segmentation arguments")
+
+    distributed_args = parser.add_argument_group("Distributed arguments")
+
+    race_args = parser.add_argument_group("Racing arguments")
+
+    estimate_args = parser.add_argument_group("Estimation arguments")
+
+    watch_args = parser.add_argument_group("Watch arguments")
+
+    plan_args = parser.add_argument_group("Planning arguments")
 
     vmaf_args = parser.add_argument_group("VMAF arguments")
 
@@ -56,28 +123,49 @@ def parse_arguments(curdir):
         widget="CheckBox",
     )
 
+    checkpoint_help = "Disable checkpoints.\n"
+    checkpoint_help += (
+        "A calculation that is cancelled or fails keeps the frames it already calculated as a checkpoint, "
+    )
+    checkpoint_help += (
+        "and continuing it later only calculates the rest of its frames, starting right after the last one it kept.\n"
+    )
+    checkpoint_help += 'With "Subsamples", a checkpoint ends right before a sampled frame, so the continued calculation samples the same frames.\n'
+    checkpoint_help += "The checkpoints are merged into a single log once the calculation is finished."
+    main_args.add_argument(
+        "--No_Checkpoints",
+        action="store_true",
+        help=checkpoint_help,
+        widget="CheckBox",
+    )
+
+    state_help = (
+        "Specify where the state of every calculation is saved, so unfinished calculations can be continued later.\n"
+    )
+    state_help += '"sqlite" saves every calculation as a row of the "vmaf_jobs.sqlite" database next to the reference video file, which several calculator instances can share safely.\n'
+    state_help += 'Existing "<reference>_completions.json" files are imported into the database automatically.\n'
+    state_help += '"json" rewrites the "<reference>_completions.json" file on every change, and is only safe for one calculator instance per reference video file.'
+    main_args.add_argument(
+        "--State",
+        choices=["sqlite", "json"],
+        default="sqlite",
+        help=state_help,
+    )
+
     reference_help = "Reference video file(s).\n"
-    reference_help += 'The program expects a single "reference" file.'
+    reference_help += 'The program expects a single "reference" file, or a directory of them.\n'
+    reference_help += 'Every reference video file in a directory is compared against the encoded video files in the subdirectory of the "Encoded" directory with the same name as the reference video file, and all of them share the same processes.\n'
+    reference_help += "The chooser picks a directory, and the path of a single reference video file can be typed in instead."
     file_args.add_argument(
         "-Reference",
         type=str,
-        required=True,
         help=reference_help,
-        widget="FileChooser",
+        widget="DirChooser",
         gooey_options={
-            "wildcard": "".join(
-                [
-                    "MP4 files (*.mp4)|*.mp4|",
-                    "MKV files (*.mkv)|*.mkv|",
-                    "WEBM files (*.webm)|*.webm|",
-                    "AVI files (*.avi)|*.avi|",
-                    "All files (*.*)|*.*",
-                ]
-            ),
             "default_dir": str(curdir),
             "validator": {
-                "test": "Path(r).exists() and Path(r).is_file() for r in user_input",
-                "message": "Must include at least one existing file.",
+                "test": "Path(r).exists() for r in user_input",
+                "message": "Must include at least one existing file or directory.",
             },
         },
     )
@@ -100,6 +188,17 @@ def parse_arguments(curdir):
         },
     )
 
+    manifest_help = 'JSON file mapping reference video files to the directories of their encoded video files, instead of the "Reference" and "Encoded" arguments.\n'
+    manifest_help += "Relative paths are relative to the manifest. All pairs share the same processes, and every reference video file gets its own results folder and saved state."
+    file_args.add_argument(
+        "--Manifest",
+        type=str,
+        default="",
+        help=manifest_help,
+        widget="FileChooser",
+        gooey_options={"wildcard": "JSON files (*.json)|*.json"},
+    )
+
     ffmpeg_help = "Specify the path to the FFmpeg executable.\n"
     ffmpeg_help = 'Default is "ffmpeg" which assumes that FFmpeg is part of your "Path" environment variable.\n'
     ffmpeg_help += 'The path must either point to the executable itself, or to the directory that contains the executable named "ffmpeg".'
@@ -129,7 +228,8 @@ def parse_arguments(curdir):
 
     threads_help = 'Specify number of threads to be used for each process (Default is 0 for "autodetect").\n'
     threads_help += "A single VMAF process will effectively max out at 12 threads - any more will provide little to no performance increase.\n"
-    threads_help += "The recommended value of threads to use per process is 4-6."
+    threads_help += "The recommended value of threads to use per process is 4-6.\n"
+    threads_help += 'The "Autotune" argument can measure the best value for your system instead.'
     threading_args.add_argument(
         "--Threads",
         type=int,
@@ -156,6 +256,316 @@ def parse_arguments(curdir):
         },
     )
 
+    engine_help = "Specify how the FFmpeg processes are run.\n"
+    engine_help += '"asyncio" runs every process from a single thread and streams their output as it arrives.\n'
+    engine_help += '"threads" blocks one thread per running process until it exits.'
+    threading_args.add_argument(
+        "--Engine",
+        choices=["asyncio", "threads"],
+        default="asyncio",
+        help=engine_help,
+    )
+
+    schedule_help = "Specify the order the calculations are started in.\n"
+    schedule_help += '"Longest" estimates the cost of every calculation from its frames, resolution, models and features, and starts the most expensive ones first so no long calculation is left running alone at the end.\n'
+    schedule_help += '"Encoded" keeps every segment of an encoded video together, finishing all of its calculations before moving on to the next encoded video, ordered from most to least expensive.\n'
+    schedule_help += '"Submission" starts the calculations in the order the encoded videos were found.'
+    threading_args.add_argument(
+        "--Schedule",
+        choices=["Longest", "Encoded", "Submission"],
+        default="Longest",
+        help=schedule_help,
+    )
+
+    timeout_help = "Specify the number of seconds a single FFmpeg process may run before it is killed.\n"
+    timeout_help += "Only the calculation that ran into the timeout is stopped, and it is continued from its checkpoint on the next run.\n"
+    timeout_help += 'A value of 0 disables the timeout. Only used by the "asyncio" engine.'
+    threading_args.add_argument(
+        "--Timeout",
+        type=int,
+        default=0,
+        help=timeout_help,
+        widget="IntegerField",
+        gooey_options={"min": 0, "max": 604800},
+    )
+
+    speculate_help = "Start a second copy of every calculation that runs far slower than its estimated cost promises, like on a busy or throttled CPU, once the last calculations leave processes idle.\n"
+    speculate_help += 'Whichever copy finishes first is kept and the other one is stopped. The time spent on the copies is reported at the end. Can not be combined with "Coordinator".'
+    threading_args.add_argument(
+        "--Speculate",
+        action="store_true",
+        help=speculate_help,
+        widget="CheckBox",
+    )
+
+    straggler_ratio_help = 'Specify the share of its expected throughput a calculation has to fall below to get a second copy with "Speculate".'
+    threading_args.add_argument(
+        "--Straggler_Ratio",
+        type=float,
+        default=STRAGGLER_RATIO,
+        help=straggler_ratio_help,
+        widget="DecimalField",
+        gooey_options={"min": 0.05, "max": 0.95},
+    )
+
+    filter_threads_help = (
+        "Specify number of threads FFmpeg uses for the filters of each process, like the colorspace conversion.\n"
+    )
+    filter_threads_help += 'A value of 0 uses the same value as the "Threads" argument.'
+    threading_args.add_argument(
+        "--Filter_Threads",
+        type=int,
+        default=0,
+        help=filter_threads_help,
+        widget="Slider",
+        gooey_options={
+            "min": 0,
+            "max": mp.cpu_count(),
+        },
+    )
+
+    autotune_help = "Run short calibration calculations before the main calculations to find the number of processes and threads with the best throughput.\n"
+    autotune_help += 'The calibration uses a few seconds of the actual reference video with the chosen VMAF models and features, and overrides the "Processes", "Threads" and "Filter_Threads" arguments.\n'
+    autotune_help += (
+        "The result is saved for this computer, resolution and set of models, so later runs skip the calibration."
+    )
+    threading_args.add_argument(
+        "--Autotune",
+        action="store_true",
+        help=autotune_help,
+        widget="CheckBox",
+    )
+
+    autotune_seconds_help = "Specify how many seconds of the reference video every calibration calculation uses."
+    threading_args.add_argument(
+        "--Autotune_Seconds",
+        type=float,
+        default=3.0,
+        help=autotune_seconds_help,
+        widget="DecimalField",
+        gooey_options={"min": 0.5, "max": 60.0},
+    )
+
+    batch_help = (
+        "Specify the maximum number of encoded videos to compare against a single decode of the reference video.\n"
+    )
+    batch_help += "Each batch runs as one FFmpeg process that decodes the reference video once and splits it between one VMAF calculation per encoded video.\n"
+    batch_help += "This saves decoding the reference video over and over, at the cost of more memory per process.\n"
+    batch_help += "A value of 1 disables batching."
+    threading_args.add_argument(
+        "--Batch_Size",
+        type=int,
+        default=1,
+        help=batch_help,
+        widget="IntegerField",
+        gooey_options={"min": 1, "max": 64},
+    )
+
+    batch_mem_help = (
+        "Specify the memory budget in MiB for every process when batching, which can lower the batch size.\n"
+    )
+    batch_mem_help += "A value of 0 splits the currently available system memory between all processes."
+    threading_args.add_argument(
+        "--Batch_Memory",
+        type=int,
+        default=0,
+        help=batch_mem_help,
+        widget="IntegerField",
+        gooey_options={"min": 0, "max": 1048576},
+    )
+
+    clip_batch_help = "Specify the maximum number of short reference and encoded video pairs to calculate in a single FFmpeg process.\n"
+    clip_batch_help += "Starting FFmpeg, opening the video files and loading the VMAF models takes about as long as calculating a clip of a few seconds, "
+    clip_batch_help += "so pairs of different reference video files with the same resolution are calculated side by side in one process, each still writing its own log file.\n"
+    clip_batch_help += 'The number of pairs per process adapts to the overhead per process measured in earlier runs, and is limited by the memory budget of the "Batch_Memory" argument.\n'
+    clip_batch_help += "A value of 1 disables clip batching."
+    threading_args.add_argument(
+        "--Clip_Batch",
+        type=int,
+        default=1,
+        help=clip_batch_help,
+        widget="IntegerField",
+        gooey_options={"min": 1, "max": 256},
+    )
+
+    clip_seconds_help = (
+        "Specify how many seconds long a reference and encoded video pair may be to be batched with other pairs."
+    )
+    threading_args.add_argument(
+        "--Clip_Seconds",
+        type=float,
+        default=30.0,
+        help=clip_seconds_help,
+        widget="DecimalField",
+        gooey_options={"min": 1.0, "max": 600.0},
+    )
+
+    admission_help = "Only start another FFmpeg process once the system has the memory and CPU time to run it.\n"
+    admission_help += "The memory every process needs is estimated from the resolution, pixel format, VMAF models and features, and replaced by the peak memory measured for the same kind of process in earlier runs.\n"
+    admission_help += 'The "Processes" argument becomes the most processes that may run at the same time. Not used with a coordinator.'
+    threading_args.add_argument(
+        "--Admission",
+        action="store_true",
+        help=admission_help,
+        widget="CheckBox",
+    )
+
+    memory_limit_help = "Specify the memory budget in MiB of all processes together when using admission control.\n"
+    memory_limit_help += "A value of 0 only keeps the processes within the currently available system memory."
+    threading_args.add_argument(
+        "--Memory_Limit",
+        type=int,
+        default=0,
+        help=memory_limit_help,
+        widget="IntegerField",
+        gooey_options={"min": 0, "max": 16777216},
+    )
+
+    load_limit_help = "Specify the share of CPU time above which admission control does not start another process.\n"
+    load_limit_help += "A value of 0 disables the CPU check."
+    threading_args.add_argument(
+        "--Load_Limit",
+        type=float,
+        default=0.9,
+        help=load_limit_help,
+        widget="DecimalField",
+        gooey_options={"min": 0.0, "max": 1.0, "increment": 0.05},
+    )
+
+    pin_help = 'Pin every one of the "Processes" worker slots to its own set of CPUs, and print the throughput of every slot at the end.\n'
+    pin_help += "The CPUs of every NUMA node are split between the slots on it, so no process spans two nodes. Not used with a coordinator."
+    threading_args.add_argument(
+        "--Pin_CPUs",
+        action="store_true",
+        help=pin_help,
+        widget="CheckBox",
+    )
+
+    coordinator_help = "Listen on this HOST:PORT address for workers and hand the calculations out to them instead of running them locally.\n"
+    coordinator_help += 'Workers need to reach the reference and encoded video files under the same paths, or map them with their "Path_Map" argument.\n'
+    coordinator_help += "Leave empty to run every calculation on this computer."
+    distributed_args.add_argument(
+        "--Coordinator",
+        type=str,
+        default="",
+        help=coordinator_help,
+    )
+
+    worker_help = (
+        "Run as a worker for the coordinator at this HOST:PORT address instead of calculating anything by itself.\n"
+    )
+    worker_help += 'Every worker runs as many calculations at the same time as the "Processes" argument, using its own "FFmpeg" executable.\n'
+    worker_help += "The reference and encoded video file arguments are not needed for workers."
+    distributed_args.add_argument(
+        "--Worker",
+        type=str,
+        default="",
+        help=worker_help,
+    )
+
+    heartbeat_help = "Specify the number of seconds a worker may go without sending a heartbeat before the coordinator gives its calculations to another worker."
+    distributed_args.add_argument(
+        "--Heartbeat_Timeout",
+        type=float,
+        default=30.0,
+        help=heartbeat_help,
+        widget="DecimalField",
+        gooey_options={"min": 5.0, "max": 3600.0},
+    )
+
+    path_map_help = (
+        "Map the coordinator's file paths to the paths of the same files on this worker, as FROM=TO pairs.\n"
+    )
+    path_map_help += 'For example "/mnt/videos=D:/videos".'
+    distributed_args.add_argument(
+        "--Path_Map",
+        type=str,
+        nargs="*",
+        default=[],
+        help=path_map_help,
+    )
+
+    cache_help = "Disable the result cache.\n"
+    cache_help += "The cache keeps a copy of every finished log file, identified by the contents of the reference and encoded video files and the exact VMAF settings.\n"
+    cache_help += "Calculations matching a cached result are finished instantly, even if the video files were renamed or moved, and encoded video files with identical contents are only calculated once."
+    main_args.add_argument(
+        "--No_Cache",
+        action="store_true",
+        help=cache_help,
+        widget="CheckBox",
+    )
+
+    cache_dir_help = (
+        'Specify the directory of the result cache. Defaults to a "vmaf_cache" directory in the current directory.'
+    )
+    main_args.add_argument(
+        "--Cache_Dir",
+        type=str,
+        default="",
+        help=cache_dir_help,
+        widget="DirChooser",
+    )
+
+    alignment_help = "Disable the alignment check.\n"
+    alignment_help += "The check compares tiny thumbnails of the first and last seconds of every encoded video file against the reference video before calculating anything.\n"
+    alignment_help += "Encoded video files that start a few frames early or late are shifted to line up, and ones with dropped or duplicated frames, or different content, are rejected."
+    main_args.add_argument(
+        "--No_Alignment_Check",
+        action="store_true",
+        help=alignment_help,
+        widget="CheckBox",
+    )
+
+    alignment_seconds_help = (
+        "Specify how many seconds at the start and end of every video file the alignment check compares."
+    )
+    main_args.add_argument(
+        "--Alignment_Seconds",
+        type=float,
+        default=2.0,
+        help=alignment_seconds_help,
+        widget="DecimalField",
+        gooey_options={"min": 0.5, "max": 60.0, "increment": 0.5},
+    )
+
+    alignment_offset_help = "Specify the largest offset in frames between an encoded video file and the reference video that the alignment check looks for."
+    main_args.add_argument(
+        "--Alignment_Max_Offset",
+        type=int,
+        default=12,
+        help=alignment_offset_help,
+        widget="IntegerField",
+        gooey_options={"min": 1, "max": 600},
+    )
+
+    segments_help = "Split every reference and encoded video pair into this many time segments, and calculate each segment as its own process.\n"
+    segments_help += (
+        "The per-frame logs of all segments are merged back into a single log once every segment is finished.\n"
+    )
+    segments_help += "This lets a single long video use more threads than one VMAF process can scale to.\n"
+    segments_help += "A value of -1 picks enough segments to keep all processes busy, and 0 disables segmenting."
+    segment_args.add_argument(
+        "--Segments",
+        type=int,
+        default=0,
+        help=segments_help,
+        widget="IntegerField",
+        gooey_options={"min": -1, "max": 256},
+    )
+
+    scene_help = "Specify the scene change threshold used to place segment boundaries at scene cuts.\n"
+    scene_help += (
+        "Lower values detect more scene changes. A value of 0 disables scene detection and splits segments evenly."
+    )
+    segment_args.add_argument(
+        "--Scene_Threshold",
+        type=float,
+        default=0.3,
+        help=scene_help,
+        widget="DecimalField",
+        gooey_options={"min": 0.0, "max": 1.0, "increment": 0.05},
+    )
+
     # rem_threads_help = "Specify whether or not to use remaining threads that don't make a complete process to use for an process.\n"
     # rem_threads_help += "For example, if your system has 16 threads, and you are running 5 processes with 3 threads each, then you will be using 4 * 3 threads, which is 12.\n"
     # rem_threads_help += "This means you will have 1 thread that will remain unused.\n"
@@ -163,6 +573,17 @@ def parse_arguments(curdir):
     # rem_threads_help += "This option is not recommended, as the unused threads will be used to keep the system responsive during the VMAF calculations."
     # threading_args.add_argument("-u", "--use-rem-threads", dest="use_remaining_threads", action="store_true", default=False, help=rem_threads_help, widget="CheckBox",)
 
+    models_help = "Specify the VMAF models to calculate.\n"
+    models_help += 'The first one is used for the "Two_Stage" screening and for racing.'
+    vmaf_args.add_argument(
+        "--Models",
+        nargs="+",
+        choices=list(VMAF_MODELS.keys()),
+        default=list(VMAF_MODELS.keys()),
+        help=models_help,
+        widget="Listbox",
+    )
+
     ssim_help = "Enable calculating SSIM values."
     vmaf_args.add_argument(
         "--SSIM",
@@ -193,11 +614,219 @@ def parse_arguments(curdir):
     subsamples_help += 'This variable corresponds to VMAF\'s "n_subsample" variable.'
     vmaf_args.add_argument(
         "--Subsamples",
+        type=int,
         help=subsamples_help,
         widget="IntegerField",
         gooey_options={"min": 1, "max": 60},
     )
 
+    two_stage_help = "Calculate in two stages to save time on large encoder sweeps.\n"
+    two_stage_help += 'The first stage screens every encoded video file with only the first VMAF model, sampling once every "Screen_Subsamples" frames.\n'
+    two_stage_help += "The second stage calculates every VMAF model and feature on every frame, but only for the finalists of the first stage.\n"
+    two_stage_help += "Both stages' scores are written to the aggregate log files."
+    vmaf_args.add_argument(
+        "--Two_Stage",
+        action="store_true",
+        help=two_stage_help,
+        widget="CheckBox",
+    )
+
+    screen_subsamples_help = 'Specify the "n_subsample" value used by the first stage of the "Two_Stage" mode.'
+    vmaf_args.add_argument(
+        "--Screen_Subsamples",
+        type=int,
+        default=10,
+        help=screen_subsamples_help,
+        widget="IntegerField",
+        gooey_options={"min": 1, "max": 120},
+    )
+
+    screen_margin_help = "Encoded video files whose first stage VMAF score is at most this far below the best first stage score are finalists."
+    vmaf_args.add_argument(
+        "--Screen_Margin",
+        type=float,
+        default=3.0,
+        help=screen_margin_help,
+        widget="DecimalField",
+        gooey_options={"min": 0.0, "max": 100.0},
+    )
+
+    screen_target_help = "Encoded video files whose first stage VMAF score reaches this target are finalists as well.\n"
+    screen_target_help += "A value of 0 disables the target."
+    vmaf_args.add_argument(
+        "--Screen_Target",
+        type=float,
+        default=0.0,
+        help=screen_target_help,
+        widget="DecimalField",
+        gooey_options={"min": 0.0, "max": 100.0},
+    )
+
+    race_help = "Race the encoded video files against each other and stop the calculations of the ones that can no longer win.\n"
+    race_help += "Every encoded video file is split into segments, and every finished segment narrows down the confidence interval of its VMAF score.\n"
+    race_help += 'Encoded video files that can neither reach the "Race_Top" best scores nor the "Race_Target" score are stopped early and marked as RACED, which later runs with racing keep.\n'
+    race_help += 'Enables at least {} segments if the "Segments" argument asks for fewer.'.format(RACE_SEGMENTS)
+    race_args.add_argument(
+        "--Race",
+        action="store_true",
+        help=race_help,
+        widget="CheckBox",
+    )
+
+    race_top_help = "Specify how many of the best encoded video files have to be calculated in full.\n"
+    race_top_help += 'A value of 0 only keeps the encoded video files that can reach the "Race_Target" score.'
+    race_args.add_argument(
+        "--Race_Top",
+        type=int,
+        default=1,
+        help=race_top_help,
+        widget="IntegerField",
+        gooey_options={"min": 0, "max": 1000},
+    )
+
+    race_target_help = "Encoded video files that can still reach this VMAF score are always calculated in full.\n"
+    race_target_help += "A value of 0 disables the target."
+    race_args.add_argument(
+        "--Race_Target",
+        type=float,
+        default=0.0,
+        help=race_target_help,
+        widget="DecimalField",
+        gooey_options={"min": 0.0, "max": 100.0},
+    )
+
+    race_confidence_help = "Specify the confidence level of the VMAF score intervals used to stop encoded video files."
+    race_args.add_argument(
+        "--Race_Confidence",
+        type=float,
+        default=0.95,
+        help=race_confidence_help,
+        widget="DecimalField",
+        gooey_options={"min": 0.5, "max": 0.9999, "increment": 0.01},
+    )
+
+    race_min_help = "Specify how many segments of an encoded video file have to be finished before it can be stopped.\n"
+    race_min_help += "The intervals of only a few segments follow Student's t distribution, and are much wider than with more segments."
+    race_args.add_argument(
+        "--Race_Min_Segments",
+        type=int,
+        default=2,
+        help=race_min_help,
+        widget="IntegerField",
+        gooey_options={"min": 2, "max": 256},
+    )
+
+    estimate_help = "Estimate the VMAF scores from short samples instead of calculating every frame.\n"
+    estimate_help += 'The timeline is split into "Estimate_Samples" parts at scene changes, and one sample of "Estimate_Seconds" is picked from each part.\n'
+    estimate_help += "Only the samples are decoded, by seeking both videos to the keyframe before every sample.\n"
+    estimate_help += "The estimated mean and percentiles of every VMAF model are written to the aggregate log files with their confidence bounds, and the encoded video files are not moved."
+    estimate_args.add_argument(
+        "--Estimate",
+        action="store_true",
+        help=estimate_help,
+        widget="CheckBox",
+    )
+
+    estimate_samples_help = "Specify the number of samples used to estimate the VMAF scores."
+    estimate_args.add_argument(
+        "--Estimate_Samples",
+        type=int,
+        default=12,
+        help=estimate_samples_help,
+        widget="IntegerField",
+        gooey_options={"min": 2, "max": 256},
+    )
+
+    estimate_seconds_help = "Specify the length of every sample in seconds."
+    estimate_args.add_argument(
+        "--Estimate_Seconds",
+        type=float,
+        default=2.0,
+        help=estimate_seconds_help,
+        widget="DecimalField",
+        gooey_options={"min": 0.5, "max": 60.0},
+    )
+
+    estimate_confidence_help = "Specify the confidence level of the bounds of the estimated VMAF scores."
+    estimate_args.add_argument(
+        "--Estimate_Confidence",
+        type=float,
+        default=0.95,
+        help=estimate_confidence_help,
+        widget="DecimalField",
+        gooey_options={"min": 0.5, "max": 0.9999, "increment": 0.01},
+    )
+
+    watch_help = 'Keep running after the calculations are done, and calculate every new encoded video file that appears in the "Encoded" directory.\n'
+    watch_help += "New files are only picked up once they are completely written, and their results are written to the aggregate log files and appended to the vmaf_results.jsonl file in the logs directory as soon as each one finishes.\n"
+    watch_help += (
+        "Runs until stopped with Ctrl+C, which cancels the running calculations so they can be continued later."
+    )
+    watch_args.add_argument(
+        "--Watch",
+        action="store_true",
+        help=watch_help,
+        widget="CheckBox",
+    )
+
+    watch_settle_help = (
+        "Specify how many seconds a new file's size has to stay the same before it is considered completely written.\n"
+    )
+    watch_settle_help += "Files that their writer closed or moved into the directory are picked up after a second."
+    watch_args.add_argument(
+        "--Watch_Settle",
+        type=float,
+        default=5.0,
+        help=watch_settle_help,
+        widget="DecimalField",
+        gooey_options={"min": 1.0, "max": 3600.0},
+    )
+
+    watch_polling_help = (
+        "Look for new files by scanning the directory instead of being notified of them by the operating system.\n"
+    )
+    watch_polling_help += "Needed for network shares written to by other computers, which the notifications do not cover. Always used outside of Linux."
+    watch_args.add_argument(
+        "--Watch_Polling",
+        action="store_true",
+        help=watch_polling_help,
+        widget="CheckBox",
+    )
+
+    watch_interval_help = "Specify the number of seconds between scans of the directory when polling."
+    watch_args.add_argument(
+        "--Watch_Interval",
+        type=float,
+        default=10.0,
+        help=watch_interval_help,
+        widget="DecimalField",
+        gooey_options={"min": 0.5, "max": 3600.0},
+    )
+
+    plan_help = "Plan the calculations instead of running them.\n"
+    plan_help += "Prints the exact FFmpeg command of every calculation, and predicts the total runtime and peak memory from the throughput measured by earlier runs and autotune calibrations on this computer.\n"
+    plan_help += (
+        "Nothing is calculated, moved or saved, and scene changes are not detected, so segments are split evenly."
+    )
+    plan_args.add_argument(
+        "--Plan",
+        action="store_true",
+        help=plan_help,
+        widget="CheckBox",
+    )
+
+    deadline_help = "Specify the number of minutes the calculations may take when planning.\n"
+    deadline_help += 'The plan then suggests the most accurate mix of "Subsamples", "Models", extra features and "Processes" that finishes in time within the memory budget, using the fewest processes.\n'
+    deadline_help += "A value of 0 disables the deadline."
+    plan_args.add_argument(
+        "--Deadline",
+        type=float,
+        default=0.0,
+        help=deadline_help,
+        widget="DecimalField",
+        gooey_options={"min": 0.0, "max": 525600.0},
+    )
+
     # model_help = "Specify the VMAF model files to use. This argument expects a list of model files to use.\n"
     # model_help += "The program will calculate the VMAF scores for every encoded file, for every model given.\n"
     # model_help += "Note that VMAF models come in JSON format, and the program will only accept those models."
@@ -209,10 +838,13 @@ def parse_arguments(curdir):
     #     widget="MultiFileChooser",
     # )
 
-    log_format_help = "Specify the VMAF log file format."
+    log_format_help = "Specify the VMAF log file format.\n"
+    log_format_help += 'With "{}", libvmaf writes its log into a named pipe instead of a file, '.format(STORE_FORMAT)
+    log_format_help += "and every frame is stored in a compact binary frame store as it arrives, "
+    log_format_help += "so no large text logs are written and the logs are never parsed again afterwards."
     vmaf_args.add_argument(
         "--Log_Format",
-        choices=["xml", "csv", "json"],
+        choices=["xml", "csv", "json", STORE_FORMAT],
         default="xml",
         help=log_format_help,
     )
@@ -225,6 +857,41 @@ def parse_arguments(curdir):
     )
 
     args = parser.parse_args()
+    if not args.Worker and not args.Reference and not args.Manifest:
+        parser.error('the "-Reference" argument is required unless running as a worker or with a "Manifest"')
+    if args.Manifest or (args.Reference and Path(args.Reference).is_dir()):
+        # Both only follow the encoded video files of a single reference video
+        # file
+        for mode in ["Race", "Watch"]:
+            if getattr(args, mode):
+                parser.error('"{}" needs a single reference video file'.format(mode))
+    if args.Race and args.Race_Top <= 0 and args.Race_Target <= 0:
+        parser.error('racing needs a "Race_Top" or "Race_Target" value above 0')
+    if args.Watch:
+        if not args.Encoded or not Path(args.Encoded).is_dir():
+            parser.error('watching needs an "Encoded" directory')
+        # These modes handle the encoded video files found at the start as a
+        # whole, so files found later could never be part of them
+        for mode in ["Two_Stage", "Race", "Estimate"]:
+            if getattr(args, mode):
+                parser.error('watching can not be combined with "{}"'.format(mode))
+    if args.Plan:
+        # Their calculations depend on the results of earlier calculations,
+        # or never end
+        for mode in ["Two_Stage", "Estimate", "Watch", "Worker"]:
+            if getattr(args, mode):
+                parser.error('planning can not be combined with "{}"'.format(mode))
+    if args.Log_Format == STORE_FORMAT:
+        if not hasattr(os, "mkfifo"):
+            parser.error('the "{}" log format needs named pipes, which this platform lacks'.format(STORE_FORMAT))
+        if args.Coordinator:
+            # Workers send finished log files back, while frame stores are
+            # filled by a reader running next to FFmpeg
+            parser.error('the "{}" log format can not be combined with "Coordinator"'.format(STORE_FORMAT))
+    if args.Speculate and args.Coordinator:
+        # A copy has to be stopped before the log files of the copy that won
+        # can take its place, which only works for local processes
+        parser.error('"Speculate" can not be combined with "Coordinator"')
 
     print("\n")
     for arg in dir(args):
@@ -241,68 +908,2226 @@ def parse_arguments(curdir):
     return args
 
 
-def read_completions(ref):
-    """Read through completions JSON file to see what calculations were already complete.
+def build_vmaf_filter(
+    models,
+    log_format,
+    log_path,
+    features=None,
+    subsamples=None,
+    threads=0,
+):
+    """Create the libvmaf filter for the given models, features and log location.
+
+    A frame store gets its log through the named pipe next to it, see
+    VMAF_Log_Stream.
 
     Args:
-        ref (_type_): _description_
+        models (dict): VMAF model versions as keys and the names to use for them in the log as values.
+        log_format (str): VMAF log file format.
+        log_path (str): Location of the VMAF log file.
+        features (list, optional): Extra libvmaf features to calculate, like "float_ssim". Defaults to None.
+        subsamples (int, optional): libvmaf's "n_subsample" value. Defaults to None.
+        threads (int, optional): libvmaf's "n_threads" value, where 0 lets libvmaf decide. Defaults to 0.
 
     Returns:
-        _type_: _description_
+        str: The libvmaf filter.
     """
-    ref_path = Path(ref)
-    completions_file = Path(ref_path.parent.joinpath("{}_completions.json".format(ref_path.stem)))
-    if completions_file.exists():
-        with open(str(completions_file), "r") as reader:
-            return load(reader)
-    else:
-        return {}
+    tmp_models = []
+    for model, name in models.items():
+        tmp_models.append("version={}\\:name={}".format(model, name))
+    tmp_filter = "libvmaf=model='{}'".format("|".join(tmp_models))
+
+    if features:
+        tmp_filter += ":feature='{}'".format("|".join(["name={}".format(feature) for feature in features]))
+    if subsamples:
+        tmp_filter += ":n_subsample={}".format(subsamples)
+    if threads:
+        tmp_filter += ":n_threads={}".format(threads)
+
+    if log_format == STORE_FORMAT:
+        log_format = PIPE_FORMAT
+        log_path = pipe_path(log_path) if log_path else log_path
+    tmp_filter += ":log_fmt={}:log_path='{}'".format(log_format, escape_filter_value(log_path))
+    return tmp_filter
+
+
+def build_filter_graph(
+    vmaf_filter,
+    normalization=None,
+):
+    """Create the filter graph comparing the encoded video (input 0) against the reference video (input 1).
+
+    Args:
+        vmaf_filter (str): The libvmaf filter, from build_vmaf_filter.
+        normalization (dict, optional): Filters making the encoded video match the reference video, from
+            plan_normalization. Defaults to None, which uses the fixed BT.709 conversion.
+
+    Returns:
+        str: The filter graph.
+    """
+    normalization = normalization or plan_normalization(None, None)
+    graph = []
+    labels = []
+    for label, chain, name in [("0:v:0", normalization["cmp"], "cmp"), ("1:v:0", normalization["ref"], "ref")]:
+        # Inputs that need no filters go into libvmaf directly
+        if chain == "":
+            labels.append("[{}]".format(label))
+        else:
+            graph.append("[{}]{}[{}]".format(label, chain, name))
+            labels.append("[{}]".format(name))
+    graph.append("".join(labels) + vmaf_filter)
+    return ";".join(graph)
 
 
-def write_state(
-    ref,
-    completions,
+def build_batch_filter_graph(
+    vmaf_filters,
+    normalizations=None,
 ):
-    ref_path = Path(ref)
-    completions_file = Path(ref_path.parent.joinpath("{}_completions.json".format(ref_path.stem)))
-    with open(str(completions_file), "w") as writer:
-        dump(
-            completions,
-            writer,
-            indent=4,
-            sort_keys=True,
-        )
+    """Create a filter graph comparing several encoded videos (inputs 1 to N) against the reference video (input 0).
 
+    The reference video is only decoded once and then split into one copy for
+    every libvmaf filter, each of which writes its own log file.
 
-def main():
-    curdir = None
-    if getattr(sys, "frozen", False):
-        curdir = Path(sys.executable).parent
-    elif __file__:
-        curdir = Path(os.getcwd())
+    Args:
+        vmaf_filters (list): The libvmaf filter of every encoded video, from build_vmaf_filter.
+        normalizations (list, optional): Filters making every encoded video match the reference video, from
+            plan_normalization. Defaults to None, which uses the fixed BT.709 conversion.
 
-    # Parse command line arguments
-    args = parse_arguments(curdir)
-    models = {
-        "vmaf_v0.6.1": "vmaf",
-        "vmaf_v0.6.1neg": "vmaf_neg",
-        "vmaf_4k_v0.6.1": "vmaf_4k",
-    }
+    Returns:
+        str: The filter graph.
+    """
+    count = len(vmaf_filters)
+    normalizations = [
+        normalization or plan_normalization(None, None) for normalization in normalizations or [None] * count
+    ]
+    # Every plan resets the reference's timestamps in the same way, if at all
+    ref_chain = [normalization["ref"] for normalization in normalizations if normalization["ref"] != ""]
+    ref_chain = ref_chain[0] + "," if len(ref_chain) > 0 else ""
+    graph = ["[0:v:0]{}split={}{}".format(ref_chain, count, "".join(["[ref{}]".format(i) for i in range(count)]))]
+    for i, (vmaf_filter, normalization) in enumerate(zip(vmaf_filters, normalizations)):
+        if normalization["cmp"] == "":
+            graph.append("[{0}:v:0][ref{1}]{2}".format(i + 1, i, vmaf_filter))
+        else:
+            graph.append("[{}:v:0]{}[cmp{}]".format(i + 1, normalization["cmp"], i))
+            graph.append("[cmp{0}][ref{0}]{1}".format(i, vmaf_filter))
+    return ";".join(graph)
 
-    # Create main input/output dictionary
-    io = {}
 
-    # Make sure the reference video file exists
-    try:
-        search_handler(args.Reference)
-    except OSError as ose:
-        print(ose)
-        exit(1)
+def build_clip_batch_filter_graph(clips):
+    """Create a filter graph comparing several reference videos against their own encoded videos in one process.
 
-    # Load the completions file for the given reference video file, if it exists
+    A reference video compared against several encoded videos is split like
+    in build_batch_filter_graph, and every libvmaf filter still writes its own
+    log file.
+
+    Args:
+        clips (list): The input index of every reference video, with the input index, libvmaf filter and
+            normalization of every encoded video compared against it, as (reference, [(encoded, vmaf_filter,
+            normalization), ...]) pairs.
+
+    Returns:
+        str: The filter graph.
+    """
+    graph = []
+    for i, (ref_input, pairs) in enumerate(clips):
+        normalizations = [normalization or plan_normalization(None, None) for _, _, normalization in pairs]
+        ref_chain = [normalization["ref"] for normalization in normalizations if normalization["ref"] != ""]
+        ref_chain = ref_chain[0] if len(ref_chain) > 0 else ""
+        ref_labels = ["[{}:v:0]".format(ref_input)]
+        if len(pairs) > 1:
+            ref_labels = ["[ref{}_{}]".format(i, j) for j in range(len(pairs))]
+            split = "{}split={}{}".format(ref_chain + "," if ref_chain != "" else "", len(pairs), "".join(ref_labels))
+            graph.append("[{}:v:0]{}".format(ref_input, split))
+        elif ref_chain != "":
+            ref_labels = ["[ref{}_0]".format(i)]
+            graph.append("[{}:v:0]{}{}".format(ref_input, ref_chain, ref_labels[0]))
+        for j, ((enc_input, vmaf_filter, _), normalization) in enumerate(zip(pairs, normalizations)):
+            cmp_label = "[{}:v:0]".format(enc_input)
+            if normalization["cmp"] != "":
+                graph.append("{}{}[cmp{}_{}]".format(cmp_label, normalization["cmp"], i, j))
+                cmp_label = "[cmp{}_{}]".format(i, j)
+            graph.append(cmp_label + ref_labels[j] + vmaf_filter)
+    return ";".join(graph)
+
+
+def get_batch_budget(args):
+    """Find the memory budget of a single process when batching, or None if it is unknown."""
+    budget = args.Batch_Memory * 1024 * 1024
+    if budget <= 0:
+        available = get_available_memory()
+        if available is None:
+            return None
+        budget = available // max(1, args.Processes)
+    return budget
+
+
+def get_batch_size(
+    args,
+    ref_info,
+):
+    """Find how many encoded videos a single FFmpeg process can compare against one decode of the reference video.
+
+    Every extra encoded video in a batch needs its own decoder, colorspace
+    conversion and frame queue, so the batch size is limited by how many of
+    those fit into the memory budget of a single process.
+    """
+    if args.Batch_Size <= 1:
+        return 1
+
+    budget = get_batch_budget(args)
+    if budget is None:
+        return args.Batch_Size
+
+    branch = ref_info["width"] * ref_info["height"] * BATCH_BYTES_PER_PIXEL
+    if branch <= 0:
+        return args.Batch_Size
+
+    batch_size = max(1, min(args.Batch_Size, budget // branch))
+    if batch_size < args.Batch_Size:
+        msg = "Limiting batches to {} encoded videos to stay within {} of memory per process.\n"
+        print(msg.format(batch_size, bytes2human(budget)))
+    return batch_size
+
+
+def create_ffmpeg(
+    args,
+    files,
+    graph,
+    decode,
+    input_opts="",
+    threads=None,
+    filter_threads=None,
+):
+    """Create the ffmpy.FFmpeg class running a single filter graph over the given video files.
+
+    Args:
+        args (_type_): GooeyParser.parser() arguments
+        files (list): Video files, in the same order as the inputs used by the filter graph.
+        graph (str): Filter graph to run, from build_filter_graph or build_batch_filter_graph.
+        decode (str): Input options used to decode every video file.
+        input_opts (Union[str, dict], optional): Extra input options for every video file, like seeking, or a dict
+            with the extra input options of every video file. Defaults to "".
+        threads (int, optional): Overrides the "Threads" argument. Defaults to None.
+        filter_threads (int, optional): Overrides the "Filter_Threads" argument. Defaults to None.
+
+    Returns:
+        ffmpy.FFmpeg: The FFmpeg command.
+    """
+    if threads is None:
+        threads = args.Threads
+    if filter_threads is None:
+        filter_threads = args.Filter_Threads or threads
+
+    # Progress is reported as key=value blocks on stdout instead of the status
+    # line on stderr, so it can be parsed while the process runs
+    global_opts = ["-hide_banner", "-nostats", "-progress", "pipe:1"]
+    if filter_threads != 0:
+        global_opts += ["-filter_threads", str(filter_threads), "-filter_complex_threads", str(filter_threads)]
+    return ffmpy.FFmpeg(
+        executable=args.FFmpeg,
+        global_options=global_opts,
+        inputs={
+            file: " ".join([decode, input_opts.get(file, "") if isinstance(input_opts, dict) else input_opts]).strip()
+            for file in files
+        },
+        outputs={"-": ["-filter_complex", graph, "-f", "null"]},
+    )
+
+
+def create_job_ffmpeg(
+    args,
+    job,
+    normalizations,
+    models,
+    features,
+    decode,
+):
+    """Create the ffmpy.FFmpeg class calculating every part of a job from create_jobs or batch_clips.
+
+    Args:
+        args (_type_): GooeyParser.parser() arguments
+        job (dict): The job to calculate.
+        normalizations (dict): Normalization plan of every encoded video file. The clips of a clip batch use the
+            normalization plans of their own reference video files instead.
+        models (dict): VMAF models used.
+        features (list): Extra libvmaf features calculated.
+        decode (str): Input options used to decode every video file.
+
+    Returns:
+        ffmpy.FFmpeg: The FFmpeg command.
+    """
+    vmaf_filters = [
+        build_vmaf_filter(
+            models,
+            args.Log_Format,
+            part["log_path"],
+            features=features,
+            subsamples=args.Subsamples,
+            threads=args.Threads,
+        )
+        for part in job["parts"]
+    ]
+    if "clips" in job:
+        # Every clip's reference video is followed by its encoded videos
+        files = []
+        clips = []
+        filters = iter(vmaf_filters)
+        for clip in job["clips"]:
+            ref_input = len(files)
+            files.append(clip["reference"])
+            pairs = []
+            for part in clip["parts"]:
+                pairs.append((len(files), next(filters), clip["ctx"]["normalizations"][part["enc"]]))
+                files.append(part["enc"])
+            clips.append((ref_input, pairs))
+        graph = build_clip_batch_filter_graph(clips)
+    elif len(job["parts"]) == 1:
+        files = [job["parts"][0]["enc"], job["reference"]]
+        graph = build_filter_graph(vmaf_filters[0], normalizations[job["parts"][0]["enc"]])
+    else:
+        files = [job["reference"]] + [part["enc"] for part in job["parts"]]
+        graph = build_batch_filter_graph(vmaf_filters, [normalizations[part["enc"]] for part in job["parts"]])
+    return create_ffmpeg(args, files, graph, decode, job["input_opts"])
+
+
+def parse_scores(
+    err,
+    models,
+):
+    """Read the pooled VMAF score of every model from FFmpeg's stderr output.
+
+    libvmaf prints one "VMAF score" line per model, in the same order the
+    models were given to the filter.
+    """
+    scores = {}
+    model_names = list(models.keys())
+    for line in err.decode("utf-8", errors="replace").split("\n"):
+        if "VMAF score" in line and len(scores) < len(model_names):
+            vmaf_score = float(line.split("]")[1].split(": ")[1].strip())
+            scores[model_names[len(scores)]] = vmaf_score
+    return scores
+
+
+def schedule_jobs(
+    args,
+    jobs,
+    models,
+    features,
+    media_index,
+):
+    """Estimate the cost of every job and put them in the order they should be started in.
+
+    The cost of every part is estimated from the encoded video's own
+    resolution and frame count from the media index, falling back to the
+    reference video's when it cannot be probed. Jobs of different reference
+    video files are ordered together.
+    """
+    enc_infos = {}
+    for job in jobs:
+        job["cost"] = 0.0
+        ref_info = media_index.get(job["reference"])
+        for part in job["parts"]:
+            enc = part["enc"]
+            if enc not in enc_infos:
+                try:
+                    enc_infos[enc] = media_index.get(enc)
+                except (OSError, ValueError, ffmpy.FFRuntimeError):
+                    enc_infos[enc] = ref_info
+            info = enc_infos[enc]
+            frames = job["frames"]
+            if part["segment"] is None and info["frames"] > 0:
+                frames = min(frames, info["frames"]) if frames > 0 else info["frames"]
+            job["cost"] += estimate_cost(
+                frames,
+                max(info["width"], ref_info["width"]),
+                max(info["height"], ref_info["height"]),
+                len(models),
+                features,
+                args.Subsamples,
+            )
+
+    if args.Schedule == "Longest":
+        ordered = order_jobs(jobs, lambda job: job["cost"])
+    elif args.Schedule == "Encoded":
+        ordered = order_jobs(jobs, lambda job: job["cost"], group=lambda job: job["parts"][0]["enc"])
+    else:
+        ordered = list(jobs)
+
+    if len(ordered) > 0:
+        busiest, average = estimate_makespan([job["cost"] for job in ordered], args.Processes)
+        msg = "Scheduled {} calculations in {} order, the busiest process gets {:.1f}% more work than average.\n"
+        print(msg.format(len(ordered), args.Schedule.lower(), (busiest / average - 1) * 100 if average > 0 else 0.0))
+    return ordered
+
+
+def job_clips(job):
+    """Get the clips of a job from batch_clips, where any other job is a single clip."""
+    return job.get("clips", [job])
+
+
+def batch_clips(
+    args,
+    jobs,
+    models,
+    features,
+    history,
+):
+    """Combine the jobs of short reference and encoded video pairs into clip batches, each run by one FFmpeg process.
+
+    Only jobs calculating whole pairs no longer than the "Clip_Seconds"
+    argument are combined, and only with jobs whose reference video has the
+    same resolution. The number of clips per process is the fewest that keep
+    the overhead measured per process below OVERHEAD_TARGET of its wall time,
+    but never so many that fewer batches than processes are left, or that
+    the batch exceeds the memory budget.
+
+    Args:
+        args (_type_): GooeyParser.parser() arguments
+        jobs (list): Jobs from schedule_jobs, with their estimated cost.
+        models (dict): VMAF models used.
+        features (list): Extra libvmaf features calculated.
+        history (VMAF_History): Persistent measurements of this host.
+
+    Returns:
+        list: The jobs, with every clip batch as one job holding its jobs as "clips", in dispatch order.
+    """
+    groups = {}
+    batched = []
+    for job in jobs:
+        ref_info = job["ctx"]["ref_info"]
+        # Segments and shifted or resumed pairs seek into their video files
+        if job["input_opts"] != "" or job["parts"][0]["segment"] is not None or ref_info["fps"] <= 0:
+            batched.append(job)
+        elif job["frames"] <= 0 or job["frames"] / ref_info["fps"] > args.Clip_Seconds:
+            batched.append(job)
+        else:
+            groups.setdefault((ref_info["width"], ref_info["height"]), []).append(job)
+
+    budget = get_batch_budget(args)
+    for (width, height), clips in groups.items():
+        # Every clip decodes its reference video on top of its encoded videos
+        limit = min(args.Clip_Batch, -(-len(clips) // max(1, args.Processes)))
+        if budget is not None and width * height > 0:
+            limit = min(limit, max(1, budget // (2 * width * height * BATCH_BYTES_PER_PIXEL)))
+        key = autotune_key(width, height, models, features, args.Subsamples)
+        overhead = estimate_overhead(history, key, args.Processes)
+        costs = sorted([clip["cost"] for clip in clips])
+        size = clip_batch_size(overhead, costs[len(costs) // 2], limit)
+        if size <= 1:
+            batched.extend(clips)
+            continue
+
+        clip_groups = group_clips(
+            clips, size, lambda clip: set([clip["reference"]] + [part["enc"] for part in clip["parts"]])
+        )
+        if len(clip_groups) < len(clips):
+            msg = "Batching {} short calculations of {}x{} into {} processes of up to {} clips, "
+            msg = msg.format(len(clips), width, height, len(clip_groups), size)
+            if overhead is None:
+                msg += "since no overhead per process was measured on this computer yet.\n"
+            else:
+                msg += "for {:.2f} seconds of overhead per process.\n".format(overhead[0])
+            print(msg)
+
+        for group in clip_groups:
+            if len(group) == 1:
+                batched.extend(group)
+                continue
+            batched.append(
+                {
+                    "clips": group,
+                    "parts": [part for clip in group for part in clip["parts"]],
+                    "input_opts": "",
+                    "frames": max([clip["frames"] for clip in group]),
+                    "cost": sum([clip["cost"] for clip in group]),
+                    "ctx": group[0]["ctx"],
+                }
+            )
+
+    if args.Schedule == "Longest":
+        return order_jobs(batched, lambda job: job["cost"])
+    elif args.Schedule == "Encoded":
+        return order_jobs(batched, lambda job: job["cost"], group=lambda job: job["parts"][0]["enc"])
+    return batched
+
+
+def create_engine(
+    args,
+    cpu_slots=None,
+):
+    """Create what runs the FFmpeg processes: a job engine or coordinator, or a thread pool.
+
+    Local processes take one of the worker slots of cpu_slots while they run.
+
+    Returns:
+        tuple: The engine (or None) and the thread pool (or None).
+    """
+    # The asyncio engine runs every FFmpeg process from a single event loop
+    # thread, while the thread pool blocks one thread per running process. A
+    # coordinator hands every FFmpeg process to a remote worker instead.
+    if args.Coordinator:
+        return VMAF_Coordinator(args.Coordinator, args.Heartbeat_Timeout), None
+    elif args.Engine == "asyncio":
+        return VMAF_Job_Engine(args.Processes, cpu_slots=cpu_slots), None
+    elif cpu_slots is not None:
+        # Every thread keeps the same slot, so its processes inherit the
+        # slot's CPUs when they start
+        return None, cf.ThreadPoolExecutor(max_workers=args.Processes, initializer=cpu_slots.bind_thread)
+    else:
+        return None, cf.ThreadPoolExecutor(max_workers=args.Processes)
+
+
+def create_ticket(
+    admission,
+    ref_info,
+    models,
+    features,
+    branches=1,
+):
+    """Create the admission ticket of a job comparing "branches" encoded videos, or None without admission control."""
+    if admission is None:
+        return None
+    job = (ref_info["width"], ref_info["height"], ref_info["pix_fmt"])
+    return admission.ticket(
+        estimate_memory(*job, len(models), features, branches),
+        memory_key(*job, models, features, branches),
+    )
+
+
+def submit_ffmpeg(
+    args,
+    engine,
+    cf_handler,
+    ff,
+    log_paths,
+    on_stdout=None,
+    ticket=None,
+    cpu_slots=None,
+    key=None,
+    usage=None,
+):
+    """Submit an FFmpeg command to the engine or thread pool from create_engine.
+
+    The key identifies the job in the statistics of cpu_slots, and the usage
+    dict is filled with the process's resource usage once it exits. With the
+    frame store log format, the logs are read from their named pipes while
+    the command runs.
+
+    Returns:
+        cf.Future: Resolves to the command's (stdout, stderr) bytes.
+    """
+    if args.Coordinator:
+        # Workers write the logs locally and send them back
+        return engine.submit(ff._cmd, timeout=args.Timeout or None, on_stdout=on_stdout, logs=log_paths, usage=usage)
+
+    streams = []
+    if args.Log_Format == STORE_FORMAT:
+        # The pipes have to exist before FFmpeg opens them
+        streams = [VMAF_Log_Stream(log_path) for log_path in log_paths]
+    if engine is not None:
+        task = engine.submit(
+            ff._cmd, timeout=args.Timeout or None, on_stdout=on_stdout, ticket=ticket, key=key, usage=usage
+        )
+    else:
+        task = cf_handler.submit(
+            run_blocking, ff, on_stdout=on_stdout, ticket=ticket, cpu_slots=cpu_slots, key=key, usage=usage
+        )
+    if len(streams) > 0:
+        return VMAF_Streamed_Future(task, streams, KILL_GRACE)
+    return task
+
+
+def shutdown_engine(
+    engine,
+    cf_handler,
+    cancel=False,
+):
+    if engine is not None:
+        # Cancelling the engine's jobs kills their whole process groups
+        engine.shutdown(cancel=cancel)
+    elif cancel:
+        cf_handler.shutdown(wait=False, cancel_futures=True)
+    else:
+        cf_handler.shutdown()
+
+
+def print_slot_stats(
+    cpu_slots,
+    progress,
+    job_ids,
+):
+    """Print the jobs, busy time and throughput of every worker slot, and of all of them together."""
+    frames = {}
+    for job_id in job_ids:
+        job = progress.get_job(job_id)
+        if job is not None:
+            frames[job_id] = job["frame"]
+
+    stats = cpu_slots.get_stats(frames)
+    print("Worker slots:")
+    for slot in stats:
+        print(
+            "\tSlot {} ({}): {} jobs, {} frames in {}, {:.2f} FPS".format(
+                slot["slot"],
+                "CPUs " + slot["cpus"] if slot["cpus"] is not None else "unpinned",
+                slot["jobs"],
+                slot["frames"],
+                timedelta(seconds=round(slot["busy"])),
+                slot["fps"],
+            )
+        )
+    total_frames = sum([slot["frames"] for slot in stats])
+    print(
+        "\tAll slots: {} frames at an average of {:.2f} FPS per slot\n".format(
+            total_frames, sum([slot["fps"] for slot in stats]) / len(stats)
+        )
+    )
+
+
+def cancel_ffmpeg(
+    engine,
+    task,
+    ff,
+):
+    """Stop a single FFmpeg command from submit_ffmpeg, whether it is still queued or already running."""
+    if engine is not None:
+        # The engine kills the job's whole process group, and the coordinator
+        # tells its worker to kill it
+        engine.cancel(task)
+    elif not task.cancel() and ff.process is not None:
+        ff.process.kill()
+
+
+def is_timed_out(task):
+    """Whether a finished task's FFmpeg command was killed for running longer than the "Timeout" argument."""
+    return not task.cancelled() and isinstance(task.exception(), VMAF_Job_Timeout)
+
+
+def stop_parts(
+    args,
+    info,
+    status,
+    keep=True,
+    settle=0.0,
+):
+    """Mark every unfinished encoded video file of a stopped job with the given status.
+
+    The frames the job's logs already hold are kept as checkpoints of the
+    encoded video files or their segments, unless keep is False.
+
+    Args:
+        args (argparse.Namespace): Command line arguments.
+        info (dict): The stopped task's entry of the submitted tasks.
+        status (str): Status of the encoded video files, like CANCELLED.
+        keep (bool, optional): Keep the logs as checkpoints instead of deleting them. Defaults to True.
+        settle (float, optional): Seconds to give the stopped process to finish writing its logs. Defaults to 0.0.
+    """
+    for part in info["parts"]:
+        io = part["ctx"]["io"]
+        enc = part["enc"]
+        seg_idx = part["segment"]
+        if io[enc]["status"] in ["DONE", "MOVED", "RACED"]:
+            continue
+        # Segments that already finished keep their logs, so they do not have
+        # to be calculated again on the next run
+        if seg_idx is not None and io[enc]["segments"][seg_idx]["status"] == "DONE":
+            continue
+        unit = io[enc] if seg_idx is None else io[enc]["segments"][seg_idx]
+        # A job that timed out was already stopped
+        if unit["status"] == "TIMED OUT":
+            continue
+        kept = 0
+        if keep:
+            sleep(settle)
+            if not args.No_Checkpoints:
+                frames = [clip["frames"] for clip in job_clips(info["job"]) if part in clip["parts"]][0]
+                kept = save_checkpoint(unit, part["log_path"], args.Log_Format, frames or None, args.Subsamples)
+        if kept > 0:
+            msg = "\tKeeping the {} frames calculated so far as a checkpoint:\n\t{}..."
+            print(msg.format(kept, Path(unit["checkpoints"][-1]["log_path"])))
+        else:
+            print("\tDeleting related log file:\n\t{}...".format(Path(part["log_path"])))
+            Path(part["log_path"]).unlink(missing_ok=True)
+        io[enc]["status"] = status
+        if seg_idx is not None:
+            io[enc]["segments"][seg_idx]["status"] = status
+
+
+def stop_timed_out(
+    args,
+    task,
+    info,
+    progress,
+    keep=True,
+):
+    """Mark the encoded video files of a job that ran into the "Timeout" argument as TIMED OUT, and save their state.
+
+    Only this job is stopped, every other job keeps running. The encoded video
+    files are calculated again on the next run, continuing from the
+    checkpoints of this job unless keep is False.
+    """
+    progress.remove_job(info["id"])
+    if isinstance(task, VMAF_Streamed_Future):
+        task.wait_closed()
+    label = ", ".join([Path(part["enc"]).stem for part in info["parts"]])
+    msg = "Calculating {} took longer than the timeout of {} seconds and was stopped, the other calculations keep running."
+    print(msg.format(label, args.Timeout))
+    stop_parts(args, info, "TIMED OUT", keep=keep)
+
+    saved = {}
+    for part in info["parts"]:
+        saved.setdefault(id(part["ctx"]), (part["ctx"], set()))[1].add(part["enc"])
+    for ctx, encs in saved.values():
+        ctx["state"].save(ctx["io"], encs)
+
+
+def read_race_scores(
+    log_path,
+    log_format,
+    name,
+):
+    """Read the per-frame scores of the raced VMAF model from a finished segment log."""
+    return [metrics[name] for _, metrics in read_frames(log_path, log_format)[1] if name in metrics]
+
+
+def stop_race_losers(
+    race,
+    io,
+    aggregate,
+    models,
+    my_ffs,
+    pending,
+    engine,
+    progress,
+    duplicate_of,
+):
+    """Mark every encoded video file that can no longer win the race as RACED, and stop the calculations it still has.
+
+    Jobs are only stopped once every encoded video file they calculate has
+    lost, so a batch keeps running for the ones that can still win.
+
+    Args:
+        race (VMAF_Race): The race between the encoded video files.
+        io (dict): Main input/output dictionary.
+        aggregate (dict): Aggregate statistics for every encoded video file.
+        models (dict): VMAF models used, the first one is raced on.
+        my_ffs (dict): Submitted tasks and their jobs.
+        pending (set): Tasks that have not finished yet.
+        engine: Job engine or coordinator from create_engine.
+        progress (VMAF_Progress): Live progress of every job.
+        duplicate_of (dict): The first encoded video file with the same contents for every duplicate.
+
+    Returns:
+        tuple: The stopped tasks, every encoded video file marked as RACED and the segment logs they leave behind.
+    """
+    raced = []
+    logs = []
+    for enc in race.find_losers():
+        race.eliminate(enc)
+        estimate = race.get_estimate(enc)
+        logs.extend([seg["log_path"] for seg in io[enc].get("segments", [])])
+        for loser in [enc] + [dup for dup, first in duplicate_of.items() if first == enc]:
+            io[loser]["race"] = dict(estimate, model=list(models.keys())[0])
+            finish_raced(io, aggregate, loser)
+            raced.append(loser)
+        msg = "Stopping {}, its estimated score of {:.3f} (at most {:.3f}) can no longer win the race."
+        print(msg.format(enc, estimate["mean"], estimate["high"]))
+
+    stopped = set()
+    for task in pending:
+        if all([io[part["enc"]]["status"] == "RACED" for part in my_ffs[task]["parts"]]):
+            cancel_ffmpeg(engine, task, my_ffs[task]["ff"])
+            progress.remove_job(my_ffs[task]["id"])
+            stopped.add(task)
+    return stopped, raced, logs
+
+
+def stop_speculation(
+    speculator,
+    task,
+    my_ffs,
+    engine,
+    progress,
+):
+    """Settle a straggling job and its speculative duplicate once one of them finished.
+
+    A copy that failed is dropped, and leaves the other copy running. Once a
+    copy finished, the other one is stopped and waited for until it can no
+    longer write to its log files. When the duplicate won, its log files take
+    the place of the original's and it takes over the original's job and
+    parts. Only when both copies failed does the finished task fail as usual.
+
+    Args:
+        speculator (VMAF_Speculator): Pairs of stragglers and their duplicates.
+        task (cf.Future): Task of the job that finished.
+        my_ffs (dict): Submitted tasks and their jobs.
+        engine: Job engine from create_engine, or None for a thread pool.
+        progress (VMAF_Progress): Live progress of every job.
+
+    Returns:
+        tuple: The task that lost or failed, and whether the finished task should be handled as finished.
+    """
+    partner = speculator.partner(task)
+    duplicate = task if speculator.is_duplicate(task) else partner
+    label = ", ".join([Path(part["enc"]).stem for part in my_ffs[task]["parts"]])
+    if task.exception() is not None and not speculator.has_failed(partner):
+        speculator.fail(task)
+        progress.remove_job(my_ffs[task]["id"])
+        # Whatever the failed copy logged is replaced by the other copy's logs
+        for part in my_ffs[task]["parts"]:
+            Path(part["log_path"]).unlink(missing_ok=True)
+        if task is duplicate:
+            print("The speculative duplicate of {} failed, the original calculation keeps running.\n".format(label))
+        else:
+            print("The calculation of {} failed, its speculative duplicate keeps running.\n".format(label))
+        return task, False
+
+    loser = partner
+    if not speculator.has_failed(loser):
+        cancel_ffmpeg(engine, loser, my_ffs[loser]["ff"])
+        # A job that never started has no process to wait for
+        if (progress.get_job(my_ffs[loser]["id"]) or {}).get("started") is not None:
+            cf.wait([loser], timeout=KILL_GRACE + 1)
+            deadline = time() + KILL_GRACE + 1
+            while not my_ffs[loser]["usage"] and time() < deadline:
+                sleep(0.05)
+        if isinstance(loser, VMAF_Streamed_Future):
+            loser.wait_closed()
+
+    walls = {}
+    for key in [task, loser]:
+        walls[key] = my_ffs[key]["usage"].get("wall")
+        if walls[key] is None:
+            job_progress = progress.get_job(my_ffs[key]["id"]) or {}
+            walls[key] = time() - job_progress["started"] if job_progress.get("started") is not None else 0.0
+    progress.remove_job(my_ffs[loser]["id"])
+
+    # Both copies failed, so the job fails like any other
+    if task.exception() is not None:
+        speculator.settle(task, walls[duplicate], walls[loser], failed=True)
+        return loser, True
+
+    if loser is duplicate:
+        for part in my_ffs[loser]["parts"]:
+            Path(part["log_path"]).unlink(missing_ok=True)
+    else:
+        for part, dup_part in zip(my_ffs[loser]["parts"], my_ffs[task]["parts"]):
+            if Path(dup_part["log_path"]).exists():
+                os.replace(dup_part["log_path"], part["log_path"])
+        my_ffs[task]["job"] = my_ffs[loser]["job"]
+        my_ffs[task]["parts"] = my_ffs[loser]["parts"]
+
+    if speculator.has_failed(loser):
+        print("The calculation of {} finished after the other copy of it failed.\n".format(label))
+    elif loser is duplicate:
+        print("The calculation of {} finished before its speculative duplicate, which was stopped.\n".format(label))
+    else:
+        print("The speculative duplicate of {} finished first, the original calculation was stopped.\n".format(label))
+    speculator.settle(task, walls[duplicate], walls[loser])
+    return loser, True
+
+
+def pair_input_options(
+    io,
+    enc,
+    reference,
+    segment,
+    fps,
+):
+    """Create the input options limiting an encoded video file and the reference video to the same segment.
+
+    When the alignment check found an offset, the input with extra frames at
+    the start seeks past them.
+
+    Args:
+        io (dict): Main input/output dictionary.
+        enc (str): Encoded video file.
+        reference (str): Reference video file.
+        segment (dict): The "start_frame" and "frames" of the segment, with "frames" set to None for the rest of
+            the video.
+        fps (float): Frame rate of the reference video.
+
+    Returns:
+        dict: The input options of both video files, for create_ffmpeg.
+    """
+    offset = io[enc].get("normalization", {}).get("offset", 0)
+    return {
+        enc: segment_input_options(segment, fps, max(0, offset)),
+        reference: segment_input_options(segment, fps, max(0, -offset)),
+    }
+
+
+def run_alignment_check(
+    args,
+    io,
+    aggregate,
+    ref_info,
+    enc_infos,
+    normalizations,
+):
+    """Check that every unfinished encoded video file lines up with the reference video, and fix or reject it.
+
+    Encoded video files with a constant offset get it recorded in their
+    normalization plan, and ones with dropped or duplicated frames, or with
+    content that does not match the reference, are marked as REJECTED.
+
+    Args:
+        args (_type_): GooeyParser.parser() arguments
+        io (dict): Main input/output dictionary.
+        aggregate (dict): Aggregate statistics for every encoded video file.
+        ref_info (dict): Reference video properties from the media index.
+        enc_infos (dict): Encoded video properties from the media index.
+        normalizations (dict): Normalization plan of every encoded video file, updated with the offsets found.
+    """
+    pending = [
+        enc
+        for enc in io.keys()
+        if io[enc]["status"] not in ["DONE", "MOVED", "RACED", "REJECTED"] and enc in enc_infos and ref_info is not None
+    ]
+    if len(pending) == 0:
+        return
+
+    print("Checking the alignment of {} encoded video files...".format(len(pending)))
+    try:
+        ref_thumbnails = (
+            read_thumbnails(args.FFmpeg, args.Reference, args.Alignment_Seconds),
+            read_thumbnails(args.FFmpeg, args.Reference, args.Alignment_Seconds, from_end=True),
+        )
+    except (OSError, ffmpy.FFRuntimeError) as e:
+        print("Could not check the alignment of the reference video: {}\n".format(e))
+        return
+
+    with cf.ThreadPoolExecutor(max_workers=max(1, args.Processes)) as pool:
+        tasks = {}
+        for enc in pending:
+            # Compare at the frame rate the calculation itself converts to
+            fps = ref_info["fps"] if "fps=" in normalizations[enc]["cmp"] else None
+            task = pool.submit(
+                check_alignment,
+                args.FFmpeg,
+                str(args.Reference),
+                enc,
+                ref_info,
+                enc_infos[enc],
+                args.Alignment_Seconds,
+                args.Alignment_Max_Offset,
+                ref_thumbnails,
+                fps,
+            )
+            tasks[task] = enc
+
+        for task in cf.as_completed(tasks):
+            enc = tasks[task]
+            try:
+                alignment = task.result()
+            except (OSError, ValueError, ffmpy.FFRuntimeError) as e:
+                print("\tCould not check the alignment of {}: {}".format(enc, e))
+                continue
+            io[enc]["alignment"] = alignment
+            print("\t{}: {}".format(Path(enc).name, alignment["message"]))
+            if alignment["verdict"] in ["drift", "mismatch"]:
+                finish_rejected(io, aggregate, enc)
+                continue
+            normalizations[enc] = apply_offset(normalizations[enc], alignment["offset"])
+            io[enc]["normalization"] = normalizations[enc]
+    print()
+
+
+def run_screening(
+    args,
+    io,
+    aggregate,
+    models,
+    ref_info,
+    decode,
+    engine,
+    cf_handler,
+    skip=(),
+    admission=None,
+):
+    """Run the first stage of the "Two_Stage" mode and mark every encoded video file that is not a finalist as SCREENED.
+
+    Every unfinished encoded video file is calculated with only the first VMAF
+    model at "Screen_Subsamples", writing to its own "<stem>.screening" log.
+    Screening results from an earlier run with the same settings are reused.
+
+    Args:
+        args (_type_): GooeyParser.parser() arguments
+        io (dict): Main input/output dictionary.
+        aggregate (dict): Aggregate statistics for every encoded video file.
+        models (dict): VMAF models used, the first one is used for screening.
+        ref_info (dict): Reference video properties from probe_video.
+        decode (str): Input options used to decode every video file.
+        engine: Job engine or coordinator from create_engine.
+        cf_handler: Thread pool from create_engine.
+        skip (Iterable): Encoded video files that are not screened.
+        admission (VMAF_Admission, optional): Admission control of the FFmpeg processes. Defaults to None.
+    """
+    model, name = list(models.items())[0]
+    settings = {"model": model, "n_subsample": args.Screen_Subsamples}
+    progress = VMAF_Progress()
+    tasks = {}
+    for enc in io.keys():
+        if io[enc]["status"] in ["DONE", "MOVED", "RACED", "REJECTED"] or enc in skip:
+            continue
+        screening = io[enc].get("screening", {})
+        if {k: screening.get(k) for k in settings.keys()} == settings and "score" in screening:
+            continue
+
+        log_path = Path(io[enc]["log_path"])
+        log_path = str(log_path.with_name("{}.screening{}".format(Path(enc).stem, log_path.suffix)))
+        vmaf_filter = build_vmaf_filter(
+            {model: name},
+            args.Log_Format,
+            log_path,
+            subsamples=args.Screen_Subsamples,
+            threads=args.Threads,
+        )
+        ff = create_ffmpeg(
+            args,
+            [enc, str(args.Reference)],
+            build_filter_graph(vmaf_filter, io[enc].get("normalization")),
+            decode,
+            pair_input_options(io, enc, str(args.Reference), {"start_frame": 0, "frames": None}, ref_info["fps"]),
+        )
+        progress.add_job(enc, Path(enc).stem, ref_info["frames"])
+        ticket = create_ticket(admission, ref_info, {model: name}, [])
+        usage = {}
+        task = submit_ffmpeg(
+            args, engine, cf_handler, ff, [log_path], on_stdout=progress.callback(enc), ticket=ticket, usage=usage
+        )
+        tasks[task] = (enc, log_path, usage)
+
+    if len(tasks) > 0:
+        msg = "Screening {} encoded video files with {} at n_subsample={}...\n"
+        print(msg.format(len(tasks), model, args.Screen_Subsamples))
+        with VMAF_Progress_Display(progress, desc="Screening encoded videos") as display:
+            pending = set(tasks.keys())
+            while len(pending) > 0:
+                done, pending = cf.wait(pending, timeout=1, return_when=cf.FIRST_COMPLETED)
+                for task in done:
+                    enc, log_path, usage = tasks[task]
+                    # An encoded video file that ran into the timeout is left
+                    # out of both stages, while the others keep screening
+                    if is_timed_out(task):
+                        progress.remove_job(enc)
+                        Path(log_path).unlink(missing_ok=True)
+                        io[enc]["status"] = "TIMED OUT"
+                        msg = "Screening {} took longer than the timeout of {} seconds and was stopped."
+                        print(msg.format(enc, args.Timeout))
+                        continue
+                    err = task.result()[1]
+                    progress.finish_job(enc)
+                    io[enc]["usage"] = add_usage(io[enc].get("usage"), usage)
+                    score = parse_scores(err, {model: name}).get(model)
+                    if score is None:
+                        score = read_pooled(log_path, args.Log_Format)[name]["mean"]
+                    io[enc]["screening"] = dict(settings, log_path=log_path, score=score)
+                display.refresh()
+
+    # Pick the finalists among every encoded video file screened with the
+    # same settings, including ones that already finished the second stage
+    screened = {
+        enc: data["screening"]["score"]
+        for enc, data in io.items()
+        if {k: data.get("screening", {}).get(k) for k in settings.keys()} == settings and "score" in data["screening"]
+    }
+    if len(screened) == 0:
+        return
+    best = max(screened.values())
+    finalists = 0
+    for enc, score in screened.items():
+        if io[enc]["status"] in ["DONE", "MOVED", "RACED"] or enc in skip:
+            continue
+        if score >= best - args.Screen_Margin or (args.Screen_Target > 0 and score >= args.Screen_Target):
+            io[enc]["status"] = "NOT STARTED"
+            finalists += 1
+        else:
+            finish_screened(io, aggregate, enc)
+    msg = "{} of {} encoded video files are finalists, the best screening score is {:.3f}.\n"
+    print(msg.format(finalists, len(screened), best))
+
+
+def run_estimation(
+    args,
+    io,
+    aggregate,
+    models,
+    features,
+    ref_info,
+    decode,
+    engine,
+    cf_handler,
+    duplicate_of=None,
+    admission=None,
+):
+    """Run the "Estimate" mode and mark every estimated encoded video file as ESTIMATED.
+
+    Every unfinished encoded video file is calculated on the same stratified
+    samples of the timeline, with every sample as its own FFmpeg process that
+    seeks both videos to it and writes a "<stem>.est<sample>" log. Estimates
+    from an earlier run with the same settings are reused.
+
+    Args:
+        args (_type_): GooeyParser.parser() arguments
+        io (dict): Main input/output dictionary.
+        aggregate (dict): Aggregate statistics for every encoded video file.
+        models (dict): VMAF models used.
+        features (list): Extra libvmaf features calculated.
+        ref_info (dict): Reference video properties from probe_video.
+        decode (str): Input options used to decode every video file.
+        engine: Job engine or coordinator from create_engine.
+        cf_handler: Thread pool from create_engine.
+        duplicate_of (dict, optional): The first encoded video file with the same contents for every duplicate,
+            which is given the first one's estimate.
+        admission (VMAF_Admission, optional): Admission control of the FFmpeg processes. Defaults to None.
+    """
+    duplicate_of = duplicate_of or {}
+    settings = {
+        "samples": args.Estimate_Samples,
+        "seconds": args.Estimate_Seconds,
+        "scene_threshold": args.Scene_Threshold,
+        "confidence": args.Estimate_Confidence,
+        "n_subsample": args.Subsamples,
+    }
+    pending = [
+        enc
+        for enc in io.keys()
+        if io[enc]["status"] not in ["DONE", "MOVED", "SCREENED", "RACED", "REJECTED", "TIMED OUT"]
+        and enc not in duplicate_of
+    ]
+    todo = [
+        enc
+        for enc in pending
+        if io[enc].get("estimate", {}).get("settings") != settings or "scores" not in io[enc]["estimate"]
+    ]
+
+    timed_out = set()
+    tasks = {}
+    if len(todo) > 0:
+        scenes = []
+        if args.Scene_Threshold > 0:
+            print("Detecting scene changes in {}...".format(args.Reference))
+            scenes = detect_scene_changes(args.FFmpeg, args.Reference, args.Scene_Threshold)
+        samples = plan_samples(
+            ref_info["frames"],
+            ref_info["fps"],
+            args.Estimate_Samples,
+            max(1, int(round(args.Estimate_Seconds * ref_info["fps"]))),
+            scenes,
+        )
+        msg = "Estimating {} encoded video files from {} samples of {} frames...\n"
+        print(msg.format(len(todo), len(samples), samples[0]["frames"]))
+
+        progress = VMAF_Progress()
+        for enc in todo:
+            log_path = Path(io[enc]["log_path"])
+            for i, sample in enumerate(samples):
+                sample_log = str(log_path.with_name("{}.est{:03d}{}".format(Path(enc).stem, i, log_path.suffix)))
+                vmaf_filter = build_vmaf_filter(
+                    models,
+                    args.Log_Format,
+                    sample_log,
+                    features=features,
+                    subsamples=args.Subsamples,
+                    threads=args.Threads,
+                )
+                ff = create_ffmpeg(
+                    args,
+                    [enc, str(args.Reference)],
+                    build_filter_graph(vmaf_filter, io[enc].get("normalization")),
+                    decode,
+                    pair_input_options(io, enc, str(args.Reference), sample, ref_info["fps"]),
+                )
+                progress.add_job((enc, i), "{} (sample {})".format(Path(enc).stem, i), sample["frames"])
+                usage = {}
+                task = submit_ffmpeg(
+                    args,
+                    engine,
+                    cf_handler,
+                    ff,
+                    [sample_log],
+                    on_stdout=progress.callback((enc, i)),
+                    ticket=create_ticket(admission, ref_info, models, features),
+                    usage=usage,
+                )
+                tasks[task] = (enc, i, sample_log, sample["weight"], usage)
+
+        results = {enc: {} for enc in todo}
+        with VMAF_Progress_Display(progress, desc="Estimating encoded videos") as display:
+            pending_tasks = set(tasks.keys())
+            while len(pending_tasks) > 0:
+                done, pending_tasks = cf.wait(pending_tasks, timeout=1, return_when=cf.FIRST_COMPLETED)
+                for task in done:
+                    enc, i, sample_log, weight, usage = tasks[task]
+                    # An encoded video file with a sample that ran into the
+                    # timeout is not estimated, while the others keep going
+                    if enc in timed_out or is_timed_out(task):
+                        progress.remove_job((enc, i))
+                        Path(sample_log).unlink(missing_ok=True)
+                        if enc not in timed_out:
+                            timed_out.add(enc)
+                            io[enc]["status"] = "TIMED OUT"
+                            msg = "Estimating {} took longer than the timeout of {} seconds for sample {} and was stopped."
+                            print(msg.format(enc, args.Timeout, i))
+                        continue
+                    task.result()
+                    progress.finish_job((enc, i))
+                    io[enc]["usage"] = add_usage(io[enc].get("usage"), usage)
+                    results[enc][i] = (weight, read_frames(sample_log, args.Log_Format)[1])
+                    Path(sample_log).unlink(missing_ok=True)
+                display.refresh()
+
+        for enc in todo:
+            if enc in timed_out:
+                continue
+            frames = [results[enc][i] for i in sorted(results[enc].keys())]
+            scores = {}
+            for model, name in models.items():
+                model_samples = [
+                    (weight, [metrics[name] for _, metrics in sample if name in metrics]) for weight, sample in frames
+                ]
+                scores[model] = estimate_scores(model_samples, args.Estimate_Confidence)
+            io[enc]["estimate"] = {
+                "settings": settings,
+                "samples": len(samples),
+                "frames": sum([sample["frames"] for sample in samples]),
+                "scores": scores,
+            }
+
+    for enc in pending:
+        if enc in timed_out:
+            for dup in [dup for dup, first in duplicate_of.items() if first == enc]:
+                io[dup]["status"] = "TIMED OUT"
+            continue
+        finish_estimated(io, aggregate, enc)
+        for dup in [dup for dup, first in duplicate_of.items() if first == enc]:
+            io[dup]["estimate"] = io[enc]["estimate"]
+            finish_estimated(io, aggregate, dup)
+
+
+def run_autotune(
+    args,
+    io,
+    models,
+    features,
+    history,
+    ref_info,
+):
+    """Pick the number of processes and threads with the best throughput for this reference video, and apply them to args.
+
+    The calibration compares a few seconds from the middle of the reference
+    video against the first unfinished encoded video.
+    """
+    pending = [enc for enc in io.keys() if io[enc]["status"] not in ["DONE", "MOVED"]]
+    if len(pending) == 0:
+        return
+
+    seconds = min(args.Autotune_Seconds, ref_info["duration"])
+    frames = max(1, int(round(seconds * ref_info["fps"])))
+    input_opts = "-ss {:.3f} -t {:.3f}".format(max(0.0, (ref_info["duration"] - seconds) / 2), seconds)
+
+    def make_ffmpeg(threads, filter_threads, log_path):
+        # Nothing reads the named pipe of a frame store during calibration
+        vmaf_filter = build_vmaf_filter(
+            models,
+            PIPE_FORMAT if args.Log_Format == STORE_FORMAT else args.Log_Format,
+            log_path,
+            features=features,
+            subsamples=args.Subsamples,
+            threads=threads,
+        )
+        decode = "-threads {0}".format(threads)
+        if args.HWaccel:
+            decode += " -hwaccel auto"
+        return create_ffmpeg(
+            args,
+            [pending[0], str(args.Reference)],
+            build_filter_graph(vmaf_filter, io[pending[0]].get("normalization")),
+            decode,
+            input_opts,
+            threads=threads,
+            filter_threads=filter_threads,
+        )
+
+    key = autotune_key(ref_info["width"], ref_info["height"], models, features, args.Subsamples)
+    best = autotune(history, key, make_ffmpeg, frames)
+    if best is not None:
+        args.Processes = best["processes"]
+        args.Threads = best["threads"]
+        args.Filter_Threads = best["filter_threads"]
+
+
+def run_plan(
+    args,
+    jobs,
+    models,
+    features,
+    decode,
+    history,
+):
+    """Print the FFmpeg command of every job, and predict how long calculating them takes and how much memory it needs.
+
+    With a "Deadline", the most accurate settings that finish in time are
+    suggested as well.
+
+    Args:
+        args (_type_): GooeyParser.parser() arguments
+        jobs (list): Jobs from create_jobs, in the order from schedule_jobs, or clip batches from batch_clips.
+        models (dict): VMAF models used.
+        features (list): Extra libvmaf features calculated.
+        decode (str): Input options used to decode every video file.
+        history (VMAF_History): Persistent measurements of this host.
+    """
+    # Arguments that turn off every extra feature
+    feature_args = {"float_ssim": "--SSIM", "float_ms_ssim": "--MS_SSIM"}
+
+    # The cost of a job is its pixels x frames times a factor of the models,
+    # features and subsampling, which the planner varies
+    factor = estimate_cost(1, 1, 1, len(models), features, args.Subsamples)
+    plan_jobs = []
+    for job in jobs:
+        ref_info = job["ctx"]["ref_info"]
+        plan_jobs.append(
+            {
+                "work": job["cost"] / factor,
+                "width": ref_info["width"],
+                "height": ref_info["height"],
+                "pix_fmt": ref_info["pix_fmt"],
+                "branches": len(job["parts"]) + len(job_clips(job)) - 1,
+            }
+        )
+    if len(plan_jobs) == 0:
+        print("Nothing is left to calculate.")
+        return
+
+    cpus = mp.cpu_count()
+    prediction = predict_plan(history, plan_jobs, models, features, args.Subsamples, args.Processes, cpus)
+    print("Planned {} calculations:\n".format(len(jobs)))
+    for job, seconds in zip(jobs, prediction["seconds"]):
+        msg = ""
+        for clip in job_clips(job):
+            msg += "Reference: {}\n".format(clip["reference"])
+            for part in clip["parts"]:
+                msg += "Encoded: {}".format(part["enc"])
+                if part["segment"] is not None:
+                    msg += " (segment {})".format(part["segment"])
+                msg += "\n"
+        msg += "Predicted time: {}\n".format(timedelta(seconds=round(seconds)) if seconds is not None else "unknown")
+        ff_tmp = create_job_ffmpeg(args, job, job["ctx"]["normalizations"], models, features, decode)
+        print(msg + ff_tmp.cmd + "\n")
+
+    memory_budget = args.Memory_Limit * 1024 * 1024 if args.Memory_Limit > 0 else get_available_memory()
+    msg = "Prediction for {} processes with {}, {} and n_subsample={}:\n"
+    msg = msg.format(
+        args.Processes, ", ".join(models.keys()), ", ".join(features) or "no features", args.Subsamples or 1
+    )
+    if prediction["total"] is None:
+        msg += "\tRuntime: unknown, nothing was measured on this computer yet. "
+        msg += 'Plan with "Autotune", or calculate anything once, to measure the throughput.\n'
+    else:
+        msg += "\tRuntime: {}, from {}\n".format(
+            timedelta(seconds=round(prediction["total"])), " and ".join(prediction["sources"])
+        )
+    msg += "\tPeak memory: {}".format(bytes2human(prediction["memory"]))
+    if memory_budget is not None and prediction["memory"] > memory_budget:
+        msg += ", more than the {} available".format(bytes2human(memory_budget))
+    print(msg + "\n")
+
+    if args.Deadline <= 0:
+        return
+    deadline = timedelta(minutes=args.Deadline)
+    fit = fit_deadline(
+        history,
+        plan_jobs,
+        models,
+        features,
+        args.Subsamples,
+        args.Processes,
+        deadline.total_seconds(),
+        memory_budget,
+        cpus,
+    )
+    if fit is None:
+        print("No settings finish within the deadline of {} with the memory available.".format(deadline))
+        return
+    msg = "Suggested settings to finish within the deadline of {}:\n".format(deadline)
+    msg += "\tProcesses: {}, with {} threads each\n".format(fit["processes"], max(1, cpus // fit["processes"]))
+    msg += "\tModels: {}\n".format(", ".join(fit["models"].keys()))
+    msg += "\tFeatures: {}\n".format(", ".join(fit["features"]) or "none")
+    msg += "\tn_subsample: {}\n".format(fit["subsamples"])
+    msg += "\tRuntime: {}\n".format(timedelta(seconds=round(fit["prediction"]["total"])))
+    msg += "\tPeak memory: {}\n".format(bytes2human(fit["prediction"]["memory"]))
+    suggested = [
+        "--Processes {}".format(fit["processes"]),
+        "--Threads {}".format(max(1, cpus // fit["processes"])),
+        "--Subsamples {}".format(fit["subsamples"]),
+        "--Models {}".format(" ".join(fit["models"].keys())),
+    ]
+    suggested += [feature_args[feature] for feature in features if feature not in fit["features"]]
+    msg += "\tArguments: {}".format(" ".join(suggested))
+    print(msg + "\n")
+
+
+def plan_encoded_segments(
+    args,
+    io,
+    curdir,
+    ref_info,
+    encs=None,
+):
+    """Split every unfinished encoded video's calculation into segments when segmenting is enabled.
+
+    Segment boundaries are shared between all encoded videos, since they all
+    follow the reference video's timeline. Segments that were already finished
+    in a previous run of the same plan are kept. Only the given encoded video
+    files are split if encs is given.
+    """
+    pending = [
+        enc
+        for enc in (io.keys() if encs is None else encs)
+        if io[enc]["status"] not in ["DONE", "MOVED", "SCREENED", "RACED", "ESTIMATED", "REJECTED", "TIMED OUT"]
+    ]
+    if (args.Segments == 0 and not args.Race) or len(pending) == 0:
+        for enc in pending:
+            io[enc].pop("segments", None)
+        return
+
+    count = args.Segments
+    if count < 0:
+        count = -(-args.Processes // len(pending))
+    # Every finished segment is one sample of a racing encoded video file's score
+    if args.Race:
+        count = max(count, RACE_SEGMENTS)
+    if count <= 1:
+        for enc in pending:
+            io[enc].pop("segments", None)
+        return
+
+    scenes = []
+    if args.Scene_Threshold > 0 and not args.Plan:
+        print("Detecting scene changes in {}...".format(args.Reference))
+        scenes = detect_scene_changes(args.FFmpeg, args.Reference, args.Scene_Threshold)
+    segments = plan_segments(ref_info["frames"], ref_info["fps"], count, scenes)
+    print("Splitting calculations into {} segments.\n".format(len(segments)))
+
+    log_dir = curdir.joinpath("logs")
+    for enc in pending:
+        old = io[enc].get("segments", [])
+        starts = [seg["start_frame"] for seg in segments]
+        if [seg.get("start_frame") for seg in old] != starts:
+            old = []
+        io[enc]["segments"] = []
+        for i, seg in enumerate(segments):
+            seg_log = log_dir.joinpath("{}.seg{:03d}.{}".format(Path(enc).stem, i, args.Log_Format))
+            seg_log = str(seg_log).replace("\\", "/")
+            status = "NOT STARTED"
+            if len(old) > 0 and old[i]["status"] == "DONE" and Path(seg_log).exists():
+                status = "DONE"
+            elif not args.Plan:
+                Path(seg_log).unlink(missing_ok=True)
+            io[enc]["segments"].append(
+                {
+                    "start_frame": seg["start_frame"],
+                    "frames": seg["frames"],
+                    "log_path": seg_log,
+                    "status": status,
+                }
+            )
+            if len(old) > 0 and status != "DONE" and "checkpoints" in old[i]:
+                io[enc]["segments"][i]["checkpoints"] = old[i]["checkpoints"]
+
+
+def plan_checkpoints(
+    args,
+    io,
+    curdir,
+    encs=None,
+):
+    """Keep the checkpoints of every unfinished calculation that can still be resumed, and delete all others.
+
+    Checkpoints only belong to the calculations they were made for, so
+    those of an encoded video file that is split into segments now, or was
+    split differently before, are deleted along with any whose files went
+    missing, and so are those of finished encoded video files. Only the given
+    encoded video files are looked at if encs is given.
+    """
+    log_dir = curdir.joinpath("logs")
+    for enc in io.keys() if encs is None else encs:
+        units = io[enc].get("segments", [])
+        if io[enc]["status"] in ["DONE", "MOVED", "SCREENED", "RACED", "ESTIMATED", "REJECTED", "TIMED OUT"]:
+            units = []
+        elif len(units) > 0:
+            io[enc].pop("checkpoints", None)
+        else:
+            units = [io[enc]]
+
+        keep = []
+        for unit in units:
+            if args.No_Checkpoints:
+                unit.pop("checkpoints", None)
+            check_checkpoints(unit, args.Subsamples)
+            keep.extend([checkpoint["log_path"] for checkpoint in unit.get("checkpoints", [])])
+        if not args.Plan:
+            remove_stale_checkpoints(log_dir, Path(enc).stem, args.Log_Format, keep)
+
+
+def prepare_encoded(
+    args,
+    io,
+    aggregate,
+    enc,
+    curdir,
+):
+    """Set up the log file location and the aggregate statistics of an encoded video file.
+
+    The log file of an encoded video file that is not started yet is deleted.
+
+    Raises:
+        OSError: The logs directory could not be created, or the encoded video file does not exist.
+    """
+    # Get enc path for creating results folder next to it
+    enc_path = Path(enc)
+
+    # log_dir = enc_parent.joinpath("{}_results".format(enc_path.stem))
+    log_dir = curdir.joinpath("logs")
+    log_dir.mkdir(parents=True, exist_ok=True)
+    log_loc = "{}.{}".format(
+        enc_path.stem,
+        args.Log_Format,
+    )
+    log_loc = log_dir.joinpath(log_loc)
+
+    if enc not in aggregate.keys():
+        aggregate[enc] = {}
+        aggregate_log = "{}_aggregate.txt".format(enc_path.stem)
+        aggregate[enc]["log"] = log_dir.joinpath(aggregate_log)
+        aggregate[enc]["file_size"] = Path(enc).stat().st_size
+        aggregate[enc]["score"] = 0
+
+    # Clean up the log path for windows systems
+    io[enc]["log_path"] = str(log_loc).replace("\\", "/")
+    if io[enc]["status"] == "NOT STARTED" and not args.Plan:
+        Path(io[enc]["log_path"]).unlink(missing_ok=True)
+
+
+def create_jobs(
+    args,
+    io,
+    encs,
+    state,
+    ref_info,
+    normalizations,
+    duplicate_of,
+    batch_size,
+):
+    """Claim the given encoded video files that still need calculating, and group their parts into jobs.
+
+    Every job is a single FFmpeg process calculating one or more "parts",
+    where each part is an encoded video file or one segment of it, writing to
+    its own log file. Parts are grouped by segment so that batched jobs can
+    share the same section of the reference video. A part with checkpoints
+    only calculates the frames after them, writing to its next checkpoint.
+
+    Args:
+        args (_type_): GooeyParser.parser() arguments
+        io (dict): Main input/output dictionary.
+        encs (Iterable[str]): Encoded video files to create jobs for.
+        state (Union[VMAF_Job_Store, VMAF_Json_State]): Saved state of the calculations, used to claim them.
+        ref_info (dict): Reference video properties from the media index.
+        normalizations (dict): Normalization plan of every encoded video file.
+        duplicate_of (dict): The first encoded video file with the same contents, for every encoded video file
+            that is not calculated by itself.
+        batch_size (int): Maximum number of encoded video files calculated by a single job.
+
+    Returns:
+        tuple: The jobs, and the encoded video files that were claimed.
+    """
+    parts = {}
+    claimed = []
+    for enc in encs:
+        data = io[enc]
+        if (
+            io[enc]["status"] in ["DONE", "MOVED", "SCREENED", "RACED", "ESTIMATED", "REJECTED", "TIMED OUT"]
+            or enc in duplicate_of
+        ):
+            continue
+        # Another calculator instance sharing the same state may already be
+        # calculating (or have finished) this encoded video file
+        if not state.claim(enc):
+            print("Skipping {}, it is being calculated by another calculator instance.".format(enc))
+            continue
+        io[enc]["status"] = "STARTED"
+        claimed.append(enc)
+        units = [(i, seg) for i, seg in enumerate(data["segments"])] if "segments" in data else [(None, data)]
+        for i, unit in units:
+            if i is not None:
+                if unit["status"] == "DONE":
+                    continue
+                unit["status"] = "NOT STARTED"
+            done = checkpointed_frames(unit)
+            log_path = checkpoint_path(unit["log_path"], len(unit["checkpoints"])) if done > 0 else unit["log_path"]
+            parts.setdefault((i, done), []).append({"enc": enc, "segment": i, "log_path": log_path, "resume": done})
+
+    jobs = []
+    for (seg_idx, done), seg_parts in parts.items():
+        segment = {"start_frame": 0, "frames": None}
+        if seg_idx is not None:
+            segment = io[seg_parts[0]["enc"]]["segments"][seg_idx]
+        segment = resume_segment(segment, done)
+        frames = segment["frames"] or max(0, ref_info["frames"] - segment["start_frame"])
+        input_opts = segment_input_options(segment, ref_info["fps"])
+        # Encoded video files shifted by the alignment check seek differently
+        # than the reference, so they can not share its decode
+        shifted = [part for part in seg_parts if normalizations[part["enc"]].get("offset", 0) != 0]
+        seg_parts = [part for part in seg_parts if part not in shifted]
+        for i in range(0, len(seg_parts), batch_size):
+            jobs.append(
+                {
+                    "reference": str(args.Reference),
+                    "parts": seg_parts[i : i + batch_size],
+                    "input_opts": input_opts,
+                    "frames": frames,
+                }
+            )
+        for part in shifted:
+            part_opts = pair_input_options(io, part["enc"], str(args.Reference), segment, ref_info["fps"])
+            jobs.append({"reference": str(args.Reference), "parts": [part], "input_opts": part_opts, "frames": frames})
+    return jobs, claimed
+
+
+def check_result_cache(
+    args,
+    io,
+    aggregate,
+    models,
+    features,
+    cache,
+    encs=None,
+):
+    """Finish every unfinished encoded video file that has a cached result, and find identical encoded video files.
+
+    Args:
+        args (_type_): GooeyParser.parser() arguments
+        io (dict): Main input/output dictionary.
+        aggregate (dict): Aggregate statistics for every encoded video file.
+        models (dict): VMAF models used.
+        features (list): Extra libvmaf features calculated.
+        cache (VMAF_Result_Cache): The result cache.
+        encs (Iterable[str], optional): Only check these encoded video files. Defaults to None, checking all of them.
+
+    Returns:
+        tuple: The cache key of every unfinished encoded video file, and the first encoded video file with the
+            same contents for every encoded video file that does not need to be calculated by itself.
+    """
+    # The log path and thread count do not change the results, so they are
+    # left out of the filter graph the key is made from
+    vmaf_filter = build_vmaf_filter(models, args.Log_Format, "", features=features, subsamples=args.Subsamples)
+    ref_fingerprint = fingerprint(args.Reference)
+
+    cache_keys = {}
+    first_of = {}
+    duplicate_of = {}
+    for enc in io.keys() if encs is None else encs:
+        if io[enc]["status"] in ["DONE", "MOVED", "RACED", "REJECTED"]:
+            continue
+        graph = build_filter_graph(vmaf_filter, io[enc].get("normalization"))
+        # Skipped frames change the results without changing the filter graph
+        offset = io[enc].get("normalization", {}).get("offset", 0)
+        if offset != 0:
+            graph += "|offset={}".format(offset)
+        key = cache_key(ref_fingerprint, fingerprint(enc), graph, list(models.keys()))
+        cache_keys[enc] = key
+
+        if args.Plan:
+            # Only look, the result would be restored when running
+            if cache.lookup(key, args.Log_Format) is not None:
+                print("The cached result would be used for {}.".format(enc))
+                io[enc].pop("segments", None)
+                io[enc]["status"] = "DONE"
+                continue
+            scores = None
+        else:
+            scores = cache.restore(key, args.Log_Format, io[enc]["log_path"])
+        if scores is not None:
+            print("Using the cached result for {}.".format(enc))
+            io[enc].pop("segments", None)
+            finish_encoded(io, aggregate, enc, scores)
+        elif key in first_of:
+            print("{} has the same contents as {}, it will not be calculated by itself.".format(enc, first_of[key]))
+            duplicate_of[enc] = first_of[key]
+        else:
+            first_of[key] = enc
+    return cache_keys, duplicate_of
+
+
+def write_usage(
+    aggregate_file,
+    usage,
+):
+    """Write the resource usage of every FFmpeg process of an encoded video file to its aggregate log file."""
+    if usage is None:
+        return
+    aggregate_file.write("\nWall Time: {:.3f}s\n".format(usage["wall"] or 0.0))
+    if usage.get("user") is not None:
+        tmp_msg = "CPU Time: {:.3f}s user, {:.3f}s sys\n"
+        aggregate_file.write(tmp_msg.format(usage["user"], usage["sys"]))
+    if usage.get("max_rss") is not None:
+        tmp_msg = "Max RSS: {}B = {}\n"
+        aggregate_file.write(tmp_msg.format(int(usage["max_rss"]), bytes2human(usage["max_rss"])))
+    if usage.get("read_bytes") is not None:
+        tmp_msg = "Read: {}B = {}\n"
+        aggregate_file.write(tmp_msg.format(int(usage["read_bytes"]), bytes2human(usage["read_bytes"])))
+    if usage.get("disk_read_bytes") is not None:
+        tmp_msg = "Read From Storage: {}B = {}\n"
+        aggregate_file.write(tmp_msg.format(int(usage["disk_read_bytes"]), bytes2human(usage["disk_read_bytes"])))
+
+
+def finish_encoded(
+    io,
+    aggregate,
+    enc,
+    scores,
+):
+    """Save the scores of a fully calculated encoded video file, write its aggregate log file and move it next to its logs.
+
+    Args:
+        io (dict): Main input/output dictionary.
+        aggregate (dict): Aggregate statistics for every encoded video file.
+        enc (str): Encoded video file that finished.
+        scores (dict): Pooled VMAF score of every model.
+    """
+    io[enc]["status"] = "DONE"
+    io[enc]["scores"] = scores
+
+    # Prepare the output message for this encoded video file
+    log_path = str(Path(io[enc]["log_path"]))
+    msg = "\tLog Location: {}\n".format(log_path.replace("\\:", ":").replace('"', "/"))
+    for model, vmaf_score in scores.items():
+        msg += "\t{} Score: {}\n".format(model, vmaf_score)
+        # Add this score to the overall score of the enc video file between
+        # all models
+        aggregate[enc]["score"] += vmaf_score
+
+    if io[enc].get("usage") is not None:
+        msg += "\t{}\n".format(format_usage(io[enc]["usage"]))
+
+    # Save the enc output message for later
+    io[enc]["msg"] = msg
+
+    # Move the enc video file to the log location
+    enc_path = Path(enc)
+    enc_path_new = aggregate[enc]["log"].parent.joinpath(enc_path.name)
+    enc_path.replace(enc_path_new)
+
+    # Get the average VMAF score between all model files
+    if len(scores) > 0:
+        aggregate[enc]["score"] /= len(scores)
+
+    # Save score to aggregate enc's output message
+    tmp_msg = "Average VMAF Score between all tested VMAF models is {}\n"
+    aggregate[enc]["msg"] = tmp_msg.format(aggregate[enc]["score"])
+
+    # Open the aggregate statistics file for writing to
+    with open(aggregate[enc]["log"], "w") as aggregate_file:
+        # Keep the first stage's result apart from the full results
+        if "screening" in io[enc]:
+            screening = io[enc]["screening"]
+            aggregate_file.write("Stage: Full\n")
+            tmp_msg = "{} Screening Score (n_subsample={}): {}\n\n"
+            aggregate_file.write(tmp_msg.format(screening["model"], screening["n_subsample"], screening["score"]))
+
+        for model, vmaf_score in scores.items():
+            # Write the average score for each model to the aggregate log file
+            tmp_msg = "{} Score: {}\n"
+            aggregate_file.write(tmp_msg.format(model, vmaf_score))
+
+        # Write average VMAF score to aggregate log file
+        tmp_msg = "\nAverage Score: {}\n"
+        aggregate_file.write(tmp_msg.format(aggregate[enc]["score"]))
+
+        # Convert file size to a more human-readable format
+        size_converted = bytes2human(aggregate[enc]["file_size"])
+
+        # Write the size in bytes & the size in human-readable format to the
+        # aggregate log file
+        tmp_msg = "File Size: {}B = {}\n"
+        aggregate_file.write(tmp_msg.format(aggregate[enc]["file_size"], size_converted))
+        write_usage(aggregate_file, io[enc].get("usage"))
+
+    io[enc]["status"] = "MOVED"
+
+
+def finish_screened(
+    io,
+    aggregate,
+    enc,
+):
+    """Save the result of an encoded video file that was not a finalist of the "Two_Stage" mode's first stage.
+
+    The encoded video file is not moved, since it has no full results.
+    """
+    io[enc]["status"] = "SCREENED"
+    screening = io[enc]["screening"]
+    tmp_msg = "\tScreening Log Location: {}\n\t{} Screening Score (n_subsample={}): {}\n"
+    io[enc]["msg"] = tmp_msg.format(
+        screening["log_path"], screening["model"], screening["n_subsample"], screening["score"]
+    )
+    aggregate[enc]["msg"] = "Not a finalist, only the screening stage was calculated\n"
+
+    with open(aggregate[enc]["log"], "w") as aggregate_file:
+        aggregate_file.write("Stage: Screening\n")
+        tmp_msg = "{} Screening Score (n_subsample={}): {}\n"
+        aggregate_file.write(tmp_msg.format(screening["model"], screening["n_subsample"], screening["score"]))
+
+        size_converted = bytes2human(aggregate[enc]["file_size"])
+        tmp_msg = "File Size: {}B = {}\n"
+        aggregate_file.write(tmp_msg.format(aggregate[enc]["file_size"], size_converted))
+        write_usage(aggregate_file, io[enc].get("usage"))
+
+
+def finish_raced(
+    io,
+    aggregate,
+    enc,
+):
+    """Save the estimate of an encoded video file that lost the "Race" mode's race.
+
+    The encoded video file is not moved, since it has no full results.
+    """
+    io[enc]["status"] = "RACED"
+    io[enc].pop("segments", None)
+    race = io[enc]["race"]
+    tmp_msg = "\t{} Race Estimate ({} of {} segments): {:.3f} [{:.3f}, {:.3f}]\n"
+    io[enc]["msg"] = tmp_msg.format(
+        race["model"], race["segments"], race["total_segments"], race["mean"], race["low"], race["high"]
+    )
+    aggregate[enc]["msg"] = "Lost the race, its calculation was stopped early\n"
+
+    with open(aggregate[enc]["log"], "w") as aggregate_file:
+        aggregate_file.write("Stage: Race\n")
+        tmp_msg = "{} Race Estimate ({} of {} segments, {} frames): {}\n"
+        aggregate_file.write(
+            tmp_msg.format(race["model"], race["segments"], race["total_segments"], race["frames"], race["mean"])
+        )
+        tmp_msg = "Confidence Interval: {} - {}\n"
+        aggregate_file.write(tmp_msg.format(race["low"], race["high"]))
+
+        size_converted = bytes2human(aggregate[enc]["file_size"])
+        tmp_msg = "File Size: {}B = {}\n"
+        aggregate_file.write(tmp_msg.format(aggregate[enc]["file_size"], size_converted))
+        write_usage(aggregate_file, io[enc].get("usage"))
+
+
+def finish_estimated(
+    io,
+    aggregate,
+    enc,
+):
+    """Save the estimated scores of an encoded video file from the "Estimate" mode.
+
+    The encoded video file is not moved, since it has no full results.
+    """
+    io[enc]["status"] = "ESTIMATED"
+    estimate = io[enc]["estimate"]
+    msg = "\tEstimated from {} samples ({} frames):\n".format(estimate["samples"], estimate["frames"])
+    for model, stats in estimate["scores"].items():
+        mean = stats["mean"]
+        msg += "\t{} Estimated Score: {:.3f} [{:.3f}, {:.3f}]\n".format(model, mean["value"], mean["low"], mean["high"])
+    io[enc]["msg"] = msg
+    aggregate[enc]["msg"] = "Estimated from samples, the full calculation was not run\n"
+
+    with open(aggregate[enc]["log"], "w") as aggregate_file:
+        aggregate_file.write("Stage: Estimate\n")
+        tmp_msg = "Samples: {} ({} frames, {:.0%} confidence)\n\n"
+        aggregate_file.write(
+            tmp_msg.format(estimate["samples"], estimate["frames"], estimate["settings"]["confidence"])
+        )
+        for model, stats in estimate["scores"].items():
+            # Write the estimated mean and percentiles of every model with
+            # their confidence bounds
+            tmp_msg = "{} Estimated {}: {} ({} - {})\n"
+            aggregate_file.write(
+                tmp_msg.format(model, "Score", stats["mean"]["value"], stats["mean"]["low"], stats["mean"]["high"])
+            )
+            for percentile in ESTIMATE_PERCENTILES:
+                value = stats["p{}".format(percentile)]
+                aggregate_file.write(
+                    tmp_msg.format(model, "P{}".format(percentile), value["value"], value["low"], value["high"])
+                )
+
+        size_converted = bytes2human(aggregate[enc]["file_size"])
+        tmp_msg = "\nFile Size: {}B = {}\n"
+        aggregate_file.write(tmp_msg.format(aggregate[enc]["file_size"], size_converted))
+        write_usage(aggregate_file, io[enc].get("usage"))
+
+
+def finish_rejected(
+    io,
+    aggregate,
+    enc,
+):
+    """Save why an encoded video file was rejected by the alignment check.
+
+    The encoded video file is not moved, since it has no results.
+    """
+    io[enc]["status"] = "REJECTED"
+    io[enc].pop("segments", None)
+    alignment = io[enc]["alignment"]
+    io[enc]["msg"] = "\tRejected by the alignment check: {}\n".format(alignment["message"])
+    aggregate[enc]["msg"] = "Not calculated, it does not line up with the reference video\n"
+
+    with open(aggregate[enc]["log"], "w") as aggregate_file:
+        aggregate_file.write("Stage: Alignment\n")
+        aggregate_file.write("Rejected: {}\n".format(alignment["message"]))
+
+        size_converted = bytes2human(aggregate[enc]["file_size"])
+        tmp_msg = "File Size: {}B = {}\n"
+        aggregate_file.write(tmp_msg.format(aggregate[enc]["file_size"], size_converted))
+
+
+def add_watched_files(
+    args,
+    io,
+    aggregate,
+    files,
+    curdir,
+    media_index,
+    ref_info,
+    normalizations,
+    models,
+    features,
+    cache,
+    cache_keys,
+    duplicate_of,
+):
+    """Prepare the new encoded video files found by the folder watcher, like the ones found at the start.
+
+    Every new encoded video file is probed, gets its normalization plan and
+    alignment check, is finished right away if the result cache has it, and is
+    split into segments if segmenting is enabled.
+
+    Args:
+        args (_type_): GooeyParser.parser() arguments
+        io (dict): Main input/output dictionary.
+        aggregate (dict): Aggregate statistics for every encoded video file.
+        files (list): Files handed out by the folder watcher.
+        curdir (Path): Current directory, containing the logs directory.
+        media_index (VMAF_Media_Index): Index of the video files' properties.
+        ref_info (dict): Reference video properties from the media index.
+        normalizations (dict): Normalization plan of every encoded video file, updated with the new ones.
+        models (dict): VMAF models used.
+        features (list): Extra libvmaf features calculated.
+        cache (Optional[VMAF_Result_Cache]): The result cache, or None if it is disabled.
+        cache_keys (dict): Cache key of every encoded video file, updated with the new ones.
+        duplicate_of (dict): The first encoded video file with the same contents, updated with the new ones.
+
+    Returns:
+        list: The new encoded video files.
+    """
+    new = []
+    enc_infos = {}
+    for enc in files:
+        # Files calculated earlier were moved away, so a file with the same
+        # path that is already known is still being worked on
+        if enc in io and io[enc]["status"] not in ["MOVED", "REJECTED"]:
+            continue
+        io[enc] = {"status": "NOT STARTED"}
+        aggregate.pop(enc, None)
+        try:
+            prepare_encoded(args, io, aggregate, enc, curdir)
+            enc_infos[enc] = media_index.get(enc)
+        except (OSError, ValueError, ffmpy.FFRuntimeError) as e:
+            print("Could not add {}: {}".format(enc, e))
+            io.pop(enc)
+            aggregate.pop(enc, None)
+            continue
+        normalizations[enc] = plan_normalization(ref_info, enc_infos[enc])
+        io[enc]["normalization"] = normalizations[enc]
+        new.append(enc)
+    if len(new) == 0:
+        return new
+
+    print("Found {} new encoded video files:".format(len(new)))
+    for enc in new:
+        print("\t{}".format(enc))
+    if not args.No_Alignment_Check:
+        run_alignment_check(args, io, aggregate, ref_info, enc_infos, normalizations)
+    if cache is not None:
+        new_keys, new_duplicates = check_result_cache(args, io, aggregate, models, features, cache, new)
+        cache_keys.update(new_keys)
+        duplicate_of.update(new_duplicates)
+    plan_encoded_segments(args, io, curdir, ref_info, new)
+    plan_checkpoints(args, io, curdir, new)
+    return new
+
+
+def publish_result(
+    results_file,
+    io,
+    aggregate,
+    enc,
+):
+    """Append the outcome of an encoded video file to the results file as a single JSON line, and print it.
+
+    Lets other programs follow the results of a watching calculator while it
+    keeps running.
+    """
+    result = {
+        "encoded": enc,
+        "status": io[enc]["status"],
+        "scores": io[enc].get("scores"),
+        "score": aggregate[enc]["score"] if "scores" in io[enc] else None,
+        "log_path": io[enc]["log_path"],
+        "aggregate_log": str(aggregate[enc]["log"]).replace("\\", "/"),
+        "alignment": io[enc].get("alignment"),
+        "usage": io[enc].get("usage"),
+        "finished": time(),
+    }
+    with open(results_file, "a") as writer:
+        writer.write(dumps(result, sort_keys=True) + "\n")
+    print("Finished {}:\n{}".format(enc, io[enc]["msg"]))
+
+
+def finish_task(
+    args,
+    info,
+    err,
+    models,
+    features,
+    history,
+    cache,
+    race=None,
+    speculator=None,
+    results_file=None,
+):
+    """Handle a job that finished, finishing every encoded video file it completed and saving their state.
+
+    Segments only finish their encoded video file once every other segment of
+    it is done too, and a resumed calculation merges its checkpoints first.
+
+    Args:
+        args (argparse.Namespace): Command line arguments.
+        info (dict): The finished task's entry of the submitted tasks.
+        err (bytes): The stderr of the job's FFmpeg process.
+        models (dict): VMAF models used, the first one is raced on.
+        features (list): Extra libvmaf features calculated.
+        history (VMAF_History): Throughput measured on this computer.
+        cache (VMAF_Result_Cache): Result cache, or None when it is disabled.
+        race (VMAF_Race): The race between the encoded video files. Defaults to None when not racing.
+        speculator (VMAF_Speculator): Pairs of stragglers and their duplicates. Defaults to None.
+        results_file (Path): File every result is published to when watching. Defaults to None.
+
+    Returns:
+        int: Number of encoded video files the job finished, including those with the same contents.
+    """
+    race_model, race_name = list(models.items())[0]
+    saved = {}
+    enc_finished = 0
+
+    # Learn this computer's throughput for later plans, which only local
+    # processes tell anything about
+    job = info["job"]
+    if not args.Coordinator and info["usage"].get("wall"):
+        job_info = info["ctx"]["ref_info"]
+        key = autotune_key(job_info["width"], job_info["height"], models, features, args.Subsamples)
+        record_throughput(
+            history,
+            key,
+            args.Processes,
+            sum([clip["frames"] * len(clip["parts"]) for clip in job_clips(job)]),
+            job["cost"],
+            info["usage"]["wall"],
+        )
+        record_job_time(history, key, args.Processes, job["cost"], info["usage"]["wall"])
+    if speculator is not None:
+        speculator.add_finished(job["cost"], info["usage"].get("wall"))
+
+    for part in info["parts"]:
+        enc = part["enc"]
+        # Every reference video file keeps its own state, and a clip batch
+        # calculates several of them
+        ctx = part["ctx"]
+        io, aggregate = ctx["io"], ctx["aggregate"]
+        cache_keys, duplicate_of = ctx["cache_keys"], ctx["duplicate_of"]
+        saved.setdefault(id(ctx), (ctx, set()))[1].add(enc)
+        # The rest of a batch keeps running after some of its encoded video
+        # files lost the race
+        if io[enc]["status"] == "RACED":
+            continue
+        # Keep the highest peak memory of every process that calculated a part
+        # of this encoded video file
+        if info["ticket"] is not None:
+            io[enc]["peak_rss"] = max(io[enc].get("peak_rss", 0), info["ticket"].peak)
+        # A batch's process is shared evenly between its encoded video files
+        io[enc]["usage"] = add_usage(io[enc].get("usage"), info["usage"], 1 / len(info["parts"]))
+        # A resumed calculation only calculated the frames after its
+        # checkpoints, which complete its log
+        pooled = None
+        if part["resume"] > 0:
+            unit = io[enc] if part["segment"] is None else io[enc]["segments"][part["segment"]]
+            pooled = finish_checkpoints(unit, part["log_path"], args.Log_Format)
+        if part["segment"] is not None:
+            segments = io[enc]["segments"]
+            segments[part["segment"]]["status"] = "DONE"
+            if race is not None:
+                seg_log = segments[part["segment"]]["log_path"]
+                race.add_segment(enc, read_race_scores(seg_log, args.Log_Format, race_name))
+
+            # Wait for the rest of the encoded video file's segments
+            if any([seg["status"] != "DONE" for seg in segments]):
+                continue
+
+            # Stitch the segment logs back into a single log, and read the
+            # scores of every model from it
+            pooled = merge_logs(
+                [(seg["log_path"], seg["start_frame"]) for seg in segments],
+                io[enc]["log_path"],
+                args.Log_Format,
+            )
+            del io[enc]["segments"]
+        elif pooled is None and len(info["parts"]) == 1:
+            # Look for the average VMAF score of every model given in the stderr
+            scores = parse_scores(err, models)
+        elif pooled is None:
+            # The stderr of a batch mixes the scores of every encoded video
+            # file, so read them from the logs instead
+            pooled = read_pooled(io[enc]["log_path"], args.Log_Format)
+
+        if pooled is not None:
+            scores = {model: pooled[name]["mean"] for model, name in models.items() if name in pooled}
+
+        finish_encoded(io, aggregate, enc, scores)
+        finished = [enc]
+        if race is not None and race_model in scores:
+            race.add_result(enc, scores[race_model])
+
+        # Keep the result for later runs, and hand it to every encoded video
+        # file with the same contents
+        if cache is not None and enc in cache_keys:
+            cache.store(cache_keys[enc], io[enc]["log_path"], args.Log_Format, scores, source=enc)
+            for dup in [dup for dup, first in duplicate_of.items() if first == enc]:
+                cache.restore(cache_keys[enc], args.Log_Format, io[dup]["log_path"])
+                io[dup].pop("segments", None)
+                finish_encoded(io, aggregate, dup, scores)
+                finished.append(dup)
+        saved[id(ctx)][1].update(finished)
+        if results_file is not None:
+            for enc in finished:
+                publish_result(results_file, io, aggregate, enc)
+        enc_finished += len(finished)
+
+    for ctx, encs in saved.values():
+        ctx["state"].save(ctx["io"], encs)
+    return enc_finished
+
+
+def find_references(args):
+    """Pair every reference video file with the location of its encoded video files.
+
+    The "Reference" argument is either a single reference video file, which
+    is paired with the "Encoded" argument, or a directory of reference video
+    files, each paired with the subdirectory of the "Encoded" directory named
+    after it. The "Manifest" argument instead lists every pair in a JSON file
+    mapping reference video files to their encoded directories, relative to
+    the manifest itself.
+
+    Raises:
+        OSError: The reference directory or manifest could not be read.
+        ValueError: The manifest is not a JSON object.
+
+    Returns:
+        list: A (reference, encoded) tuple for every reference video file, encoded being None if it has none.
+    """
+    if args.Manifest:
+        with open(args.Manifest, "r") as reader:
+            manifest = load(reader)
+        if not isinstance(manifest, dict):
+            raise ValueError("Manifest {} must map reference video files to encoded directories.".format(args.Manifest))
+        base = Path(args.Manifest).parent
+        return [
+            (
+                str(base.joinpath(reference)).replace("\\", "/"),
+                str(base.joinpath(encoded)).replace("\\", "/") if encoded else None,
+            )
+            for reference, encoded in manifest.items()
+        ]
+
+    if Path(args.Reference).is_dir():
+        encoded_dir = Path(args.Encoded or args.Reference)
+        references = []
+        for reference in sorted(find_by_exts(args.Reference, REFERENCE_EXTS, should_print=False)):
+            encoded = encoded_dir.joinpath(Path(reference).stem)
+            references.append((reference, str(encoded).replace("\\", "/") if encoded.is_dir() else None))
+        if len(references) == 0:
+            raise OSError("ERROR: Could not find any reference video files in {}".format(args.Reference))
+        return references
+
+    return [(args.Reference, args.Encoded)]
+
+
+def close_states(contexts):
+    """Save and close the state of every reference video file."""
+    for ctx in contexts:
+        ctx["state"].save(ctx["io"])
+        ctx["state"].close()
+
+
+def open_reference(
+    args,
+    out_dir,
+    models,
+    features,
+    media_index,
+    cache,
+):
+    """Load the state of a reference video file, find its encoded video files and prepare them for calculation.
+
+    Every encoded video file is probed, gets its normalization plan and
+    alignment check, and is finished right away if the result cache has it.
+
+    Args:
+        args (_type_): GooeyParser.parser() arguments, with the "Reference" and "Encoded" of this reference video file.
+        out_dir (Path): Directory containing the logs directory of this reference video file.
+        models (dict): VMAF models used.
+        features (list): Extra libvmaf features calculated.
+        media_index (VMAF_Media_Index): Index of the video files' properties.
+        cache (Optional[VMAF_Result_Cache]): The result cache, or None if it is disabled.
+
+    Raises:
+        OSError: The reference video file or its encoded video files could not be found.
+
+    Returns:
+        dict: The reference video file's "args", "out_dir", "state", "io", "aggregate", "ref_info",
+            "normalizations", "cache_keys" and "duplicate_of".
+    """
+    # Create main input/output dictionary
+    io = {}
+
+    # Make sure the reference video file exists
+    search_handler(args.Reference)
+
+    # Open the saved state of the calculations for the given reference video
+    # file, and load it if continuing
+    if args.State == "sqlite":
+        state = VMAF_Job_Store(
+            Path(args.Reference).parent.joinpath("vmaf_jobs.sqlite"),
+            args.Reference,
+            models.keys(),
+            features,
+        )
+        if args.Continue:
+            imported = state.import_completions(read_completions(args.Reference))
+            if imported > 0:
+                print("Imported {} calculations from the completions JSON file.".format(imported))
+    else:
+        state = VMAF_Json_State(args.Reference)
+    # Planning only reads the state
+    if args.Plan:
+        state = VMAF_Read_Only_State(state)
     completions = {}
     if args.Continue:
-        completions = read_completions(args.Reference)
+        completions = state.load()
 
     # Exit if we can't get any dis
     if len(completions) == 0 and args.Encoded is None:
@@ -311,18 +3136,14 @@ def main():
         )
 
     # Look for encoded video files in the provided locations
-    enc_files = None
+    enc_files = []
     if args.Encoded:
-        try:
-            # Check if given encoded files exist, and scan for video files inside
-            # any given directories.
-            enc_files = search_handler(args.Encoded, search_for="encoded")
+        # Check if given encoded files exist, and scan for video files inside
+        # any given directories.
+        enc_files = search_handler(args.Encoded, search_for="encoded")
 
-            # Remove any duplicate encoded files
-            enc_files = tuple(set(enc_files))
-        except OSError as ose:
-            print(ose)
-            exit(1)
+        # Remove any duplicate encoded files
+        enc_files = tuple(set(enc_files))
 
         # If no encoded files are found and no completions file exists, then
         # we exit
@@ -335,6 +3156,8 @@ def main():
 
     for enc in enc_files:
         io[enc] = {}
+    if not args.Continue:
+        state.reset(enc_files)
 
     # If there were any encoded files in the completions file
     if len(completions) > 0:
@@ -348,9 +3171,10 @@ def main():
                 check = completions[enc]["status"] in ["DONE", "MOVED"]
                 if check:
                     # Move the encoded video file and change its' status to MOVED
-                    Path(enc).replace(
-                        Path(enc).parent.joinpath("{}_results".format(Path(enc).stem), Path(enc).name),
-                    )
+                    if not args.Plan:
+                        Path(enc).replace(
+                            Path(enc).parent.joinpath("{}_results".format(Path(enc).stem), Path(enc).name),
+                        )
                     completions[enc]["status"] = "MOVED"
 
         # Move any enc-model pairs into the io dictionary
@@ -360,6 +3184,21 @@ def main():
                 io[enc]["status"] = "NOT STARTED"
             else:
                 io[enc]["status"] = completions[enc]["status"]
+            # Keep track of any segments that were finished in the last run
+            if "segments" in completions[enc]:
+                io[enc]["segments"] = completions[enc]["segments"]
+            # And the frames a cancelled calculation already calculated
+            if "checkpoints" in completions[enc]:
+                io[enc]["checkpoints"] = completions[enc]["checkpoints"]
+            # Keep the screening results of the "Two_Stage" mode as well
+            if "screening" in completions[enc]:
+                io[enc]["screening"] = completions[enc]["screening"]
+            # And the estimates of encoded video files that lost a race
+            if "race" in completions[enc]:
+                io[enc]["race"] = completions[enc]["race"]
+            # And the results of the "Estimate" mode
+            if "estimate" in completions[enc]:
+                io[enc]["estimate"] = completions[enc]["estimate"]
 
     del enc_files
     del completions
@@ -368,84 +3207,146 @@ def main():
         if "status" not in io[enc]:
             io[enc]["status"] = "NOT STARTED"
 
-    write_state(args.Reference, io)
+    state.save(io)
     aggregate = {}
 
     # Beginning of libvmaf filter
     for enc in io.keys():
-        if io[enc]["status"] not in ["DONE", "MOVED"]:
+        # Encoded video files that lost a race are not calculated again while
+        # racing, but are calculated in full without it
+        if io[enc]["status"] == "RACED" and args.Race:
+            pass
+        elif io[enc]["status"] not in ["DONE", "MOVED"]:
             io[enc]["status"] = "NOT STARTED"
-        # Start libvmaf filter and plug in vmaf model
 
-        tmp_models = []
-        for model, name in models.items():
-            tmp_models.append("{}\\\\:name={}".format(model, name))
-        tmp_models = "'{}'".format("|".join(tmp_models))
-        tmp_filter = "libvmaf=model=version={}".format(tmp_models)
+        # Attempt to create a new directory for storing the log results
+        prepare_encoded(args, io, aggregate, enc, out_dir)
 
-        # Add specified log format argument to libvmaf filter
-        tmp_filter += ":log_fmt={}".format(args.Log_Format)
+    # Probe the reference and every encoded video file still to calculate at
+    # once, reusing what earlier runs already probed
+    enc_infos = media_index.index(
+        [str(args.Reference)]
+        + [enc for enc in io.keys() if io[enc]["status"] not in ["DONE", "MOVED", "RACED", "REJECTED"]]
+    )
 
-        # Get enc path for creating results folder next to it
-        enc_path = Path(enc)
-        enc_parent = enc_path.parent
-        # Used for the final log location for each encoded file
-        log_loc = None
+    # Resolution, frame rate and frame count of the reference video, which
+    # every encoded video follows
+    ref_info = media_index.get(args.Reference)
 
-        # Attempt to create a new directory for storing the log results
-        try:
-            # log_dir = enc_parent.joinpath("{}_results".format(enc_path.stem))
-            log_dir = curdir.joinpath("logs")
-            log_dir.mkdir(exist_ok=True)
-            log_loc = "{}.{}".format(
-                enc_path.stem,
-                args.Log_Format,
-            )
-            log_loc = log_dir.joinpath(log_loc)
+    # Only convert what actually differs between every encoded video file and
+    # the reference video before comparing them
+    normalizations = {}
+    for enc in io.keys():
+        normalizations[enc] = plan_normalization(ref_info, enc_infos.get(enc))
+        io[enc]["normalization"] = normalizations[enc]
+
+    # Make sure every encoded video file lines up with the reference video
+    # before spending any time on it. Planning does not decode anything, so
+    # offsets found by the check are not part of the plan.
+    if not args.No_Alignment_Check and not args.Plan:
+        run_alignment_check(args, io, aggregate, ref_info, enc_infos, normalizations)
+        state.save(io)
+
+    # Satisfy calculations from the result cache, and only calculate the first
+    # of several encoded video files with identical contents
+    cache_keys = {}
+    duplicate_of = {}
+    if cache is not None:
+        cache_keys, duplicate_of = check_result_cache(args, io, aggregate, models, features, cache)
+
+    return {
+        "args": args,
+        "out_dir": out_dir,
+        "state": state,
+        "io": io,
+        "aggregate": aggregate,
+        "ref_info": ref_info,
+        "normalizations": normalizations,
+        "cache_keys": cache_keys,
+        "duplicate_of": duplicate_of,
+    }
 
-            if enc not in aggregate.keys():
-                aggregate[enc] = {}
-                aggregate_log = "{}_aggregate.txt".format(enc_path.stem)
-                aggregate[enc]["log"] = log_dir.joinpath(aggregate_log)
-                aggregate[enc]["file_size"] = Path(enc).stat().st_size
-                aggregate[enc]["score"] = 0
 
-        except OSError as ose:
-            print(ose)
-            exit(1)
+def main():
+    curdir = None
+    if getattr(sys, "frozen", False):
+        curdir = Path(sys.executable).parent
+    elif __file__:
+        curdir = Path(os.getcwd())
+
+    # Parse command line arguments
+    args = parse_arguments(curdir)
+
+    # Workers only run the calculations a coordinator hands out to them
+    if args.Worker:
+        path_map = [tuple(pair.split("=", 1)) for pair in args.Path_Map if "=" in pair]
+        worker = VMAF_Worker(args.Worker, ffmpeg=args.FFmpeg, slots=args.Processes, path_map=path_map)
+        worker.run()
+        return
 
-        # Clean up the log path for windows systems
-        io[enc]["log_path"] = str(log_loc).replace("\\", "/")  # .replace(":", "\\:")
-        if io[enc]["status"] == "NOT STARTED":
-            Path(io[enc]["log_path"]).unlink(missing_ok=True)
-        # Save the libmvaf filter arguments and log path into the commands key
-        io[enc]["commands"] = "{}:log_path={}".format(tmp_filter, io[enc]["log_path"])
+    # Keep the models in their usual order, whatever order they were given in
+    models = {model: name for model, name in VMAF_MODELS.items() if model in args.Models}
 
-    # 2nd part of the libvmaf filter
-    tmp_filter = []
+    # Extra libvmaf features to calculate alongside the VMAF models
+    features = []
     # if args.psnr:
-    #     tmp_filter += "name=psnr_hvs:"
+    #     features.append("psnr_hvs")
     if args.SSIM:
-        tmp_filter.append("name=float_ssim")
+        features.append("float_ssim")
     if args.MS_SSIM:
-        tmp_filter.append("name=float_ms_ssim")
-    if args.Subsamples:
-        tmp_filter.append("n_subsample={}".format(args.Subsamples))
-    if args.Threads != 0:
-        tmp_filter.append("n_threads={}".format(args.Threads))
+        features.append("float_ms_ssim")
 
-    tmp_filter = ":feature={}".format("\\\\:".join(tmp_filter))
+    # Pair every reference video file with its encoded video files
+    try:
+        references = find_references(args)
+    except (OSError, ValueError) as e:
+        print(e)
+        exit(1)
+    if len(references) > 1:
+        print("Calculating {} reference video files with a shared queue.\n".format(len(references)))
+
+    # The media index and result cache are shared by every reference video file
+    media_index = VMAF_Media_Index(curdir.joinpath("vmaf_media_index.json"), get_ffprobe(args.FFmpeg))
+    history = VMAF_History(curdir.joinpath("vmaf_history.json"))
+    cache = None
+    if not args.No_Cache:
+        cache = VMAF_Result_Cache(args.Cache_Dir or curdir.joinpath("vmaf_cache"))
+
+    # Every reference video file keeps its own state, logs and results, in a
+    # folder of its own when there are several of them
+    contexts = []
+    out_dirs = []
+    for reference, encoded in references:
+        ref_args = copy(args)
+        ref_args.Reference = reference
+        ref_args.Encoded = encoded
+        out_dir = curdir
+        if len(references) > 1:
+            out_dir = curdir.joinpath("{}_results".format(Path(reference).stem))
+            while out_dir in out_dirs:
+                out_dir = out_dir.with_name(out_dir.name + "_")
+        out_dirs.append(out_dir)
+        try:
+            contexts.append(open_reference(ref_args, out_dir, models, features, media_index, cache))
+        except OSError as ose:
+            print(ose)
+            if len(references) == 1:
+                exit(1)
+            print("Skipping reference video file {}.\n".format(reference))
+    if len(contexts) == 0:
+        print("None of the reference video files could be calculated. The program will now exit.")
+        exit(1)
 
-    # Combine all the filter arguments and save them for each enc-model dict
-    for enc in io.keys():
-        if io[enc]["status"] == "NOT STARTED":
-            io[enc]["commands"] += tmp_filter
-            # io[enc]["commands"] = repr(io[enc]["commands"])
-            io[enc]["commands"] = (
-                "-threads {0} -filter_threads {0} -filter_complex_threads {0} [0:v:0]setpts=PTS-STARTPTS[ref];[1:v:0]setpts=PTS-STARTPTS,colorspace=ispace=bt709:iprimaries=bt709:itrc=bt709:irange=tv:space=bt709:primaries=bt709:trc=bt709:range=tv:format=yuv444p12:dither=fsb[cmp];[ref][cmp]"
-                + io[enc]["commands"]
-                + " -f null"
-            )
+    # Find the best split of processes and threads if requested. Every
+    # reference video file shares the same processes, so the first one's
+    # calibration is used for all of them.
+    if args.Autotune:
+        first = contexts[0]
+        run_autotune(first["args"], first["io"], models, features, history, first["ref_info"])
+        for ref_args in [args] + [ctx["args"] for ctx in contexts[1:]]:
+            ref_args.Processes = first["args"].Processes
+            ref_args.Threads = first["args"].Threads
+            ref_args.Filter_Threads = first["args"].Filter_Threads
 
     # Create input arguments, are just related to decoding the reference and
     # encoded video files
@@ -453,153 +3354,391 @@ def main():
     if args.HWaccel:
         decode += " -hwaccel auto"
 
+    # Hand every local FFmpeg process one of the worker slots, pinned to the
+    # slot's own CPUs if requested
+    cpu_slots = None
+    if not args.Coordinator:
+        cpu_sets = None
+        if args.Pin_CPUs:
+            cpu_sets = plan_cpu_sets(args.Processes, read_numa_nodes())
+            print("Pinning worker slots to CPUs:")
+            for slot, cpus in enumerate(cpu_sets):
+                print("\tSlot {}: {}".format(slot, format_cpu_list(cpus)))
+        cpu_slots = VMAF_CPU_Slots(args.Processes, cpu_sets)
+
+    # Planning never runs a calculation
+    engine, cf_handler = None, None
+    if not args.Plan:
+        engine, cf_handler = create_engine(args, cpu_slots)
+
+    # Start FFmpeg processes only while the system has room for them, learning
+    # their peak memory as they run
+    admission = None
+    if args.Admission and not args.Coordinator and not args.Plan:
+        admission = VMAF_Admission(
+            args.Memory_Limit * 1024 * 1024,
+            args.Load_Limit,
+            history=history,
+        )
+
+    jobs = []
+    for ctx in contexts:
+        ref_args, io, aggregate, state = ctx["args"], ctx["io"], ctx["aggregate"], ctx["state"]
+        ref_info, duplicate_of = ctx["ref_info"], ctx["duplicate_of"]
+
+        # Screen every encoded video file first, and only calculate the
+        # finalists in full
+        if args.Two_Stage:
+            try:
+                run_screening(
+                    ref_args,
+                    io,
+                    aggregate,
+                    models,
+                    ref_info,
+                    decode,
+                    engine,
+                    cf_handler,
+                    skip=duplicate_of,
+                    admission=admission,
+                )
+            except (KeyboardInterrupt, Exception):
+                print_exc()
+                shutdown_engine(engine, cf_handler, cancel=True)
+                close_states(contexts)
+                exit(1)
+            state.save(io)
+
+        # Estimate the scores from samples instead of calculating them in full
+        if args.Estimate:
+            try:
+                run_estimation(
+                    ref_args,
+                    io,
+                    aggregate,
+                    models,
+                    features,
+                    ref_info,
+                    decode,
+                    engine,
+                    cf_handler,
+                    duplicate_of=duplicate_of,
+                    admission=admission,
+                )
+            except (KeyboardInterrupt, Exception):
+                print_exc()
+                shutdown_engine(engine, cf_handler, cancel=True)
+                close_states(contexts)
+                exit(1)
+            state.save(io)
+
+        # Split the calculations into segments if requested
+        plan_encoded_segments(ref_args, io, ctx["out_dir"], ref_info)
+        plan_checkpoints(ref_args, io, ctx["out_dir"])
+
+        ctx["batch_size"] = get_batch_size(ref_args, ref_info)
+        ctx_jobs, ctx["claimed"] = create_jobs(
+            ref_args, io, io.keys(), state, ref_info, ctx["normalizations"], duplicate_of, ctx["batch_size"]
+        )
+        for job in ctx_jobs:
+            job["ctx"] = ctx
+            for part in job["parts"]:
+                part["ctx"] = ctx
+        jobs.extend(ctx_jobs)
+
+    # Start the most expensive calculations first, between all reference video
+    # files at once so no process sits idle at the end of each of them
+    jobs = schedule_jobs(args, jobs, models, features, media_index)
+
+    # Run many short calculations in each FFmpeg process, so starting FFmpeg
+    # does not take longer than the calculations themselves
+    if args.Clip_Batch > 1:
+        jobs = batch_clips(args, jobs, models, features, history)
+
+    if args.Plan:
+        run_plan(args, jobs, models, features, decode, history)
+        close_states(contexts)
+        return
+
+    # Racing and watching only ever have a single reference video file
+    io, aggregate, state = contexts[0]["io"], contexts[0]["aggregate"], contexts[0]["state"]
+    ref_info, normalizations = contexts[0]["ref_info"], contexts[0]["normalizations"]
+    cache_keys, duplicate_of, claimed = contexts[0]["cache_keys"], contexts[0]["duplicate_of"], contexts[0]["claimed"]
+
+    # Race every claimed encoded video file against each other, and against
+    # the full results of the ones that are already finished
+    race = None
+    race_model, race_name = list(models.items())[0]
+    if args.Race:
+        race = VMAF_Race(args.Race_Top, args.Race_Target, args.Race_Confidence, args.Race_Min_Segments)
+        for enc, data in io.items():
+            if race_model in data.get("scores", {}):
+                race.add_result(enc, data["scores"][race_model])
+        for enc in claimed:
+            if "segments" not in io[enc]:
+                continue
+            race.add_candidate(enc, len(io[enc]["segments"]))
+            for seg in io[enc]["segments"]:
+                if seg["status"] == "DONE":
+                    race.add_segment(enc, read_race_scores(seg["log_path"], args.Log_Format, race_name))
+
+        # Calculate segments spread over the whole timeline first, so every
+        # encoded video file gets an early estimate of its score
+        count = max([len(io[enc].get("segments", [])) for enc in claimed] + [0])
+        rank = {seg_idx: i for i, seg_idx in enumerate(spread_order(count))}
+        jobs.sort(key=lambda job: rank.get(job["parts"][0]["segment"], len(rank)))
+
+    # Live frame counts of every job, parsed from FFmpeg's progress output
+    progress = VMAF_Progress()
+
+    # Start a second copy of every straggling job once the last jobs leave
+    # processes idle, expecting the throughput of earlier runs until jobs of
+    # this run finish
+    speculator = None
+    if args.Speculate:
+        rate = predict_rate(
+            history,
+            autotune_key(ref_info["width"], ref_info["height"], models, features, args.Subsamples),
+            args.Processes,
+            estimate_cost(1, ref_info["width"], ref_info["height"], len(models), features, args.Subsamples),
+        )
+        speculator = VMAF_Speculator(rate[0] if rate is not None else None, args.Straggler_Ratio)
+
     # Holds the concurrent.futures.Future objects from the ThreadPoolExecutor's
-    # submit calls as keys, with the encoded video file name and VMAF model
-    # name as values
+    # submit calls as keys, with the job's parts as values
     my_ffs = {}
 
-    # Used to count how many models have been processed for a given encoded
-    # video file
+    # Used to count how many encoded video files have been fully processed
     enc_finished = 0
-    print_dict(io)
+    enc_raced = 0
+    raced_logs = []
+
+    # Tasks that lost against their speculative duplicate, or the other way
+    # around
+    lost = set()
+    enc_total = 0
+    for ctx in contexts:
+        enc_total += len(ctx["claimed"])
+        enc_total += len([enc for enc in ctx["duplicate_of"].values() if enc in ctx["claimed"]])
+        print_dict(ctx["io"])
 
     # Semi-global check if the Futures were cancelled
     # If this is set to True at any point, then we stop writing any aggregate
     # score files and do not move the video files
     was_cancelled = False
 
-    cf_handler = cf.ThreadPoolExecutor(max_workers=args.Processes)
-    start = time()
-    try:
-        # For every encoded video file
-        for enc, data in io.items():
-            # For every model to test the encoded video with
-            if io[enc]["status"] in ["DONE", "MOVED"]:
-                continue
+    def submit_jobs(jobs):
+        """Submit every job to the engine, returning their tasks."""
+        tasks = set()
+        for job in jobs:
+            job_id = len(my_ffs)
+            ctx = job["ctx"]
             # Submit an ffmpy task to the pool
-            msg = "Submitting VMAF calculation:\n\tReference: {}\n\tEncoded: {}\n\tLog File: {}\n"
-            print(
-                msg.format(
-                    args.Reference,
-                    enc,
-                    io[enc]["log_path"],
-                )
-            )
+            msg = "Submitting VMAF calculation:\n"
+            for clip in job_clips(job):
+                msg += "\tReference: {}\n".format(clip["reference"])
+                for part in clip["parts"]:
+                    msg += "\tEncoded: {}\n\tLog File: {}\n".format(part["enc"], part["log_path"])
+                    msg += "\t{}\n".format(format_normalization(clip["ctx"]["normalizations"][part["enc"]]))
+                    if part["resume"] > 0:
+                        msg += "\tResuming after the {} frames of its checkpoints\n".format(part["resume"])
+            print(msg)
 
             # Create the ffmpy.FFmpeg class containing the inputs and output
             # commands
-            ff_tmp = ffmpy.FFmpeg(
-                executable=args.FFmpeg,
-                global_options=[
-                    "-hide_banner",
-                ],
-                inputs={enc: decode, str(args.Reference): decode},
-                outputs={"-": str(data["commands"].format(args.Threads))},
-            )
+            ff_tmp = create_job_ffmpeg(args, job, ctx["normalizations"], models, features, decode)
 
             print(ff_tmp.cmd + "\n")
-            exit()
-
-            # Submit the actual run Future as a key
-            my_ffs[
-                cf_handler.submit(
-                    ff_tmp.run,
-                    stdout=sp.PIPE,
-                    stderr=sp.PIPE,
-                )
-            ] = {
+
+            label = ", ".join([Path(part["enc"]).stem for part in job["parts"]])
+            if job["parts"][0]["segment"] is not None:
+                label += " (segment {})".format(job["parts"][0]["segment"])
+            if job.get("speculative"):
+                label += " (speculative)"
+            progress.add_job(job_id, label, job["frames"])
+
+            # Submit the actual run Future as a key, where every clip of a
+            # clip batch decodes its own reference video
+            ticket = create_ticket(
+                admission, ctx["ref_info"], models, features, len(job["parts"]) + len(job_clips(job)) - 1
+            )
+            usage = {}
+            task = submit_ffmpeg(
+                args,
+                engine,
+                cf_handler,
+                ff_tmp,
+                [part["log_path"] for part in job["parts"]],
+                on_stdout=progress.callback(job_id),
+                ticket=ticket,
+                cpu_slots=cpu_slots,
+                key=job_id,
+                usage=usage,
+            )
+            my_ffs[task] = {
+                "id": job_id,
                 "ff": ff_tmp,
-                "enc": enc,
+                "job": job,
+                "parts": job["parts"],
+                "ticket": ticket,
+                "usage": usage,
+                "ctx": ctx,
             }
-            io[enc]["status"] = "STARTED"
-
-        # After submitting all tasks, have a tqdm progress bar measure the progress
-        with tqdm(
-            desc="Processing VMAF calculations",
-            total=len(my_ffs),
-            unit="reports",
-            position=0,
-            leave=True,
-        ) as pbar:
-            pbar.set_postfix({"Encoded videos finished": "0 : 0%"})
-            # Wait and iterate over completed Futures
-            for task in cf.as_completed(my_ffs):
-                # Dict containing the "enc" and "model" keys
-                out = my_ffs[task]
-                enc = out["enc"]
-
-                io[enc]["status"] = "DONE"
+            for part in job["parts"]:
+                if part["segment"] is not None:
+                    part["ctx"]["io"][part["enc"]]["segments"][part["segment"]]["status"] = "STARTED"
+                part["ctx"]["io"][part["enc"]]["status"] = "STARTED"
+            tasks.add(task)
+        return tasks
+
+    # Keep calculating new encoded video files as they appear
+    watcher = None
+    results_file = curdir.joinpath("logs", "vmaf_results.jsonl")
+    if args.Watch:
+        watcher = VMAF_Folder_Watcher(
+            [args.Encoded],
+            ENCODED_EXTS,
+            settle=args.Watch_Settle,
+            interval=args.Watch_Interval,
+            polling=args.Watch_Polling,
+            ignore=[curdir.joinpath("logs")],
+        )
+        print(
+            "Watching {} for new encoded video files by {}.\n".format(
+                args.Encoded, "inotify" if watcher.uses_inotify else "polling"
+            )
+        )
+        # Being stopped as a service cancels like Ctrl+C does
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
 
-                # Contains the actual stdout and stderr of the ffmpy call
-                # In our case we only need the stderr
-                err = task.result()[1]
-
-                # Prepare the output message for this enc-model combination
-                # msg = "\tVMAF Model: {}\n".format(model)
-                log_path = str(Path(io[enc]["log_path"]))
-                msg = "\tLog Location: {}\n".format(log_path.replace("\\:", ":").replace('"', "/"))
-
-                # Look for the average VMAF score given in the stderr
-                for line in err.decode("utf-8").split("\n"):
-                    if "VMAF score" in line:
-                        vmaf_score = float(line.split("]")[1].split(": ")[1].strip())
-                        # Set the score for this enc-model combination
-                        io[enc]["score"] = vmaf_score
-                        # Add this score to the overall score of the enc video
-                        # file between all models
-                        aggregate[enc]["score"] += vmaf_score
-                        msg += "\tVMAF Score: {}\n\n".format(vmaf_score)
-                        break
-
-                # Save the enc-model output message for later
-                io[enc]["msg"] = msg
-
-                # Since we just finished using a model on this specific enc
-                # video file, we increment the counter for the number of models
-                # completed for this enc file
-                # If we've finished testing all models against this enc, then
-                # we can save the aggregate statistics and move the video file
-                # to the log location
-                enc_finished += 1
-                pbar.set_postfix(
-                    {"Encoded videos finished": str("{} : {}%".format(enc_finished, enc_finished / io.keys() * 100))}
-                )
-                # Move the enc video file to the log location
-                enc_path = Path(enc)
-                enc_path_new = aggregate[enc]["log"].parent.joinpath(enc_path.name)
-                enc_path.replace(enc_path_new)
-
-                # Get the average VMAF score between all model files
-                aggregate[enc]["score"] /= len(io[enc].keys())
-
-                # Save score to aggregate enc's output message
-                tmp_msg = "Average VMAF Score between all tested VMAF models is {}\n"
-                aggregate[enc]["msg"] = tmp_msg.format(aggregate[enc]["score"])
-
-                # Open the aggregate statistics file for writing to
-                with open(aggregate[enc]["log"], "w") as aggregate_file:
-                    for model in models.keys():
-                        # Write the average score for each model to the
-                        # aggregate log file
-                        tmp_msg = "{} Score: {}\n"
-                        aggregate_file.write(tmp_msg.format(model, io[enc][model]["score"]))
-
-                    # Write average VMAF score to aggregate log file
-                    tmp_msg = "\nAverage Score: {}\n"
-                    aggregate_file.write(tmp_msg.format(aggregate[enc]["score"]))
-
-                    # Convert file size to a more human-readable format
-                    size_converted = bytes2human(aggregate[enc]["file_size"])
-
-                    # Write the size in bytes & the size in human-readable
-                    # format to the aggregate log file
-                    tmp_msg = "File Size: {}B = {}\n"
-                    aggregate_file.write(tmp_msg.format(aggregate[enc]["file_size"], size_converted))
-
-                for model in models.keys():
-                    io[enc][model]["status"] = "MOVED"
-                pbar.update()
+    start = time()
+    try:
+        submit_jobs(jobs)
+
+        # After submitting all tasks, show the frames processed by every job
+        # until all of them have finished
+        with VMAF_Progress_Display(progress) as display:
+            display.set_postfix({"Encoded videos finished": "0 : 0%"})
+            pending = set(my_ffs.keys())
+            while len(pending) > 0 or watcher is not None:
+                done = set()
+                if len(pending) > 0:
+                    done, pending = cf.wait(pending, timeout=1, return_when=cf.FIRST_COMPLETED)
+                for task in done:
+                    if task in lost:
+                        continue
+                    # The first of a straggling job and its speculative
+                    # duplicate to finish wins, and the other one is stopped
+                    if speculator is not None and speculator.partner(task) is not None:
+                        loser, finished = stop_speculation(speculator, task, my_ffs, engine, progress)
+                        lost.add(loser)
+                        pending.discard(loser)
+                        if not finished:
+                            continue
+                    # A job that ran into the timeout only stops itself
+                    if is_timed_out(task):
+                        duplicate = speculator is not None and speculator.is_duplicate(task)
+                        stop_timed_out(args, task, my_ffs[task], progress, keep=not duplicate)
+                        continue
+                    # Contains the actual stdout and stderr of the ffmpy call
+                    # In our case we only need the stderr
+                    err = task.result()[1]
+                    progress.finish_job(my_ffs[task]["id"])
+                    enc_finished += finish_task(
+                        args,
+                        my_ffs[task],
+                        err,
+                        models,
+                        features,
+                        history,
+                        cache,
+                        race=race,
+                        speculator=speculator,
+                        results_file=results_file if watcher is not None else None,
+                    )
+                    display.set_postfix(
+                        {"Encoded videos finished": "{} : {}%".format(enc_finished, enc_finished / enc_total * 100)}
+                    )
 
+                # Start a speculative duplicate of the straggling jobs on the
+                # processes the last jobs leave idle
+                if speculator is not None and 0 < len(pending) < args.Processes:
+                    running = {}
+                    for task in pending:
+                        job_progress = progress.get_job(my_ffs[task]["id"])
+                        if job_progress is None or job_progress["started"] is None:
+                            continue
+                        running[task] = {
+                            "cost": my_ffs[task]["job"]["cost"],
+                            "frame": job_progress["frame"],
+                            "total": job_progress["total"],
+                            "elapsed": time() - job_progress["started"],
+                        }
+                    for task in speculator.find_stragglers(running, args.Processes - len(pending)):
+                        msg = "Calculating {} is straggling at frame {} of {} after {}, "
+                        msg += "starting a speculative duplicate of it.\n"
+                        print(
+                            msg.format(
+                                ", ".join([Path(part["enc"]).stem for part in my_ffs[task]["parts"]]),
+                                running[task]["frame"],
+                                running[task]["total"],
+                                timedelta(seconds=round(running[task]["elapsed"])),
+                            )
+                        )
+                        duplicate = submit_jobs([speculative_job(my_ffs[task]["job"])]).pop()
+                        speculator.add_duplicate(task, duplicate)
+                        pending.add(duplicate)
+
+                # Stop every encoded video file that can no longer win the race
+                if race is not None:
+                    stopped, raced, logs = stop_race_losers(
+                        race, io, aggregate, models, my_ffs, pending, engine, progress, duplicate_of
+                    )
+                    pending -= stopped
+                    raced_logs.extend(logs)
+                    if len(raced) > 0:
+                        enc_raced += len(raced)
+                        display.set_postfix({"Encoded videos raced": str(enc_raced)})
+                        state.save(io, set(raced))
+
+                # Add the encoded video files that appeared since the last look,
+                # waiting for them while there is nothing else to do
+                if watcher is not None:
+                    files = watcher.wait(0.0 if len(pending) > 0 else 1.0)
+                    new = add_watched_files(
+                        args,
+                        io,
+                        aggregate,
+                        files,
+                        curdir,
+                        media_index,
+                        ref_info,
+                        normalizations,
+                        models,
+                        features,
+                        cache,
+                        cache_keys,
+                        duplicate_of,
+                    )
+                    if len(new) > 0:
+                        state.reset(new)
+                        state.save(io, new)
+                        for enc in new:
+                            if io[enc]["status"] in ["MOVED", "REJECTED"]:
+                                publish_result(results_file, io, aggregate, enc)
+                        new_jobs, new_claimed = create_jobs(
+                            args, io, new, state, ref_info, normalizations, duplicate_of, contexts[0]["batch_size"]
+                        )
+                        for job in new_jobs:
+                            job["ctx"] = contexts[0]
+                            for part in job["parts"]:
+                                part["ctx"] = contexts[0]
+                        new_jobs = schedule_jobs(args, new_jobs, models, features, media_index)
+                        pending |= submit_jobs(new_jobs)
+                        enc_total += len(new_claimed)
+                        enc_total += len([enc for enc in duplicate_of.values() if enc in new_claimed])
+                        state.save(io, new)
+                display.refresh()
     # All exceptions try to cancel the existing tasks in the pool and will exit
     # the program afterwards.
     except (KeyboardInterrupt, cf.CancelledError, ffmpy.FFRuntimeError, Exception) as e:
@@ -607,35 +3746,47 @@ def main():
             print("KeyboardInterrupt detected, working on shutting down pool...")
         else:
             print_exc()
-        was_cancelled = True
-        cf_handler.shutdown(wait=False, cancel_futures=True)
-        cancellations = {task: False for task in my_ffs.keys()}
-        while not any([item for item in cancellations.values()]):
-            for task, info in my_ffs.items():
-                enc = info["enc"]
-                model = info["model"]
-                # If the task is still running, or if it finished but was cancelled,
-                # or if it raised an exception, then we cancel the task
-                if task.running() or (task.done() and task.cancelled()) or task.exception():
-                    if info["ff"].process:
-                        print("Shutting down {}...".format(info["ff"].process.pid))
-                        while info["ff"].process.poll() is None:
-                            info["ff"].process.terminate()
-                            info["ff"].process.kill()
-                            info["ff"].process.wait()
-                        if io[enc][model]["status"] not in ["DONE", "MOVED"]:
-                            time.sleep(0.5)
-                            print("\tDeleting related log file:\n\t{}...".format(Path(io[enc][model]["log_path"])))
-                            Path(io[enc][model]["log_path"]).unlink(missing_ok=True)
-                        cancellations[task] = True
-                    if io[enc][model]["status"] not in ["DONE", "MOVED"]:
-                        io[enc][model]["status"] = "CANCELLED"
-        del cancellations
+        # Stopping a watching calculator while it has nothing to calculate is
+        # how it normally ends
+        was_cancelled = not (
+            watcher is not None and type(e) is KeyboardInterrupt and all([task.done() for task in my_ffs.keys()])
+        )
+        shutdown_engine(engine, cf_handler, cancel=True)
+        for task, info in my_ffs.items():
+            # If the task is still running, or if it finished but was cancelled,
+            # or if it raised an exception, then we cancel the task
+            if info["ff"].process:
+                print("Shutting down {}...".format(info["ff"].process.pid))
+                # Stopping FFmpeg gracefully first lets it write the log of the
+                # frames it already calculated
+                if info["ff"].process.poll() is None:
+                    info["ff"].process.terminate()
+                    try:
+                        info["ff"].process.wait(KILL_GRACE)
+                    except sp.TimeoutExpired:
+                        info["ff"].process.kill()
+                        info["ff"].process.wait()
+            if isinstance(task, VMAF_Streamed_Future):
+                task.wait_closed()
+            # The original calculation keeps the checkpoints, and the
+            # duplicate only its own log file
+            duplicate = speculator is not None and speculator.is_duplicate(task)
+            stop_parts(args, info, "CANCELLED", keep=not duplicate, settle=0.5)
         print("Pool has shutdown, exiting...")
     else:
-        cf_handler.shutdown()
+        shutdown_engine(engine, cf_handler)
+
+    if watcher is not None:
+        watcher.close()
+
+    # Stopped calculations may still have written their logs while exiting
+    for task in my_ffs.keys():
+        if isinstance(task, VMAF_Streamed_Future):
+            task.wait_closed()
+    for log_path in raced_logs:
+        Path(log_path).unlink(missing_ok=True)
 
-    write_state(args.Reference, io)
+    close_states(contexts)
     # If an exception occurred, then this will finish exiting the program
     if was_cancelled:
         exit(1)
@@ -645,17 +3796,39 @@ def main():
 
     # Show how long it took to run this entire program
     print("Program took {}".format(timedelta(seconds=total)))
-    time_avg = timedelta(seconds=total / len(my_ffs))
-    print("All calculations took an average of {}\n".format(time_avg))
+    if len(my_ffs) > 0:
+        time_avg = timedelta(seconds=total / len(my_ffs))
+        print("All calculations took an average of {}\n".format(time_avg))
+    if cpu_slots is not None and len(my_ffs) > 0:
+        print_slot_stats(cpu_slots, progress, [info["id"] for info in my_ffs.values()])
+    if speculator is not None and speculator.stats["launched"] > 0:
+        stats = speculator.stats
+        msg = "Started {} speculative duplicates of straggling calculations, {} of them finished first, "
+        msg += "and {} copies of these calculations failed.\n"
+        msg += "\tUsed: the duplicates ran for {}, of which {} was wasted on duplicates that lost or failed.\n"
+        msg += "\tDiscarded: the calculations replaced by their duplicates had run for {}.\n"
+        print(
+            msg.format(
+                stats["launched"],
+                stats["won"],
+                stats["failed"],
+                timedelta(seconds=round(stats["used"])),
+                timedelta(seconds=round(stats["wasted"])),
+                timedelta(seconds=round(stats["discarded"])),
+            )
+        )
 
     # Print out all the relevant info to the user
     print("The scores are as follows:")
-    print("Reference: {}".format(args.Reference))
-    for enc, models in io.items():
-        print("Encoded: {}".format(enc))
-        print(aggregate[enc]["msg"])
-        for model in models.keys():
-            print(io[enc][model]["msg"])
+    for ctx in contexts:
+        io, aggregate = ctx["io"], ctx["aggregate"]
+        print("Reference: {}".format(ctx["args"].Reference))
+        for enc in io.keys():
+            if enc not in aggregate or "msg" not in io[enc]:
+                continue
+            print("Encoded: {}".format(enc))
+            print(aggregate[enc]["msg"])
+            print(io[enc]["msg"])
 
 
 if __name__ == "__main__":
@@ -0,0 +1,152 @@
+import re
+from pathlib import Path
+from typing import Optional
+
+from vmaf_log_merger import merge_logs, read_frames, write_frames
+
+
+def checkpoint_path(
+    log_path: str,
+    index: int,
+) -> str:
+    """Location of a calculation's checkpoint with the given index, next to its log file."""
+    log = Path(log_path)
+    return str(log.with_name("{}.ckpt{:03d}{}".format(log.stem, index, log.suffix))).replace("\\", "/")
+
+
+def checkpointed_frames(unit: dict) -> int:
+    """Number of frames at the start of a calculation that its checkpoints already hold."""
+    return sum([checkpoint["frames"] for checkpoint in unit.get("checkpoints", [])])
+
+
+def resume_segment(
+    segment: dict,
+    done: int,
+) -> dict:
+    """Move the start of a segment past the frames its checkpoints already hold."""
+    if done <= 0:
+        return segment
+    return {
+        "start_frame": segment["start_frame"] + done,
+        "frames": segment["frames"] - done if segment["frames"] is not None else None,
+    }
+
+
+def save_checkpoint(
+    unit: dict,
+    log_path: str,
+    log_format: str,
+    frames: Optional[int] = None,
+    subsample: Optional[int] = 1,
+) -> int:
+    """Keep the frames a cancelled calculation already calculated as a new checkpoint of it.
+
+    FFmpeg flushes libvmaf's log when it is stopped gracefully, so the log of
+    a cancelled calculation usually holds every frame calculated until then.
+    Only the unbroken run of frames from the start of the log with the same
+    metrics as its first frame is kept, which leaves out anything a forced
+    kill cut short. libvmaf only logs every "subsample"th frame, so the
+    checkpoint covers every frame up to the next logged one, and the resumed
+    calculation starts on a multiple of the subsampling and logs the same
+    frames it would have without the checkpoint. The checkpoint is added to
+    the unit's "checkpoints", with the number of frames it covers.
+
+    Args:
+        unit (dict): The calculation, an encoded video file's io entry or one of its segments.
+        log_path (str): Log file the cancelled calculation wrote, which is removed.
+        log_format (str): Format of the log file.
+        frames (Optional[int]): Number of frames the cancelled calculation was calculating, to always leave at least
+            one of them to calculate. Defaults to None for the rest of the video.
+        subsample (Optional[int]): libvmaf's n_subsample the calculation used. Defaults to 1.
+
+    Returns:
+        int: Number of frames the checkpoint covers, 0 if the log held none that could be used.
+    """
+    stride = max(1, subsample or 1)
+    try:
+        header, logged = read_frames(log_path, log_format)
+    except Exception:
+        logged = []
+
+    kept = []
+    for num, metrics in logged:
+        if num != len(kept) * stride or metrics.keys() != logged[0][1].keys():
+            break
+        kept.append((num, metrics))
+    if frames is not None:
+        kept = kept[: max(0, (frames - 1) // stride)]
+    covered = len(kept) * stride
+
+    # A resumed calculation already writes to the location of its next
+    # checkpoint, which is then simply rewritten with the frames kept
+    path = checkpoint_path(unit["log_path"], len(unit.get("checkpoints", [])))
+    if len(kept) > 0:
+        write_frames(path, log_format, header, kept)
+        unit.setdefault("checkpoints", []).append({"log_path": path, "frames": covered, "subsample": stride})
+    if len(kept) == 0 or Path(log_path) != Path(path):
+        Path(log_path).unlink(missing_ok=True)
+    return covered
+
+
+def finish_checkpoints(
+    unit: dict,
+    log_path: str,
+    log_format: str,
+) -> dict:
+    """Merge the checkpoints of a resumed calculation and the log of its last run into the calculation's log file.
+
+    Args:
+        unit (dict): The calculation, with its "checkpoints" and "log_path".
+        log_path (str): Log file of the run that calculated the rest of the frames.
+        log_format (str): Format of every log file.
+
+    Returns:
+        dict: The pooled metrics of the merged log.
+    """
+    logs = []
+    done = 0
+    for checkpoint in unit.pop("checkpoints", []):
+        logs.append((checkpoint["log_path"], done))
+        done += checkpoint["frames"]
+    logs.append((log_path, done))
+    return merge_logs(logs, unit["log_path"], log_format)
+
+
+def check_checkpoints(
+    unit: dict,
+    subsample: Optional[int] = 1,
+):
+    """Forget the checkpoints of a calculation if any of them went missing or used a different libvmaf n_subsample.
+
+    Checkpoints only work as a whole, and only continue a calculation that
+    logs the same frames.
+    """
+    stride = max(1, subsample or 1)
+    checkpoints = unit.get("checkpoints", [])
+    if any([not Path(checkpoint["log_path"]).exists() for checkpoint in checkpoints]):
+        unit.pop("checkpoints", None)
+    elif any([checkpoint.get("subsample", 1) != stride for checkpoint in checkpoints]):
+        unit.pop("checkpoints", None)
+
+
+def remove_stale_checkpoints(
+    log_dir: Path,
+    stem: str,
+    log_format: str,
+    keep: list,
+):
+    """Delete the checkpoints of an encoded video file and its segments that are no longer part of its calculation.
+
+    Args:
+        log_dir (Path): Directory of the log files.
+        stem (str): Name of the encoded video file without its extension.
+        log_format (str): Format of the log files.
+        keep (list): Locations of the checkpoints still in use.
+    """
+    if not log_dir.exists():
+        return
+    pattern = re.compile(r"{}(\.seg\d+)?\.ckpt\d+\.{}".format(re.escape(stem), re.escape(log_format)))
+    keep = set([str(Path(path)) for path in keep])
+    for file in log_dir.iterdir():
+        if pattern.fullmatch(file.name) and str(file) not in keep:
+            file.unlink(missing_ok=True)
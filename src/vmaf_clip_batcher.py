@@ -0,0 +1,128 @@
+import math
+from typing import Callable, Optional
+
+# Share of a clip batch's wall time that may go to the fixed overhead of its
+# process, like starting FFmpeg, opening the inputs and loading the models
+OVERHEAD_TARGET = 0.1
+
+# Number of finished jobs kept per workload and number of processes to
+# measure the overhead from
+OVERHEAD_SAMPLES = 200
+
+
+def record_job_time(
+    history,
+    key: str,
+    processes: int,
+    cost: float,
+    wall: float,
+):
+    """Add a finished job's estimated cost and wall time to the samples the per-process overhead is measured from.
+
+    Args:
+        history (VMAF_History): Persistent measurements of this host.
+        key (str): Workload description from autotune_key.
+        processes (int): Number of processes running at the same time.
+        cost (float): Estimated cost of the job from estimate_cost.
+        wall (float): Wall time of the job's process in seconds.
+    """
+    if wall is None or wall <= 0:
+        return
+    measured = dict(history.get("overhead", key, {}))
+    samples = list(measured.get(str(processes), [])) + [[cost, wall]]
+    measured[str(processes)] = samples[-OVERHEAD_SAMPLES:]
+    history.set("overhead", key, measured)
+
+
+def estimate_overhead(
+    history,
+    key: str,
+    processes: int,
+) -> Optional[tuple]:
+    """Measure the fixed overhead of a process, and the seconds every unit of cost takes on top of it.
+
+    A straight line is fitted through the wall times of earlier jobs of the
+    same workload against their cost, so its intercept is the time a process
+    takes no matter how little it calculates.
+
+    Args:
+        history (VMAF_History): Persistent measurements of this host.
+        key (str): Workload description from autotune_key.
+        processes (int): Number of processes running at the same time.
+
+    Returns:
+        Optional[tuple]: The overhead and the seconds per unit of cost, or None until jobs of clearly different
+            costs were measured.
+    """
+    samples = history.get("overhead", key, {}).get(str(processes), [])
+    if len(samples) < 3:
+        return None
+    costs = [sample[0] for sample in samples]
+    walls = [sample[1] for sample in samples]
+    mean_cost = sum(costs) / len(costs)
+    mean_wall = sum(walls) / len(walls)
+    variance = sum([(cost - mean_cost) ** 2 for cost in costs])
+    # Jobs that all cost about the same can not tell the overhead apart
+    # from the calculation itself
+    if mean_cost <= 0 or math.sqrt(variance / len(costs)) < mean_cost * 0.1:
+        return None
+    slope = sum([(cost - mean_cost) * (wall - mean_wall) for cost, wall in zip(costs, walls)]) / variance
+    if slope <= 0:
+        return None
+    return max(0.0, mean_wall - slope * mean_cost), slope
+
+
+def clip_batch_size(
+    overhead: Optional[tuple],
+    clip_cost: float,
+    limit: int,
+    target: Optional[float] = OVERHEAD_TARGET,
+) -> int:
+    """Find the fewest clips per process that keep the process's overhead below the target share of its wall time.
+
+    Args:
+        overhead (Optional[tuple]): Overhead and seconds per unit of cost from estimate_overhead, or None to use
+            the limit.
+        clip_cost (float): Typical estimated cost of a single clip.
+        limit (int): Largest number of clips per process.
+        target (Optional[float]): Share of the wall time the overhead may take. Defaults to OVERHEAD_TARGET.
+
+    Returns:
+        int: Number of clips per process.
+    """
+    if overhead is None or clip_cost <= 0:
+        return max(1, limit)
+    seconds, per_cost = overhead
+    size = math.ceil(seconds * (1 - target) / (target * per_cost * clip_cost))
+    return max(1, min(limit, size))
+
+
+def group_clips(
+    clips: list,
+    size: int,
+    files: Callable[[dict], set],
+) -> list:
+    """Split clips into groups of up to size clips, in their given order.
+
+    FFmpeg opens every input file once per process, so a clip only joins a
+    group that does not use any of its files yet.
+
+    Args:
+        clips (list): Clips to group.
+        size (int): Largest number of clips per group.
+        files (Callable[[dict], set]): Gives the files a clip uses.
+
+    Returns:
+        list: Lists of clips.
+    """
+    groups = []
+    for clip in clips:
+        clip_files = files(clip)
+        for group in groups:
+            if len(group["clips"]) < size and group["files"].isdisjoint(clip_files):
+                group["clips"].append(clip)
+                group["files"] |= clip_files
+                break
+        else:
+            groups.append({"clips": [clip], "files": set(clip_files)})
+    return [group["clips"] for group in groups]
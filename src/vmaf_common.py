@@ -1,12 +1,20 @@
 # import concurrent.futures as cf
 import configparser as confp
 import datetime as dt
+import os
 import sys
 from itertools import chain
 from pathlib import Path
 from string import digits
 from typing import Iterable, Literal, Optional, Union
 
+# Extensions of the files that are treated as encoded video files
+ENCODED_EXTS = ["mkv", "mp4"]
+
+# Extensions of the files that are treated as reference video files when
+# looking inside a directory of them
+REFERENCE_EXTS = ["mkv", "mp4", "webm", "avi", "y4m"]
+
 
 def print_dict(
     item,
@@ -119,11 +127,11 @@ def search_handler(
             print("looking inside {}".format(item_path))
             if item_path.is_dir():
                 # Scan for MKV and MP4 files
-                return list(find_by_exts(item_path, exts=["mkv", "mp4"], rec=recurse, should_print=False))
+                return list(find_by_exts(item_path, exts=ENCODED_EXTS, rec=recurse, should_print=False))
             # If the given dist is a file, return it
             elif item_path.is_file():
                 # Naive method of checking if the file is a video
-                if item_path.suffix.lower() in [".mkv", ".mp4"]:
+                if item_path.suffix.lower().lstrip(".") in ENCODED_EXTS:
                     return [
                         item_path,
                     ]
@@ -190,6 +198,21 @@ def bytes2human(
     return format % dict(symbol=symbols[0], value=n)
 
 
+def get_available_memory() -> Optional[int]:
+    """Get the amount of system memory that is currently available in bytes, or None if it can not be determined."""
+    try:
+        with open("/proc/meminfo", "r") as meminfo:
+            for line in meminfo:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_AVPHYS_PAGES")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
 class VMAF_Timer:
     def __init__(self):
         self._start = dt.datetime.now()
@@ -229,3 +252,8 @@ class VMAF_Timer:
             msg += "{} minutes, ".format(int(minutes))
         msg += "{} seconds".format(seconds)
         return msg
+
+
+def escape_filter_value(value) -> str:
+    """Escape a value so it can be used as a quoted option inside an FFmpeg filter graph."""
+    return str(value).replace("\\", "/").replace(":", "\\:").replace("'", "\\'")
@@ -0,0 +1,575 @@
+import base64
+import concurrent.futures as cf
+import json
+import os
+import queue
+import signal
+import socket
+import socketserver
+import subprocess as sp
+import tempfile
+import threading
+from collections import deque
+from pathlib import Path
+from time import sleep, time
+from typing import Callable, Optional
+
+import ffmpy
+
+from vmaf_common import escape_filter_value
+from vmaf_job_engine import VMAF_Job_Timeout, stream_process
+
+# Size of the raw log file chunks a worker sends back at a time
+LOG_CHUNK_SIZE = 256 * 1024
+
+
+def parse_address(address: str, default_host: Optional[str] = "127.0.0.1") -> tuple:
+    """Split a "HOST:PORT" (or just "PORT") address into a (host, port) tuple."""
+    host, _, port = str(address).rpartition(":")
+    return (host.strip("[]") or default_host, int(port))
+
+
+def _send(
+    sock: socket.socket,
+    lock: threading.Lock,
+    message: dict,
+):
+    data = (json.dumps(message) + "\n").encode("utf-8")
+    with lock:
+        sock.sendall(data)
+
+
+class _Worker_Connection:
+    """State the coordinator keeps for every connected worker slot."""
+
+    def __init__(self, sock: socket.socket, address: tuple):
+        self.sock = sock
+        self.address = address
+        self.name = "{}:{}".format(*address[:2])
+        self.lock = threading.Lock()
+        self.last_seen = time()
+        self.jobs = set()
+
+    def send(self, message: dict):
+        _send(self.sock, self.lock, message)
+
+    def close(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+class _Coordinator_Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        self.server.coordinator._handle(self)
+
+
+class VMAF_Coordinator:
+    """Hands out FFmpeg jobs to workers on other hosts or containers over a JSON lines TCP protocol.
+
+    It can be used in place of VMAF_Job_Engine: submit returns a
+    concurrent.futures.Future that resolves to the job's (stdout, stderr) bytes.
+    Every worker slot keeps one connection open, asks for a job whenever it is
+    idle and sends heartbeats and the job's progress lines while the job runs.
+    Once the job exits the worker sends back the contents of its log files,
+    which are written to the log paths given to submit. Jobs of a worker that
+    disconnects or stops sending heartbeats are put back at the front of the
+    queue for another worker.
+
+    Messages from a worker are "hello", "request", "heartbeat", "stdout",
+    "log" and "done". Messages to a worker are "job", "wait", "cancel" and
+    "shutdown".
+    """
+
+    def __init__(
+        self,
+        address: str,
+        heartbeat_timeout: Optional[float] = 30.0,
+    ):
+        self._heartbeat_timeout = heartbeat_timeout
+        self._lock = threading.Condition()
+        self._queue = deque()
+        self._jobs = {}
+        self._connections = set()
+        self._next_id = 0
+        self._closing = False
+
+        self._server = socketserver.ThreadingTCPServer(parse_address(address, "0.0.0.0"), _Coordinator_Handler)
+        self._server.daemon_threads = True
+        self._server.coordinator = self
+        self._server_thread = threading.Thread(target=self._server.serve_forever, name="VMAF_Coordinator", daemon=True)
+        self._server_thread.start()
+        self._reaper = threading.Thread(target=self._reap, name="VMAF_Coordinator_Reaper", daemon=True)
+        self._reaper.start()
+        print("Coordinator listening for workers on {}:{}\n".format(*self.get_address()))
+
+    def get_address(self) -> tuple:
+        return self._server.server_address[:2]
+
+    def get_max_jobs(self) -> int:
+        """Number of worker slots currently connected."""
+        with self._lock:
+            return len(self._connections)
+
+    def submit(
+        self,
+        cmd: list,
+        timeout: Optional[float] = None,
+        on_stdout: Optional[Callable[[str], None]] = None,
+        on_stderr: Optional[Callable[[str], None]] = None,
+        keep_lines: Optional[int] = 200,
+        logs: Optional[list] = None,
+        usage: Optional[dict] = None,
+    ) -> cf.Future:
+        """Queue a command for the next idle worker.
+
+        Args:
+            cmd (list): The command and its arguments, like ffmpy.FFmpeg._cmd. The executable is replaced by the
+                worker's own FFmpeg executable.
+            timeout (Optional[float]): Seconds the job may run on the worker before it is killed.
+            on_stdout (Optional[Callable[[str], None]]): Called from a coordinator thread for every stdout line.
+            on_stderr (Optional[Callable[[str], None]]): Called from a coordinator thread for every stderr line.
+            keep_lines (Optional[int]): Number of trailing lines of each stream kept for the result.
+            logs (Optional[list]): Log paths written by the command, each one used in the command in the escaped
+                form of escape_filter_value. Workers write them locally and send them back.
+            usage (Optional[dict]): Filled with the resource usage of the process on the worker once it exits.
+
+        Returns:
+            cf.Future: Resolves to the (stdout, stderr) bytes of the kept lines. Raises ffmpy.FFRuntimeError if the
+                command fails and VMAF_Job_Timeout if it timed out.
+        """
+        future = cf.Future()
+        with self._lock:
+            job_id = self._next_id
+            self._next_id += 1
+            self._jobs[job_id] = {
+                "cmd": list(cmd),
+                "timeout": timeout,
+                "keep_lines": keep_lines,
+                "on_stdout": on_stdout,
+                "on_stderr": on_stderr,
+                "logs": [str(log) for log in logs or []],
+                "usage": usage,
+                "future": future,
+                "worker": None,
+                "attempt": 0,
+            }
+            self._queue.append(job_id)
+            self._lock.notify_all()
+        return future
+
+    def _handle(self, handler: _Coordinator_Handler):
+        conn = _Worker_Connection(handler.connection, handler.client_address)
+        with self._lock:
+            self._connections.add(conn)
+        try:
+            for line in handler.rfile:
+                try:
+                    message = json.loads(line.decode("utf-8"))
+                except ValueError:
+                    continue
+                conn.last_seen = time()
+                if message.get("type") == "hello":
+                    conn.name = "{} ({}:{})".format(message.get("host", "?"), *conn.address[:2])
+                    print("Worker {} connected.".format(conn.name))
+                elif message.get("type") == "request":
+                    self._assign(conn)
+                elif message.get("type") in ["stdout", "stderr", "log", "done"]:
+                    self._receive(conn, message)
+        except OSError:
+            pass
+        finally:
+            with self._lock:
+                self._connections.discard(conn)
+            self._requeue(conn, "disconnected")
+
+    def _assign(self, conn: _Worker_Connection):
+        # Hold the request for a moment when the queue is empty, so idle
+        # workers do not hammer the coordinator with requests
+        deadline = time() + 1.0
+        with self._lock:
+            while True:
+                if self._closing:
+                    conn.send({"type": "shutdown"})
+                    return
+                while len(self._queue) > 0:
+                    job_id = self._queue.popleft()
+                    job = self._jobs[job_id]
+                    if job["future"].done() or (
+                        job["attempt"] == 0 and not job["future"].set_running_or_notify_cancel()
+                    ):
+                        self._jobs.pop(job_id, None)
+                        continue
+                    job["worker"] = conn
+                    job["attempt"] += 1
+                    job["received"] = {}
+                    conn.jobs.add(job_id)
+                    conn.send(
+                        {
+                            "type": "job",
+                            "job_id": job_id,
+                            "attempt": job["attempt"],
+                            "cmd": job["cmd"],
+                            "timeout": job["timeout"],
+                            "keep_lines": job["keep_lines"],
+                            "logs": [escape_filter_value(log) for log in job["logs"]],
+                        }
+                    )
+                    return
+                remaining = deadline - time()
+                if remaining <= 0:
+                    conn.send({"type": "wait"})
+                    return
+                self._lock.wait(remaining)
+
+    def _current_job(self, conn: _Worker_Connection, message: dict) -> Optional[dict]:
+        # Messages about a job that was since requeued belong to an old attempt
+        job = self._jobs.get(message.get("job_id"))
+        if job is None or job["worker"] is not conn or job["attempt"] != message.get("attempt"):
+            return None
+        return job
+
+    def _receive(self, conn: _Worker_Connection, message: dict):
+        with self._lock:
+            job = self._current_job(conn, message)
+        if job is None:
+            return
+
+        if message["type"] in ["stdout", "stderr"]:
+            callback = job["on_" + message["type"]]
+            if callback is not None:
+                for line in message["lines"]:
+                    callback(line)
+        elif message["type"] == "log":
+            log_path = job["logs"][message["index"]]
+            data = base64.b64decode(message["data"])
+            with open(log_path, "r+b" if message["offset"] > 0 else "wb") as writer:
+                writer.seek(message["offset"])
+                writer.write(data)
+        elif message["type"] == "done":
+            with self._lock:
+                self._jobs.pop(message["job_id"], None)
+                conn.jobs.discard(message["job_id"])
+            stdout = message.get("stdout", "").encode("utf-8")
+            stderr = message.get("stderr", "").encode("utf-8")
+            if job["future"].done():
+                return
+            if job["usage"] is not None and message.get("usage") is not None:
+                job["usage"].update(message["usage"])
+            if message.get("timed_out"):
+                job["future"].set_exception(
+                    VMAF_Job_Timeout(sp.list2cmdline(job["cmd"]), message.get("exit_code"), stdout, stderr)
+                )
+            elif message.get("exit_code") != 0:
+                job["future"].set_exception(
+                    ffmpy.FFRuntimeError(sp.list2cmdline(job["cmd"]), message.get("exit_code"), stdout, stderr)
+                )
+            else:
+                job["future"].set_result((stdout, stderr))
+
+    def _requeue(self, conn: _Worker_Connection, reason: str):
+        with self._lock:
+            job_ids = [job_id for job_id in conn.jobs if job_id in self._jobs]
+            conn.jobs.clear()
+            for job_id in reversed(job_ids):
+                job = self._jobs[job_id]
+                if job["worker"] is not conn:
+                    continue
+                job["worker"] = None
+                if job["future"].done():
+                    self._jobs.pop(job_id, None)
+                    continue
+                self._queue.appendleft(job_id)
+                print("Worker {} {}, requeueing job {}.".format(conn.name, reason, job_id))
+            self._lock.notify_all()
+
+    def _reap(self):
+        while True:
+            sleep(1.0)
+            now = time()
+            with self._lock:
+                stale = [
+                    conn
+                    for conn in self._connections
+                    if len(conn.jobs) > 0 and now - conn.last_seen > self._heartbeat_timeout
+                ]
+            for conn in stale:
+                # Closing the connection also makes a worker that is only
+                # stuck (and not dead) drop the job
+                self._requeue(conn, "stopped sending heartbeats")
+                conn.close()
+
+    def cancel(self, future: cf.Future) -> bool:
+        """Cancel a single job from submit, telling its worker to kill it if it is already running."""
+        with self._lock:
+            jobs = [(job_id, job) for job_id, job in self._jobs.items() if job["future"] is future]
+        for job_id, job in jobs:
+            self._cancel_job(job_id, job)
+        return future.cancelled() or len(jobs) > 0
+
+    def _cancel_job(self, job_id: int, job: dict):
+        if job["future"].cancel():
+            return
+        if job["worker"] is not None:
+            try:
+                job["worker"].send({"type": "cancel", "job_id": job_id, "attempt": job["attempt"]})
+            except OSError:
+                pass
+        if not job["future"].done():
+            job["future"].set_exception(cf.CancelledError())
+
+    def shutdown(
+        self,
+        cancel: Optional[bool] = False,
+        timeout: Optional[float] = None,
+    ):
+        """Stop handing out jobs, optionally cancelling every job that has not finished yet.
+
+        Args:
+            cancel (Optional[bool]): Cancel every queued job and tell the workers to kill their running jobs.
+                Defaults to False.
+            timeout (Optional[float]): Seconds to wait for the jobs to finish. Defaults to None for no limit.
+        """
+        with self._lock:
+            jobs = list(self._jobs.items())
+        if cancel:
+            for job_id, job in jobs:
+                self._cancel_job(job_id, job)
+        cf.wait([job["future"] for _, job in jobs], timeout=timeout)
+
+        with self._lock:
+            self._closing = True
+            self._lock.notify_all()
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class VMAF_Worker:
+    """Pulls FFmpeg jobs from a VMAF_Coordinator and runs them on this host.
+
+    Every slot keeps its own connection to the coordinator and runs one job at
+    a time. Input paths can be mapped to where the same files are mounted on
+    this host, and log files are written to a local temporary directory before
+    being sent back.
+    """
+
+    def __init__(
+        self,
+        address: str,
+        ffmpeg: Optional[str] = "ffmpeg",
+        slots: Optional[int] = 1,
+        path_map: Optional[list] = None,
+        heartbeat: Optional[float] = 5.0,
+        retry: Optional[float] = 60.0,
+    ):
+        self._address = parse_address(address)
+        self._ffmpeg = ffmpeg
+        self._slots = max(1, slots)
+        self._path_map = list(path_map or [])
+        self._heartbeat = heartbeat
+        self._retry = retry
+        self._stop = threading.Event()
+
+    def run(self):
+        """Run every slot until the coordinator shuts down or stays unreachable."""
+        threads = [
+            threading.Thread(target=self._run_slot, args=(i,), name="VMAF_Worker_{}".format(i), daemon=True)
+            for i in range(self._slots)
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(0.5)
+        except KeyboardInterrupt:
+            self.stop()
+            for thread in threads:
+                thread.join()
+
+    def stop(self):
+        self._stop.set()
+
+    def map_path(self, arg: str) -> str:
+        for src, dst in self._path_map:
+            if arg.startswith(src):
+                return dst + arg[len(src) :]
+        return arg
+
+    def _run_slot(self, slot: int):
+        last_connected = time()
+        while not self._stop.is_set():
+            try:
+                sock = socket.create_connection(self._address, timeout=10)
+            except OSError as ose:
+                if time() - last_connected > self._retry:
+                    print("Slot {}: giving up on coordinator {}:{}: {}".format(slot, *self._address, ose))
+                    return
+                sleep(min(5.0, self._retry))
+                continue
+            sock.settimeout(None)
+            last_connected = time()
+            try:
+                if self._serve(sock, slot):
+                    return
+            except OSError as ose:
+                print("Slot {}: lost connection to coordinator: {}".format(slot, ose))
+            finally:
+                sock.close()
+            last_connected = time()
+
+    def _serve(self, sock: socket.socket, slot: int) -> bool:
+        """Ask for and run jobs over one connection, returning True once the coordinator shuts down."""
+        lock = threading.Lock()
+        messages = queue.Queue()
+
+        def read():
+            try:
+                for line in sock.makefile("rb"):
+                    messages.put(json.loads(line.decode("utf-8")))
+            except (OSError, ValueError):
+                pass
+            messages.put(None)
+
+        threading.Thread(target=read, daemon=True).start()
+        _send(sock, lock, {"type": "hello", "host": socket.gethostname(), "slot": slot})
+        while not self._stop.is_set():
+            _send(sock, lock, {"type": "request"})
+            # Skip cancellations of jobs that already finished
+            message = messages.get()
+            while message is not None and message["type"] == "cancel":
+                message = messages.get()
+            if message is None:
+                return False
+            if message["type"] == "shutdown":
+                return True
+            if message["type"] == "job":
+                self._run_job(sock, lock, messages, message)
+        return True
+
+    def _run_job(
+        self,
+        sock: socket.socket,
+        lock: threading.Lock,
+        messages: queue.Queue,
+        job: dict,
+    ):
+        reply = {"job_id": job["job_id"], "attempt": job["attempt"]}
+        with tempfile.TemporaryDirectory(prefix="vmaf_worker_") as tmp_dir:
+            local_logs = [Path(tmp_dir).joinpath("part{}.log".format(i)) for i in range(len(job["logs"]))]
+            cmd = [self._ffmpeg]
+            for arg in job["cmd"][1:]:
+                for token, local_log in zip(job["logs"], local_logs):
+                    arg = arg.replace(token, escape_filter_value(local_log))
+                cmd.append(self.map_path(arg))
+
+            kwargs = {}
+            if os.name == "posix":
+                kwargs["start_new_session"] = True
+            else:
+                kwargs["creationflags"] = sp.CREATE_NEW_PROCESS_GROUP
+            lines = {"stdout": deque(), "stderr": deque()}
+            try:
+                process = sp.Popen(cmd, stdin=sp.DEVNULL, stdout=sp.PIPE, stderr=sp.PIPE, **kwargs)
+            except OSError as ose:
+                _send(sock, lock, dict(reply, type="done", exit_code=-1, stdout="", stderr=str(ose)))
+                return
+
+            result = {}
+            usage = {}
+
+            def stream():
+                result["out"] = stream_process(
+                    process,
+                    lines["stdout"].append,
+                    lines["stderr"].append,
+                    job.get("keep_lines"),
+                    usage,
+                )
+
+            streamer = threading.Thread(target=stream, daemon=True)
+            streamer.start()
+
+            try:
+                timed_out = self._watch_job(sock, lock, messages, job, process, streamer, lines)
+            except OSError:
+                # Nobody is left to report to, so do not leave the job running
+                self._kill(process)
+                raise
+            for kind, pending in lines.items():
+                if len(pending) > 0:
+                    _send(sock, lock, dict(reply, type=kind, lines=list(pending)))
+
+            # Send the log files back before the result, so they are in place
+            # by the time the coordinator resolves the job
+            if process.returncode == 0:
+                for i, local_log in enumerate(local_logs):
+                    if not local_log.exists():
+                        continue
+                    with open(str(local_log), "rb") as reader:
+                        offset = 0
+                        for chunk in iter(lambda: reader.read(LOG_CHUNK_SIZE), b""):
+                            data = base64.b64encode(chunk).decode("ascii")
+                            _send(sock, lock, dict(reply, type="log", index=i, offset=offset, data=data))
+                            offset += len(chunk)
+
+            stdout, stderr = result.get("out", (b"", b""))
+            _send(
+                sock,
+                lock,
+                dict(
+                    reply,
+                    type="done",
+                    exit_code=process.returncode,
+                    timed_out=timed_out,
+                    stdout=stdout.decode("utf-8", errors="replace"),
+                    stderr=stderr.decode("utf-8", errors="replace"),
+                    usage=usage or None,
+                ),
+            )
+
+    def _watch_job(
+        self,
+        sock: socket.socket,
+        lock: threading.Lock,
+        messages: queue.Queue,
+        job: dict,
+        process: sp.Popen,
+        streamer: threading.Thread,
+        lines: dict,
+    ) -> bool:
+        """Forward a running job's output and heartbeats until it exits, returning whether it timed out."""
+        reply = {"job_id": job["job_id"], "attempt": job["attempt"]}
+        start = time()
+        last_heartbeat = 0.0
+        timed_out = False
+        while streamer.is_alive():
+            try:
+                message = messages.get(timeout=0.5)
+                if message is None:
+                    raise ConnectionError("Coordinator closed the connection")
+                if message["type"] == "cancel" and message["job_id"] == job["job_id"]:
+                    self._kill(process)
+            except queue.Empty:
+                pass
+            if job.get("timeout") and not timed_out and time() - start > job["timeout"]:
+                timed_out = True
+                self._kill(process)
+            for kind, pending in lines.items():
+                if len(pending) > 0:
+                    batch = [pending.popleft() for _ in range(len(pending))]
+                    _send(sock, lock, dict(reply, type=kind, lines=batch))
+            if time() - last_heartbeat > self._heartbeat:
+                _send(sock, lock, {"type": "heartbeat", "job_id": job["job_id"]})
+                last_heartbeat = time()
+        return timed_out
+
+    def _kill(self, process: sp.Popen):
+        try:
+            if os.name == "posix":
+                os.killpg(process.pid, signal.SIGKILL)
+            else:
+                process.kill()
+        except (ProcessLookupError, PermissionError):
+            pass
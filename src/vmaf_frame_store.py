@@ -0,0 +1,296 @@
+import concurrent.futures as cf
+import json
+import os
+import struct
+import threading
+from pathlib import Path
+from time import time
+from typing import Iterable, Optional, Union
+
+import defusedxml.ElementTree as xml
+import numpy as np
+
+# Log format of the frame store, which is also the extension of its files
+STORE_FORMAT = "bin"
+
+# Log format libvmaf writes into the named pipe of a frame store
+PIPE_FORMAT = "xml"
+
+# First bytes of every frame store file
+STORE_MAGIC = b"VMAFFRM1"
+
+# Length of the JSON header that follows the magic bytes
+HEADER_LENGTH = struct.Struct("<I")
+
+
+def pipe_path(log_path: str) -> str:
+    """Location of the named pipe libvmaf writes the log of a frame store to."""
+    return "{}.pipe".format(log_path)
+
+
+def _row_dtype(metrics: list) -> np.dtype:
+    # Field names are positional, since metric names may contain anything
+    return np.dtype([("frame", "<u4")] + [("m{}".format(i), "<f4") for i in range(len(metrics))])
+
+
+class VMAF_Frame_Store_Writer:
+    """Writes per-frame metrics to a frame store file, one frame at a time.
+
+    A frame store is the magic bytes, the length of a JSON header with the
+    log's "version", "params", "fps" and "metrics" names, and then one row per
+    frame with its frame number as an unsigned 32-bit integer and every metric
+    as a 32-bit float, NaN where a frame is missing a metric. The file is
+    written under a temporary name and only appears once it is complete.
+    """
+
+    def __init__(
+        self,
+        file: Union[str, Path],
+        header: Optional[dict] = None,
+    ):
+        self._file = Path(file)
+        self._tmp_file = self._file.with_name(self._file.name + ".tmp")
+        self._header = dict(header or {"version": "", "params": {}, "fps": 0.0})
+        self._metrics = None
+        self._row = None
+        self._writer = open(str(self._tmp_file), "wb")
+        self.frames = 0
+
+    def set_header(self, **header):
+        """Update the header, which is only possible until the first frame is added."""
+        if self._metrics is not None:
+            raise ValueError("The header of {} is already written".format(self._file))
+        self._header.update(header)
+
+    def _write_header(self, metrics: Iterable[str]):
+        self._metrics = list(metrics)
+        self._row = struct.Struct("<I{}f".format(len(self._metrics)))
+        data = json.dumps(dict(self._header, metrics=self._metrics)).encode("utf-8")
+        self._writer.write(STORE_MAGIC + HEADER_LENGTH.pack(len(data)) + data)
+
+    def add(
+        self,
+        num: int,
+        metrics: dict,
+    ):
+        """Add the metrics of a frame, using the metrics of the first frame as the columns of every frame."""
+        if self._metrics is None:
+            self._write_header(metrics.keys())
+        self._writer.write(self._row.pack(num, *[metrics.get(metric, float("nan")) for metric in self._metrics]))
+        self.frames += 1
+
+    def close(self, keep: Optional[bool] = True):
+        """Finish the file, or delete it if keep is False."""
+        if self._writer.closed:
+            return
+        if self._metrics is None:
+            self._write_header([])
+        self._writer.close()
+        if keep:
+            os.replace(str(self._tmp_file), str(self._file))
+        else:
+            self._tmp_file.unlink(missing_ok=True)
+
+
+def read_store(file: Union[str, Path]) -> tuple:
+    """Read a frame store file.
+
+    Raises:
+        ValueError: The file is not a frame store.
+
+    Returns:
+        tuple: The header dict (version, params, fps, metrics), the frame numbers and a dict with the values of
+            every metric, as numpy arrays.
+    """
+    with open(str(file), "rb") as reader:
+        if reader.read(len(STORE_MAGIC)) != STORE_MAGIC:
+            raise ValueError("{} is not a frame store".format(file))
+        length = HEADER_LENGTH.unpack(reader.read(HEADER_LENGTH.size))[0]
+        header = json.loads(reader.read(length).decode("utf-8"))
+        rows = np.fromfile(reader, dtype=_row_dtype(header["metrics"]))
+    values = {metric: rows["m{}".format(i)] for i, metric in enumerate(header["metrics"])}
+    return header, rows["frame"], values
+
+
+def write_store(
+    file: Union[str, Path],
+    header: dict,
+    frames: list,
+):
+    """Write (frame number, metrics dict) pairs to a frame store file."""
+    writer = VMAF_Frame_Store_Writer(file, header)
+    try:
+        for num, metrics in frames:
+            writer.add(num, metrics)
+    except BaseException:
+        writer.close(keep=False)
+        raise
+    writer.close()
+
+
+def pool_store(file: Union[str, Path]) -> dict:
+    """Pool the metrics of a frame store the same way libvmaf does for its "pooled_metrics" section."""
+    pooled = {}
+    for metric, values in read_store(file)[2].items():
+        values = values[~np.isnan(values)].astype(np.float64)
+        if len(values) == 0:
+            continue
+        pooled[metric] = {
+            "min": float(values.min()),
+            "max": float(values.max()),
+            "mean": float(values.mean()),
+            "harmonic_mean": float(len(values) / np.sum(1.0 / (values + 1.0)) - 1.0),
+        }
+    return pooled
+
+
+class VMAF_Log_Stream:
+    """Reads a libvmaf log from a named pipe while FFmpeg writes it, and stores its frames in a frame store.
+
+    libvmaf writes its log to the pipe instead of a file, so the log never
+    takes up any disk space, and every frame is parsed as it arrives instead
+    of in a separate pass over the finished log.
+    """
+
+    def __init__(self, log_path: Union[str, Path]):
+        """
+        Args:
+            log_path (Union[str, Path]): Location of the frame store, with the pipe from pipe_path next to it.
+        """
+        self._log_path = str(log_path)
+        self._pipe = pipe_path(self._log_path)
+        self._connected = threading.Event()
+        self.error = None
+        Path(self._pipe).unlink(missing_ok=True)
+        os.mkfifo(self._pipe)
+        self._writer = VMAF_Frame_Store_Writer(self._log_path)
+        self._thread = threading.Thread(target=self._read, name="VMAF_Log_Stream", daemon=True)
+        self._thread.start()
+
+    def _read(self):
+        try:
+            # Blocks until FFmpeg opens the pipe for writing, which libvmaf
+            # only does once every frame is calculated
+            with open(self._pipe, "rb") as reader:
+                self._connected.set()
+                frames_elem = None
+                for event, elem in xml.iterparse(reader, events=("start", "end")):
+                    if event == "start":
+                        if elem.tag == "VMAF":
+                            self._writer.set_header(version=elem.attrib.get("version", ""))
+                        elif elem.tag == "frames":
+                            frames_elem = elem
+                        continue
+                    if elem.tag == "frame":
+                        metrics = {k: float(v) for k, v in elem.attrib.items() if k != "frameNum"}
+                        self._writer.add(int(elem.attrib["frameNum"]), metrics)
+                        # Drop parsed frames, so memory stays the same however
+                        # long the log is
+                        frames_elem.clear()
+                    elif elem.tag == "params":
+                        self._writer.set_header(params=dict(elem.attrib))
+                    elif elem.tag == "fyi":
+                        self._writer.set_header(fps=float(elem.attrib.get("fps", 0)))
+        except Exception as e:
+            self.error = e
+
+    def close(
+        self,
+        keep: Optional[bool] = True,
+        grace: Optional[float] = 0.0,
+        partial: Optional[bool] = False,
+    ):
+        """Wait for the rest of the log once FFmpeg has exited, and finish the frame store.
+
+        A pipe FFmpeg never opened, because it failed or was cancelled first,
+        is opened and closed here so the reader stops waiting for it.
+
+        Args:
+            keep (Optional[bool]): Keep the frame store. Defaults to True, and False deletes it.
+            grace (Optional[float]): Seconds FFmpeg may still take to open the pipe, like while it is being
+                stopped. Defaults to 0.0.
+            partial (Optional[bool]): Keep the frames read before the log broke off, for a calculation that was
+                stopped or failed. Defaults to False.
+        """
+        self._connected.wait(grace)
+        while self._thread.is_alive():
+            if not self._connected.is_set():
+                try:
+                    os.close(os.open(self._pipe, os.O_WRONLY | os.O_NONBLOCK))
+                except OSError:
+                    # The reader did not open the pipe yet
+                    pass
+            self._thread.join(0.05)
+        Path(self._pipe).unlink(missing_ok=True)
+        self._writer.close(keep=keep and (self.error is None or partial) and self._writer.frames > 0)
+        if keep and not partial and self.error is None and self._writer.frames == 0:
+            self.error = ValueError("FFmpeg did not write any frames to {}".format(self._pipe))
+
+
+class VMAF_Streamed_Future(cf.Future):
+    """Future of an FFmpeg command whose libvmaf logs are streamed into frame stores.
+
+    It resolves like the command's own future, but only once every log
+    stream is closed, so the frame stores are complete by the time anything
+    waiting for it reads them. Cancelling it cancels the command. A command
+    that failed or was cancelled keeps the frames it calculated before it
+    stopped, and since a cancelled command may still be exiting, its streams
+    are closed in the background, see wait_closed.
+    """
+
+    def __init__(
+        self,
+        task: cf.Future,
+        streams: list,
+        grace: Optional[float] = 0.0,
+    ):
+        """
+        Args:
+            task (cf.Future): Future of the FFmpeg command.
+            streams (list): VMAF_Log_Stream of every log the command writes.
+            grace (Optional[float]): Seconds a cancelled command may still take to exit. Defaults to 0.0.
+        """
+        super().__init__()
+        self.task = task
+        self._streams = streams
+        self._grace = grace
+        self._closer = None
+        task.add_done_callback(self._finish)
+
+    def cancel(self) -> bool:
+        # Cancelling the command's future calls _finish, which cancels this one
+        return self.task.cancel()
+
+    def wait_closed(self):
+        """Wait until the streams of a cancelled command are closed."""
+        if self._closer is not None:
+            self._closer.join()
+
+    def _close_streams(
+        self,
+        grace: float,
+        partial: bool,
+    ):
+        # Every process of the command exits at the same time
+        deadline = time() + grace
+        for stream in self._streams:
+            stream.close(grace=max(0.0, deadline - time()), partial=partial)
+
+    def _finish(self, task: cf.Future):
+        if task.cancelled():
+            self._closer = threading.Thread(
+                target=self._close_streams, args=(self._grace, True), name="VMAF_Log_Stream", daemon=True
+            )
+            self._closer.start()
+            super().cancel()
+            # Only a notified cancellation counts as done for cf.wait
+            self.set_running_or_notify_cancel()
+            return
+        self._close_streams(0.0, task.exception() is not None)
+        errors = [stream.error for stream in self._streams if stream.error is not None]
+        if task.exception() is not None:
+            self.set_exception(task.exception())
+        elif len(errors) > 0:
+            self.set_exception(errors[0])
+        else:
+            self.set_result(task.result())
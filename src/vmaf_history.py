@@ -0,0 +1,73 @@
+import os
+import socket
+import threading
+from json import dump, load
+from pathlib import Path
+from typing import Any, Optional, Union
+
+
+class VMAF_History:
+    """Persistent per-host measurements from earlier calculator runs, stored as a JSON file.
+
+    Every measurement lives in a named section (like "autotune") under a key
+    describing the workload it was measured for, so later runs on the same
+    host can reuse it instead of measuring again. Measurements may be set
+    from several threads at once.
+    """
+
+    def __init__(
+        self,
+        file: Union[str, Path],
+        host: Optional[str] = None,
+    ):
+        self._file = Path(file)
+        self._host = host if host is not None else socket.gethostname()
+        self._lock = threading.RLock()
+        self._data = {}
+        if self._file.exists():
+            try:
+                with open(str(self._file), "r") as reader:
+                    self._data = load(reader)
+            except (OSError, ValueError) as e:
+                print("Could not read history file {}: {}".format(self._file, e))
+                self._data = {}
+
+    def get_host(self) -> str:
+        return self._host
+
+    def get(
+        self,
+        section: str,
+        key: str,
+        default: Any = None,
+    ) -> Any:
+        return self._data.get(self._host, {}).get(section, {}).get(key, default)
+
+    def get_section(self, section: str) -> dict:
+        """Get every measurement of a section, keyed by the workload they were measured for."""
+        with self._lock:
+            return dict(self._data.get(self._host, {}).get(section, {}))
+
+    def set(
+        self,
+        section: str,
+        key: str,
+        value: Any,
+    ):
+        with self._lock:
+            self._data.setdefault(self._host, {}).setdefault(section, {})[key] = value
+            self.save()
+
+    def save(self):
+        # Write to a temporary file first so an interrupted write can never
+        # leave a half written history file behind
+        tmp_file = self._file.with_name(self._file.name + ".tmp")
+        with self._lock:
+            with open(str(tmp_file), "w") as writer:
+                dump(
+                    self._data,
+                    writer,
+                    indent=4,
+                    sort_keys=True,
+                )
+            os.replace(str(tmp_file), str(self._file))
@@ -0,0 +1,430 @@
+import asyncio
+import concurrent.futures as cf
+import os
+import signal
+import subprocess as sp
+import threading
+from collections import deque
+from time import time
+from typing import Callable, Optional
+
+import ffmpy
+
+from vmaf_accounting import wait_process
+
+# Seconds a stopped job gets to exit by itself before it is killed, which
+# lets FFmpeg write the log of the frames it already calculated
+KILL_GRACE = 5.0
+
+# Shortest and longest seconds between two checks whether a job's process
+# exited, where processes can not be waited for with a pidfd
+REAP_POLL_MIN = 0.01
+REAP_POLL_MAX = 0.25
+
+
+def split_lines(
+    buffer: str,
+    chunk: bytes,
+) -> tuple:
+    """Add a chunk of process output to a buffer and split off every complete line.
+
+    FFmpeg ends its status lines with carriage returns, so both kinds of line
+    endings count.
+
+    Returns:
+        tuple: The complete non-empty lines, and the remaining buffer.
+    """
+    buffer += chunk.decode("utf-8", errors="replace").replace("\r", "\n")
+    *complete, buffer = buffer.split("\n")
+    return [line for line in complete if line != ""], buffer
+
+
+def _read_pipe(
+    pipe,
+    lines: deque,
+    callback: Optional[Callable[[str], None]],
+):
+    buffer = ""
+    for chunk in iter(lambda: pipe.read1(65536), b""):
+        complete, buffer = split_lines(buffer, chunk)
+        for line in complete:
+            lines.append(line)
+            if callback is not None:
+                callback(line)
+    if buffer != "":
+        lines.append(buffer)
+        if callback is not None:
+            callback(buffer)
+
+
+def run_blocking(
+    ff: ffmpy.FFmpeg,
+    on_stdout: Optional[Callable[[str], None]] = None,
+    on_stderr: Optional[Callable[[str], None]] = None,
+    keep_lines: Optional[int] = 200,
+    ticket=None,
+    cpu_slots=None,
+    key=None,
+    usage: Optional[dict] = None,
+) -> tuple:
+    """Run an ffmpy.FFmpeg command in the current thread while streaming its output, for use with a thread pool.
+
+    This is the blocking counterpart of VMAF_Job_Engine.submit, and sets
+    ff.process like ffmpy.FFmpeg.run does so the process can still be stopped
+    from another thread. When the thread pool's threads were bound to
+    cpu_slots, the job is recorded on the current thread's slot. The usage
+    dict is filled with the process's resource usage once it exits.
+
+    Returns:
+        tuple: The (stdout, stderr) bytes of the kept lines, like ffmpy.FFmpeg.run.
+    """
+    if ticket is not None:
+        ticket.wait()
+    slot = cpu_slots.start_thread_job(key) if cpu_slots is not None else None
+    try:
+        try:
+            ff.process = sp.Popen(ff._cmd, stdin=sp.DEVNULL, stdout=sp.PIPE, stderr=sp.PIPE)
+        except FileNotFoundError:
+            raise ffmpy.FFExecutableNotFoundError("Executable '{0}' not found".format(ff.executable))
+        if ticket is not None:
+            ticket.start(ff.process.pid)
+
+        stdout, stderr = stream_process(ff.process, on_stdout, on_stderr, keep_lines, usage)
+    finally:
+        if slot is not None:
+            cpu_slots.finish_thread_job(slot)
+        if ticket is not None:
+            ticket.finish()
+    if ff.process.returncode != 0:
+        raise ffmpy.FFRuntimeError(ff.cmd, ff.process.returncode, stdout, stderr)
+    return stdout, stderr
+
+
+def stream_process(
+    process: sp.Popen,
+    on_stdout: Optional[Callable[[str], None]] = None,
+    on_stderr: Optional[Callable[[str], None]] = None,
+    keep_lines: Optional[int] = 200,
+    usage: Optional[dict] = None,
+) -> tuple:
+    """Read a started process's stdout and stderr line by line until it exits.
+
+    The process is reaped with wait_process, and its resource usage is added
+    to the usage dict if one is given.
+
+    Returns:
+        tuple: The (stdout, stderr) bytes of the kept lines.
+    """
+    started = time()
+    out = deque(maxlen=keep_lines)
+    err = deque(maxlen=keep_lines)
+    reader = threading.Thread(target=_read_pipe, args=(process.stderr, err, on_stderr), daemon=True)
+    reader.start()
+    _read_pipe(process.stdout, out, on_stdout)
+    reader.join()
+    result = wait_process(process, started)
+    if usage is not None and result is not None:
+        usage.update(result)
+    return "\n".join(out).encode("utf-8"), "\n".join(err).encode("utf-8")
+
+
+class VMAF_Job_Timeout(ffmpy.FFRuntimeError):
+    """Raised when a job runs longer than its timeout and had to be killed."""
+
+    pass
+
+
+class VMAF_Job_Engine:
+    """Runs FFmpeg jobs as asyncio subprocesses on a single background event loop.
+
+    Jobs are submitted from any thread and return a concurrent.futures.Future,
+    so callers can keep using cf.as_completed/cf.wait. A single thread runs the
+    event loop for every job, stdout and stderr are streamed line by line
+    instead of being buffered until the process exits, and every job runs in
+    its own process group so it can be killed as a whole.
+
+    With cpu_slots, every running job takes one of its slots and its process
+    is pinned to the slot's CPUs, which needs at least max_jobs slots.
+
+    The engine reaps its processes itself instead of leaving that to asyncio,
+    so their resource usage can be collected with wait_process.
+    """
+
+    def __init__(
+        self,
+        max_jobs: int,
+        kill_grace: Optional[float] = KILL_GRACE,
+        cpu_slots=None,
+    ):
+        self._max_jobs = max(1, max_jobs)
+        self._kill_grace = kill_grace
+        self._cpu_slots = cpu_slots
+        self._semaphore = None
+        self._futures = set()
+        self._loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run_loop, name="VMAF_Job_Engine", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._semaphore = asyncio.Semaphore(self._max_jobs)
+        self._ready.set()
+        self._loop.run_forever()
+
+    def get_max_jobs(self) -> int:
+        return self._max_jobs
+
+    def submit(
+        self,
+        cmd: list,
+        timeout: Optional[float] = None,
+        on_stdout: Optional[Callable[[str], None]] = None,
+        on_stderr: Optional[Callable[[str], None]] = None,
+        keep_lines: Optional[int] = 200,
+        ticket=None,
+        key=None,
+        usage: Optional[dict] = None,
+    ) -> cf.Future:
+        """Queue a command to run once a job slot is free.
+
+        Args:
+            cmd (list): The command and its arguments, like ffmpy.FFmpeg._cmd.
+            timeout (Optional[float]): Seconds the job may run before it is killed. Defaults to None for no limit.
+            on_stdout (Optional[Callable[[str], None]]): Called from the event loop thread for every stdout line.
+            on_stderr (Optional[Callable[[str], None]]): Called from the event loop thread for every stderr line.
+            keep_lines (Optional[int]): Number of trailing lines of each stream kept for the result.
+                Defaults to 200, and None keeps everything.
+            ticket (Optional[VMAF_Admission_Ticket]): Admission ticket the job waits for after getting a job slot,
+                and before its process starts. Defaults to None.
+            key (Optional): Identifies the job in the CPU slot statistics. Defaults to None.
+            usage (Optional[dict]): Filled with the process's resource usage from wait_process once it exits,
+                including when it failed. Defaults to None.
+
+        Returns:
+            cf.Future: Resolves to the (stdout, stderr) bytes of the kept lines, like ffmpy.FFmpeg.run. Raises
+                ffmpy.FFRuntimeError if the command fails and VMAF_Job_Timeout if it timed out.
+        """
+        future = asyncio.run_coroutine_threadsafe(
+            self._run(list(cmd), timeout, on_stdout, on_stderr, keep_lines, ticket, key, usage),
+            self._loop,
+        )
+        self._futures.add(future)
+        future.add_done_callback(self._futures.discard)
+        return future
+
+    def cancel(self, future: cf.Future) -> bool:
+        """Cancel a single job from submit, killing its process group if it is already running."""
+        return future.cancel()
+
+    async def _run(
+        self,
+        cmd: list,
+        timeout: Optional[float],
+        on_stdout: Optional[Callable[[str], None]],
+        on_stderr: Optional[Callable[[str], None]],
+        keep_lines: Optional[int],
+        ticket=None,
+        key=None,
+        usage: Optional[dict] = None,
+    ) -> tuple:
+        async with self._semaphore:
+            # Holding the job slot while waiting for admission keeps the
+            # dispatch order of the jobs
+            if ticket is not None:
+                await ticket.wait_async()
+            # The semaphore leaves a CPU slot free for every running job, so
+            # this never blocks the event loop
+            slot = self._cpu_slots.acquire(key) if self._cpu_slots is not None else None
+            try:
+                return await self._run_process(cmd, timeout, on_stdout, on_stderr, keep_lines, ticket, slot, usage)
+            finally:
+                if slot is not None:
+                    self._cpu_slots.release(slot)
+                if ticket is not None:
+                    ticket.finish()
+
+    async def _run_process(
+        self,
+        cmd: list,
+        timeout: Optional[float],
+        on_stdout: Optional[Callable[[str], None]],
+        on_stderr: Optional[Callable[[str], None]],
+        keep_lines: Optional[int],
+        ticket=None,
+        slot=None,
+        usage: Optional[dict] = None,
+    ) -> tuple:
+        kwargs = {}
+        if os.name == "posix":
+            kwargs["start_new_session"] = True
+        else:
+            kwargs["creationflags"] = sp.CREATE_NEW_PROCESS_GROUP
+
+        try:
+            proc = sp.Popen(cmd, stdin=sp.DEVNULL, stdout=sp.PIPE, stderr=sp.PIPE, **kwargs)
+        except FileNotFoundError:
+            raise ffmpy.FFExecutableNotFoundError("Executable '{0}' not found".format(cmd[0]))
+        started = time()
+        if slot is not None:
+            self._cpu_slots.pin(slot, proc.pid)
+        if ticket is not None:
+            ticket.start(proc.pid)
+        # Reaping happens exactly once, however many times the exit is waited for
+        exit_task = self._loop.create_task(self._reap(proc, started, usage))
+        out = deque(maxlen=keep_lines)
+        err = deque(maxlen=keep_lines)
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(
+                    self._read_lines(await self._open_pipe(proc.stdout), out, on_stdout),
+                    self._read_lines(await self._open_pipe(proc.stderr), err, on_stderr),
+                    asyncio.shield(exit_task),
+                ),
+                timeout,
+            )
+        except asyncio.TimeoutError:
+            await self._kill(proc, exit_task)
+            raise VMAF_Job_Timeout(
+                sp.list2cmdline(cmd),
+                proc.returncode,
+                "\n".join(out).encode("utf-8"),
+                "\n".join(err).encode("utf-8"),
+            )
+        except BaseException:
+            # Covers cancellation of the Future as well as any error while
+            # reading, neither of which may leave the process running
+            await self._kill(proc, exit_task)
+            raise
+
+        stdout = "\n".join(out).encode("utf-8")
+        stderr = "\n".join(err).encode("utf-8")
+        if proc.returncode != 0:
+            raise ffmpy.FFRuntimeError(sp.list2cmdline(cmd), proc.returncode, stdout, stderr)
+        return stdout, stderr
+
+    async def _open_pipe(self, pipe) -> asyncio.StreamReader:
+        reader = asyncio.StreamReader(loop=self._loop)
+        await self._loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader, loop=self._loop), pipe)
+        return reader
+
+    async def _reap(
+        self,
+        proc: sp.Popen,
+        started: float,
+        usage: Optional[dict],
+    ):
+        """Wait for a process to exit without blocking the event loop, then reap it with wait_process.
+
+        The exit is watched through a pidfd where there is one, and polled for
+        otherwise, so no thread is ever parked per running process.
+        """
+        exited = self._loop.create_future()
+        pidfd = None
+        if hasattr(os, "pidfd_open"):
+            try:
+                pidfd = os.pidfd_open(proc.pid)
+            except OSError:
+                pass
+        if pidfd is not None:
+            # A pidfd becomes readable once its process exits
+            self._loop.add_reader(pidfd, lambda: exited.done() or exited.set_result(None))
+            try:
+                await exited
+            finally:
+                self._loop.remove_reader(pidfd)
+                os.close(pidfd)
+            result = wait_process(proc, started)
+        else:
+            # Polling from the event loop keeps a thread from waiting for
+            # every running process, backing off while the process runs
+            delay = REAP_POLL_MIN
+            result = wait_process(proc, started, block=False)
+            while result is None and proc.returncode is None:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, REAP_POLL_MAX)
+                result = wait_process(proc, started, block=False)
+        if usage is not None and result is not None:
+            usage.update(result)
+
+    async def _read_lines(
+        self,
+        stream: asyncio.StreamReader,
+        lines: deque,
+        callback: Optional[Callable[[str], None]],
+    ):
+        buffer = ""
+        while True:
+            chunk = await stream.read(65536)
+            if not chunk:
+                break
+            complete, buffer = split_lines(buffer, chunk)
+            for line in complete:
+                lines.append(line)
+                if callback is not None:
+                    callback(line)
+        if buffer != "":
+            lines.append(buffer)
+            if callback is not None:
+                callback(buffer)
+
+    async def _kill(
+        self,
+        proc: sp.Popen,
+        exit_task: asyncio.Task,
+    ):
+        """Stop a job's whole process group, first asking nicely and then by force."""
+        if exit_task.done():
+            return
+        self._signal(proc, signal.SIGTERM)
+        try:
+            await asyncio.wait_for(asyncio.shield(exit_task), self._kill_grace)
+        except asyncio.TimeoutError:
+            self._signal(proc, signal.SIGKILL if hasattr(signal, "SIGKILL") else signal.SIGTERM)
+            await asyncio.shield(exit_task)
+
+    def _signal(
+        self,
+        proc: sp.Popen,
+        sig: int,
+    ):
+        try:
+            if os.name == "posix":
+                os.killpg(proc.pid, sig)
+            elif sig == signal.SIGTERM:
+                proc.terminate()
+            else:
+                proc.kill()
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    def shutdown(
+        self,
+        cancel: Optional[bool] = False,
+        timeout: Optional[float] = None,
+    ):
+        """Stop the engine, optionally cancelling (and killing) every job that has not finished yet.
+
+        Args:
+            cancel (Optional[bool]): Cancel every queued and running job. Defaults to False.
+            timeout (Optional[float]): Seconds to wait for the jobs to finish. Defaults to None for no limit.
+        """
+        futures = list(self._futures)
+        if cancel:
+            for future in futures:
+                future.cancel()
+        cf.wait(futures, timeout=timeout)
+
+        # Cancelling a Future only schedules the task's cancellation, so give
+        # every task the chance to kill its process before stopping the loop
+        async def drain():
+            tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            if len(tasks) > 0:
+                await asyncio.wait(tasks, timeout=timeout)
+
+        if self._loop.is_running():
+            asyncio.run_coroutine_threadsafe(drain(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
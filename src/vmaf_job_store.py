@@ -0,0 +1,380 @@
+import os
+import socket
+import sqlite3
+from json import dump, dumps, load, loads
+from pathlib import Path
+from time import time
+from typing import Iterable, Optional, Union
+
+# Columns of the jobs table that are stored as-is, with everything else in
+# the io dictionary kept in the "data" column as JSON
+JOB_COLUMNS = ["status", "log_path", "scores"]
+
+
+def completions_file(reference: Union[str, Path]) -> Path:
+    """Location of the completions JSON file that is stored next to the reference video file."""
+    ref_path = Path(reference)
+    return ref_path.parent.joinpath("{}_completions.json".format(ref_path.stem))
+
+
+def read_completions(reference: Union[str, Path]) -> dict:
+    """Read through completions JSON file to see what calculations were already complete.
+
+    Args:
+        reference (Union[str, Path]): Reference video file the completions file belongs to.
+
+    Returns:
+        dict: The saved state of every encoded video file, or an empty dict if there is no completions file.
+    """
+    file = completions_file(reference)
+    if file.exists():
+        with open(str(file), "r") as reader:
+            return load(reader)
+    else:
+        return {}
+
+
+def get_owner() -> str:
+    """Identify this calculator instance, so jobs it started are not taken over by another instance."""
+    return "{}:{}".format(socket.gethostname(), os.getpid())
+
+
+def is_owner_alive(owner: Optional[str]) -> bool:
+    """Check whether the instance that started a job is still running.
+
+    Instances on other hosts can't be checked and count as alive.
+    """
+    if not owner:
+        return False
+    host, _, pid = owner.rpartition(":")
+    if host != socket.gethostname():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ValueError:
+        return False
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    return True
+
+
+class VMAF_Json_State:
+    """Keeps the calculator's state in the "<reference>_completions.json" file next to the reference video file.
+
+    Every save rewrites the whole file, so this is only meant for a single
+    calculator instance per reference video file.
+    """
+
+    def __init__(self, reference: Union[str, Path]):
+        self._reference = reference
+
+    def load(self) -> dict:
+        return read_completions(self._reference)
+
+    def claim(self, enc: str) -> bool:
+        return True
+
+    def reset(self, encs: Iterable[str]):
+        pass
+
+    def save(
+        self,
+        io: dict,
+        encs: Optional[Iterable[str]] = None,
+    ):
+        # Write to a temporary file first so an interrupted write can never
+        # leave a half written completions file behind
+        file = completions_file(self._reference)
+        tmp_file = file.with_name(file.name + ".tmp")
+        with open(str(tmp_file), "w") as writer:
+            dump(
+                io,
+                writer,
+                indent=4,
+                sort_keys=True,
+            )
+        os.replace(str(tmp_file), str(file))
+
+    def close(self):
+        pass
+
+
+class VMAF_Read_Only_State:
+    """Reads the state of another state class, but never changes it, for planning calculations without running them.
+
+    Every job can be claimed, and resets and saves are ignored.
+    """
+
+    def __init__(self, state):
+        self._state = state
+
+    def load(self) -> dict:
+        return self._state.load()
+
+    def claim(self, enc: str) -> bool:
+        return True
+
+    def reset(self, encs: Iterable[str]):
+        pass
+
+    def save(
+        self,
+        io: dict,
+        encs: Optional[Iterable[str]] = None,
+    ):
+        pass
+
+    def close(self):
+        self._state.close()
+
+
+class VMAF_Job_Store:
+    """Keeps the calculator's state in an SQLite database, with one row per calculation job.
+
+    A job is identified by its reference video file, encoded video file, set of
+    VMAF models and set of features, so the same encoded video file can be
+    calculated with different models without the results overwriting each
+    other. The database runs in WAL mode and every change is a transaction, so
+    several calculator instances can share the same reference video file:
+    a job is only ever started by the instance that claimed it, and finished
+    jobs are never reset by an instance that loaded its state earlier.
+    """
+
+    def __init__(
+        self,
+        file: Union[str, Path],
+        reference: Union[str, Path],
+        models: Iterable[str],
+        features: Iterable[str],
+        timeout: Optional[float] = 30.0,
+    ):
+        self._file = Path(file)
+        self._reference = str(Path(reference).resolve())
+        self._models = ",".join(sorted(models))
+        self._features = ",".join(sorted(features))
+        self._owner = get_owner()
+
+        # Transactions are handled explicitly, so they can take the write lock
+        # up front with BEGIN IMMEDIATE
+        self._db = sqlite3.connect(str(self._file), timeout=timeout, isolation_level=None, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                reference TEXT NOT NULL,
+                models TEXT NOT NULL,
+                features TEXT NOT NULL,
+                encoded TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'NOT STARTED',
+                owner TEXT,
+                log_path TEXT,
+                scores TEXT,
+                data TEXT,
+                started REAL,
+                finished REAL,
+                updated REAL,
+                PRIMARY KEY (reference, models, features, encoded)
+            ) WITHOUT ROWID
+            """)
+
+    def _key(self, enc: str) -> tuple:
+        return (self._reference, self._models, self._features, str(enc))
+
+    def load(self) -> dict:
+        """Read the state of every job of this reference video file, models and features.
+
+        Returns:
+            dict: Same layout as the completions JSON file, plus the "started", "finished" and "elapsed" times.
+        """
+        state = {}
+        rows = self._db.execute(
+            "SELECT * FROM jobs WHERE reference = ? AND models = ? AND features = ?",
+            self._key("")[:3],
+        )
+        for row in rows:
+            job = loads(row["data"]) if row["data"] else {}
+            job["status"] = row["status"]
+            if row["log_path"] is not None:
+                job["log_path"] = row["log_path"]
+            if row["scores"] is not None:
+                job["scores"] = loads(row["scores"])
+            job["started"] = row["started"]
+            job["finished"] = row["finished"]
+            job["elapsed"] = None
+            if row["started"] is not None and row["finished"] is not None:
+                job["elapsed"] = row["finished"] - row["started"]
+            # A job that is still marked as started by an instance that is
+            # no longer running was interrupted, and can be run again
+            if row["status"] == "STARTED" and row["owner"] != self._owner and not is_owner_alive(row["owner"]):
+                job["status"] = "CANCELLED"
+            state[row["encoded"]] = job
+        return state
+
+    def claim(self, enc: str) -> bool:
+        """Atomically mark a job as started by this instance.
+
+        Returns:
+            bool: False if the job is finished or another running instance has already started it.
+        """
+        now = time()
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            row = self._db.execute(
+                "SELECT status, owner FROM jobs WHERE reference = ? AND models = ? AND features = ? AND encoded = ?",
+                self._key(enc),
+            ).fetchone()
+            if row is not None:
+                if row["status"] in ["DONE", "MOVED"]:
+                    self._db.execute("ROLLBACK")
+                    return False
+                if row["status"] == "STARTED" and row["owner"] != self._owner and is_owner_alive(row["owner"]):
+                    self._db.execute("ROLLBACK")
+                    return False
+            self._db.execute(
+                """
+                INSERT INTO jobs (reference, models, features, encoded, status, owner, started, updated)
+                VALUES (?, ?, ?, ?, 'STARTED', ?, ?, ?)
+                ON CONFLICT (reference, models, features, encoded) DO UPDATE SET
+                    status = 'STARTED', owner = excluded.owner, started = excluded.started, finished = NULL,
+                    updated = excluded.updated
+                """,
+                self._key(enc) + (self._owner, now, now),
+            )
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        return True
+
+    def reset(self, encs: Iterable[str]):
+        """Forget the saved state of the given encoded video files, so they are calculated again from scratch.
+
+        Jobs that another running instance has started are kept.
+        """
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            for enc in encs:
+                row = self._db.execute(
+                    "SELECT status, owner FROM jobs WHERE reference = ? AND models = ? AND features = ? AND encoded = ?",
+                    self._key(enc),
+                ).fetchone()
+                if row is None:
+                    continue
+                if row["status"] == "STARTED" and row["owner"] != self._owner and is_owner_alive(row["owner"]):
+                    continue
+                self._db.execute(
+                    "DELETE FROM jobs WHERE reference = ? AND models = ? AND features = ? AND encoded = ?",
+                    self._key(enc),
+                )
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+
+    def save(
+        self,
+        io: dict,
+        encs: Optional[Iterable[str]] = None,
+    ):
+        """Save the state of the given encoded video files, or of all of them, in a single transaction.
+
+        A job that another running instance has started, or that is already
+        finished, is never moved back to an earlier status.
+        """
+        now = time()
+        rows = []
+        for enc in io.keys() if encs is None else encs:
+            job = io[enc]
+            data = {k: v for k, v in job.items() if k not in JOB_COLUMNS + ["started", "finished", "elapsed"]}
+            status = job.get("status", "NOT STARTED")
+            rows.append(
+                self._key(enc)
+                + (
+                    status,
+                    self._owner if status == "STARTED" else None,
+                    job.get("log_path"),
+                    dumps(job["scores"]) if "scores" in job else None,
+                    dumps(data, sort_keys=True),
+                    now if status == "STARTED" else None,
+                    now if status in ["DONE", "MOVED"] else None,
+                    now,
+                    self._owner,
+                )
+            )
+
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            self._db.executemany(
+                """
+                INSERT INTO jobs (
+                    reference, models, features, encoded, status, owner, log_path, scores, data, started, finished, updated
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (reference, models, features, encoded) DO UPDATE SET
+                    status = excluded.status,
+                    owner = excluded.owner,
+                    log_path = excluded.log_path,
+                    scores = excluded.scores,
+                    data = excluded.data,
+                    started = CASE
+                        WHEN excluded.status = 'NOT STARTED' THEN NULL
+                        WHEN excluded.status = 'STARTED' AND jobs.started IS NULL THEN excluded.updated
+                        ELSE jobs.started END,
+                    finished = CASE
+                        WHEN excluded.status IN ('DONE', 'MOVED') AND jobs.finished IS NULL THEN excluded.updated
+                        WHEN excluded.status NOT IN ('DONE', 'MOVED') THEN NULL
+                        ELSE jobs.finished END,
+                    updated = excluded.updated
+                WHERE (jobs.status NOT IN ('DONE', 'MOVED') OR excluded.status IN ('DONE', 'MOVED'))
+                    AND (jobs.status != 'STARTED' OR jobs.owner IS NULL OR jobs.owner = ?)
+                """,
+                rows,
+            )
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+
+    def import_completions(self, completions: dict) -> int:
+        """Add the jobs of a completions JSON file that are not in the database yet.
+
+        Returns:
+            int: Number of jobs imported.
+        """
+        rows = []
+        for enc, job in completions.items():
+            data = {k: v for k, v in job.items() if k not in JOB_COLUMNS}
+            rows.append(
+                self._key(enc)
+                + (
+                    job.get("status", "NOT STARTED"),
+                    job.get("log_path"),
+                    dumps(job["scores"]) if "scores" in job else None,
+                    dumps(data, sort_keys=True),
+                    time(),
+                )
+            )
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            before = self._db.total_changes
+            self._db.executemany(
+                """
+                INSERT OR IGNORE INTO jobs (reference, models, features, encoded, status, log_path, scores, data, updated)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                rows,
+            )
+            imported = self._db.total_changes - before
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        return imported
+
+    def close(self):
+        self._db.close()
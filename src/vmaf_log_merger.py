@@ -0,0 +1,177 @@
+import csv
+import json
+from pathlib import Path
+from typing import Iterable, Optional
+
+import defusedxml.ElementTree as xml
+import numpy as np
+
+from vmaf_frame_store import STORE_FORMAT, pool_store, read_store, write_store
+
+
+def read_frames(log_path: str, log_format: str) -> tuple:
+    """Read the per-frame metrics out of a libvmaf log file.
+
+    Args:
+        log_path (str): Location of the libvmaf log file.
+        log_format (str): Format of the log file, one of "xml", "json", "csv" or STORE_FORMAT for a frame store.
+
+    Returns:
+        tuple: Header dict (version, params, fps) and a list of (frame number, metrics dict) pairs.
+    """
+    header = {"version": "", "params": {}, "fps": 0.0}
+    frames = []
+    if log_format == "xml":
+        root = xml.parse(log_path).getroot()
+        header["version"] = root.attrib.get("version", "")
+        for child in root:
+            if child.tag == "params":
+                header["params"] = dict(child.attrib)
+            elif child.tag == "fyi":
+                header["fps"] = float(child.attrib.get("fps", 0))
+            elif child.tag == "frames":
+                for frame in child:
+                    metrics = {k: float(v) for k, v in frame.attrib.items() if k != "frameNum"}
+                    frames.append((int(frame.attrib["frameNum"]), metrics))
+    elif log_format == "json":
+        with open(log_path, "r") as reader:
+            data = json.load(reader)
+        header["version"] = data.get("version", "")
+        header["fps"] = float(data.get("fps", 0))
+        for frame in data.get("frames", []):
+            frames.append((int(frame["frameNum"]), {k: float(v) for k, v in frame["metrics"].items()}))
+    elif log_format == "csv":
+        with open(log_path, "r", newline="") as reader:
+            for row in csv.DictReader(reader):
+                metrics = {k: float(v) for k, v in row.items() if k and k != "Frame" and v not in (None, "")}
+                frames.append((int(row["Frame"]), metrics))
+    elif log_format == STORE_FORMAT:
+        store_header, nums, values = read_store(log_path)
+        header = {k: store_header.get(k, v) for k, v in header.items()}
+        for i, num in enumerate(nums.tolist()):
+            metrics = {metric: float(vals[i]) for metric, vals in values.items() if not np.isnan(vals[i])}
+            frames.append((num, metrics))
+    else:
+        raise ValueError("Unknown VMAF log format {}".format(log_format))
+    return header, frames
+
+
+def pool_metrics(frames: Iterable[tuple]) -> dict:
+    """Pool per-frame metrics the same way libvmaf does for its "pooled_metrics" section."""
+    values = {}
+    for _, metrics in frames:
+        for metric, value in metrics.items():
+            values.setdefault(metric, []).append(value)
+
+    pooled = {}
+    for metric, vals in values.items():
+        pooled[metric] = {
+            "min": min(vals),
+            "max": max(vals),
+            "mean": sum(vals) / len(vals),
+            "harmonic_mean": len(vals) / sum(1.0 / (v + 1.0) for v in vals) - 1.0,
+        }
+    return pooled
+
+
+def read_pooled(log_path: str, log_format: str) -> dict:
+    """Read a libvmaf log file and pool its per-frame metrics."""
+    if log_format == STORE_FORMAT:
+        return pool_store(log_path)
+    return pool_metrics(read_frames(log_path, log_format)[1])
+
+
+def write_frames(
+    log_path: str,
+    log_format: str,
+    header: dict,
+    frames: list,
+):
+    """Write per-frame metrics back out in the same layout libvmaf uses for the given log format, or to a frame store."""
+    pooled = pool_metrics(frames)
+    if log_format == "xml":
+        with open(log_path, "w") as writer:
+            writer.write('<VMAF version="{}">\n'.format(header["version"]))
+            params = " ".join('{}="{}"'.format(k, v) for k, v in header["params"].items())
+            writer.write("  <params {} />\n".format(params))
+            writer.write('  <fyi fps="{:.2f}" />\n'.format(header["fps"]))
+            writer.write("  <frames>\n")
+            for num, metrics in frames:
+                attribs = " ".join('{}="{:.6f}"'.format(k, v) for k, v in metrics.items())
+                writer.write('    <frame frameNum="{}" {} />\n'.format(num, attribs))
+            writer.write("  </frames>\n")
+            writer.write("  <pooled_metrics>\n")
+            for metric, stats in pooled.items():
+                attribs = " ".join('{}="{:.6f}"'.format(k, v) for k, v in stats.items())
+                writer.write('    <metric name="{}" {} />\n'.format(metric, attribs))
+            writer.write("  </pooled_metrics>\n")
+            writer.write("  <aggregate_metrics />\n")
+            writer.write("</VMAF>\n")
+    elif log_format == "json":
+        data = {
+            "version": header["version"],
+            "fps": round(header["fps"], 2),
+            "frames": [{"frameNum": num, "metrics": metrics} for num, metrics in frames],
+            "pooled_metrics": pooled,
+            "aggregate_metrics": {},
+        }
+        with open(log_path, "w") as writer:
+            json.dump(data, writer, indent=4)
+    elif log_format == STORE_FORMAT:
+        write_store(log_path, header, frames)
+    elif log_format == "csv":
+        fieldnames = ["Frame"]
+        for _, metrics in frames:
+            fieldnames.extend([k for k in metrics.keys() if k not in fieldnames])
+        with open(log_path, "w", newline="") as writer:
+            csv_writer = csv.DictWriter(writer, fieldnames=fieldnames)
+            csv_writer.writeheader()
+            for num, metrics in frames:
+                row = {k: "{:.6f}".format(v) for k, v in metrics.items()}
+                row["Frame"] = num
+                csv_writer.writerow(row)
+    else:
+        raise ValueError("Unknown VMAF log format {}".format(log_format))
+
+
+def merge_logs(
+    segment_logs: list,
+    log_path: str,
+    log_format: str,
+    cleanup: Optional[bool] = True,
+) -> dict:
+    """Stitch the logs of consecutive segments into a single continuous libvmaf log.
+
+    Args:
+        segment_logs (list): (log path, first frame number) pairs in timeline order.
+        log_path (str): Location of the merged log file.
+        log_format (str): Format of both the segment logs and the merged log.
+        cleanup (Optional[bool]): Delete the segment logs after merging. Defaults to True.
+
+    Returns:
+        dict: The pooled metrics of the merged log.
+    """
+    header = None
+    frames = []
+    elapsed = 0.0
+    for seg_log, offset in segment_logs:
+        seg_header, seg_frames = read_frames(seg_log, log_format)
+        if header is None:
+            header = seg_header
+        if seg_header["fps"] > 0:
+            elapsed += len(seg_frames) / seg_header["fps"]
+        frames.extend([(offset + num, metrics) for num, metrics in seg_frames])
+
+    if header is None:
+        raise ValueError("No segment logs were given to merge into {}".format(log_path))
+
+    # The reported FPS is libvmaf's processing speed, so the merged value is the
+    # overall speed of every segment as if they had run back to back
+    header["fps"] = len(frames) / elapsed if elapsed > 0 else 0.0
+    write_frames(log_path, log_format, header, frames)
+
+    if cleanup:
+        for seg_log, _ in segment_logs:
+            Path(seg_log).unlink(missing_ok=True)
+
+    return pool_metrics(frames)
@@ -0,0 +1,125 @@
+import concurrent.futures as cf
+import os
+import threading
+from json import dump, load
+from pathlib import Path
+from typing import Iterable, Optional, Union
+
+import ffmpy
+
+from vmaf_probe import probe_video
+
+# Bumped whenever probe_video records different properties, so older entries
+# are probed again
+INDEX_VERSION = 1
+
+
+class VMAF_Media_Index:
+    """Persistent index of the video stream properties of every probed file, stored as a JSON file.
+
+    Files are probed with FFprobe at most once, and their entries are reused
+    by later runs for as long as the file's path, size and modification time
+    stay the same. Frame counts are exact, counting the packets of files whose
+    container does not store them.
+    """
+
+    def __init__(
+        self,
+        file: Union[str, Path],
+        ffprobe: str,
+        workers: Optional[int] = None,
+    ):
+        self._file = Path(file)
+        self._ffprobe = ffprobe
+        self._workers = workers or min(8, os.cpu_count() or 1)
+        self._lock = threading.Lock()
+        self._data = {}
+        if self._file.exists():
+            try:
+                with open(str(self._file), "r") as reader:
+                    self._data = load(reader)
+            except (OSError, ValueError) as e:
+                print("Could not read media index {}: {}".format(self._file, e))
+                self._data = {}
+
+    def _entry_key(self, file: Union[str, Path]) -> tuple:
+        stat = os.stat(str(file))
+        return str(Path(file).resolve()), {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "version": INDEX_VERSION,
+        }
+
+    def _cached(self, file: Union[str, Path]) -> Optional[dict]:
+        path, identity = self._entry_key(file)
+        with self._lock:
+            entry = self._data.get(path)
+        if entry is not None and all([entry.get(k) == v for k, v in identity.items()]):
+            return entry["info"]
+        return None
+
+    def _probe(self, file: Union[str, Path]) -> dict:
+        path, identity = self._entry_key(file)
+        info = probe_video(self._ffprobe, file, count_frames=True)
+        with self._lock:
+            self._data[path] = dict(identity, info=info)
+        return info
+
+    def index(self, files: Iterable[Union[str, Path]]) -> dict:
+        """Probe every file that is not indexed yet in parallel, and save the index.
+
+        Files that can not be probed are left out of the result and reported.
+
+        Returns:
+            dict: The properties of every file that could be probed, keyed by the given file names.
+        """
+        infos = {}
+        todo = []
+        for file in files:
+            try:
+                info = self._cached(file)
+            except OSError as ose:
+                print("Could not index {}: {}".format(file, ose))
+                continue
+            if info is not None:
+                infos[file] = info
+            elif file not in todo:
+                todo.append(file)
+
+        if len(todo) > 0:
+            print("Probing {} video files with {} processes...".format(len(todo), min(self._workers, len(todo))))
+            with cf.ThreadPoolExecutor(max_workers=self._workers) as pool:
+                tasks = {pool.submit(self._probe, file): file for file in todo}
+                for task in cf.as_completed(tasks):
+                    try:
+                        infos[tasks[task]] = task.result()
+                    except (OSError, ValueError, ffmpy.FFRuntimeError) as e:
+                        print("Could not index {}: {}".format(tasks[task], e))
+            self.save()
+        return infos
+
+    def get(self, file: Union[str, Path]) -> dict:
+        """Get the properties of a single file, probing and saving it if it is not indexed yet.
+
+        Raises:
+            OSError: The file does not exist or does not contain a video stream.
+        """
+        info = self._cached(file)
+        if info is None:
+            info = self._probe(file)
+            self.save()
+        return info
+
+    def save(self):
+        # Write to a temporary file first so an interrupted write can never
+        # leave a half written index behind
+        tmp_file = self._file.with_name(self._file.name + ".tmp")
+        with self._lock:
+            with open(str(tmp_file), "w") as writer:
+                dump(
+                    self._data,
+                    writer,
+                    indent=4,
+                    sort_keys=True,
+                )
+            os.replace(str(tmp_file), str(self._file))
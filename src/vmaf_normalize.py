@@ -0,0 +1,246 @@
+from typing import Optional
+
+# The conversion every encoded video got before its properties were known,
+# still used when the encoded or reference video could not be probed
+LEGACY_CMP_FILTER = "setpts=PTS-STARTPTS,colorspace=ispace=bt709:iprimaries=bt709:itrc=bt709:irange=tv:space=bt709:primaries=bt709:trc=bt709:range=tv:format=yuv444p12:dither=fsb"
+
+# Scaler flags used to bring the encoded video to the reference video's size
+# and pixel format, bicubic being what the VMAF models were trained with
+SCALE_FLAGS = "bicubic+accurate_rnd+full_chroma_int"
+
+# FFprobe's names of color properties, mapped to the names the colorspace
+# filter uses where they differ. Properties missing here can not be converted
+# by the colorspace filter.
+COLORSPACE_SPACES = {
+    "bt709": "bt709",
+    "fcc": "fcc",
+    "bt470bg": "bt470bg",
+    "smpte170m": "smpte170m",
+    "smpte240m": "smpte240m",
+    "ycgco": "ycgco",
+    "bt2020nc": "bt2020ncl",
+}
+COLORSPACE_PRIMARIES = {
+    "bt709": "bt709",
+    "bt470m": "bt470m",
+    "bt470bg": "bt470bg",
+    "smpte170m": "smpte170m",
+    "smpte240m": "smpte240m",
+    "film": "film",
+    "smpte431": "smpte431",
+    "smpte432": "smpte432",
+    "bt2020": "bt2020",
+    "jedec-p22": "jedec-p22",
+}
+COLORSPACE_TRANSFERS = {
+    "bt709": "bt709",
+    "gamma22": "gamma22",
+    "gamma28": "gamma28",
+    "smpte170m": "smpte170m",
+    "smpte240m": "smpte240m",
+    "linear": "linear",
+    "iec61966-2-1": "srgb",
+    "iec61966-2-4": "xvycc",
+    "bt2020-10": "bt2020-10",
+    "bt2020-12": "bt2020-12",
+}
+
+# Pixel formats the colorspace filter can read and write
+COLORSPACE_FORMATS = [
+    "yuv420p",
+    "yuv422p",
+    "yuv444p",
+    "yuv420p10le",
+    "yuv422p10le",
+    "yuv444p10le",
+    "yuv420p12le",
+    "yuv422p12le",
+    "yuv444p12le",
+]
+
+# Frame rates closer than this are treated as the same
+FPS_TOLERANCE = 0.001
+
+
+def _known(value: Optional[str]) -> Optional[str]:
+    return None if value in [None, "", "unknown", "unspecified", "reserved"] else value
+
+
+def _range_name(value: Optional[str]) -> Optional[str]:
+    # FFprobe reports limited range as "tv" and full range as "pc"
+    return {"tv": "tv", "mpeg": "tv", "limited": "tv", "pc": "pc", "jpeg": "pc", "full": "pc"}.get(_known(value))
+
+
+def plan_normalization(
+    ref_info: Optional[dict],
+    enc_info: Optional[dict],
+) -> dict:
+    """Plan the cheapest filters that make an encoded video match its reference video before they are compared.
+
+    Only the differences between the two videos' properties from
+    probe_video are fixed: the encoded video is scaled to the reference's size,
+    converted to its pixel format and color range with the scale filter, and
+    only goes through the much slower colorspace filter when its color matrix,
+    primaries or transfer actually differ. Timestamps are only reset when a
+    video does not start at 0, and the frame rate only converted when it
+    differs. Properties that are not tagged are assumed to match the
+    reference's.
+
+    Without the properties of both videos, the encoded video gets the same
+    fixed BT.709 conversion it always used to.
+
+    Args:
+        ref_info (Optional[dict]): Properties of the reference video.
+        enc_info (Optional[dict]): Properties of the encoded video.
+
+    Returns:
+        dict: The "cmp" and "ref" filter chains, either of which may be empty, and the "steps" describing every
+            conversion.
+    """
+    if ref_info is None or enc_info is None:
+        return {"cmp": LEGACY_CMP_FILTER, "ref": "setpts=PTS-STARTPTS", "steps": ["fixed BT.709 conversion"]}
+
+    cmp_chain = []
+    ref_chain = []
+    steps = []
+
+    if ref_info.get("start_time", 0.0) != 0.0 or enc_info.get("start_time", 0.0) != 0.0:
+        cmp_chain.append("setpts=PTS-STARTPTS")
+        ref_chain.append("setpts=PTS-STARTPTS")
+        steps.append("timestamps reset to 0")
+
+    ref_fps = ref_info.get("fps", 0.0)
+    enc_fps = enc_info.get("fps", 0.0)
+    if ref_fps > 0 and enc_fps > 0 and abs(ref_fps - enc_fps) > FPS_TOLERANCE:
+        cmp_chain.append("fps={}".format(ref_fps))
+        steps.append("frame rate {:.3f} -> {:.3f}".format(enc_fps, ref_fps))
+
+    # Only convert the color matrix, primaries or transfer when both videos
+    # are tagged with different ones that the colorspace filter supports
+    color = {}
+    for key, names in [
+        ("color_space", COLORSPACE_SPACES),
+        ("color_primaries", COLORSPACE_PRIMARIES),
+        ("color_transfer", COLORSPACE_TRANSFERS),
+    ]:
+        ref_value = _known(ref_info.get(key))
+        enc_value = _known(enc_info.get(key))
+        if ref_value is None or enc_value is None or ref_value == enc_value:
+            continue
+        if ref_value not in names or enc_value not in names:
+            steps.append("{} {} -> {} not supported, left as is".format(key, enc_value, ref_value))
+            continue
+        color[key] = (names[enc_value], names[ref_value])
+
+    ref_range = _range_name(ref_info.get("color_range"))
+    enc_range = _range_name(enc_info.get("color_range")) or ref_range
+    ref_pix_fmt = ref_info.get("pix_fmt")
+    enc_pix_fmt = enc_info.get("pix_fmt")
+    resize = (enc_info.get("width"), enc_info.get("height")) != (ref_info.get("width"), ref_info.get("height"))
+
+    if len(color) > 0:
+        # The colorspace filter converts between properties and formats at
+        # once, so it replaces the pixel format and range conversion
+        options = []
+        for key, option in [("color_space", "space"), ("color_primaries", "primaries"), ("color_transfer", "trc")]:
+            if key in color:
+                options.append("i{}={}".format(option, color[key][0]))
+                options.append("{}={}".format(option, color[key][1]))
+        # Properties that stay the same still have to be given on both sides,
+        # or the filter refuses untagged frames
+        for key, option, names in [
+            ("color_space", "space", COLORSPACE_SPACES),
+            ("color_primaries", "primaries", COLORSPACE_PRIMARIES),
+            ("color_transfer", "trc", COLORSPACE_TRANSFERS),
+        ]:
+            if key in color:
+                continue
+            known = [_known(info.get(key)) for info in [ref_info, enc_info]]
+            value = [names[value] for value in known if value in names] + ["bt709"]
+            options.append("i{}={}".format(option, value[0]))
+            options.append("{}={}".format(option, value[0]))
+        if enc_range is not None:
+            options.append("irange={}".format(enc_range))
+            options.append("range={}".format(ref_range or enc_range))
+        if ref_pix_fmt in COLORSPACE_FORMATS:
+            options.append("format={}".format(ref_pix_fmt.replace("le", "")))
+        options.append("dither=fsb")
+        if resize:
+            # Scaling first keeps the colorspace filter at the reference's size
+            cmp_chain.append("scale=w={}:h={}:flags={}".format(ref_info["width"], ref_info["height"], SCALE_FLAGS))
+            steps.append(
+                "size {}x{} -> {}x{}".format(
+                    enc_info["width"], enc_info["height"], ref_info["width"], ref_info["height"]
+                )
+            )
+        cmp_chain.append("colorspace={}".format(":".join(options)))
+        steps.append(
+            "color {} -> {}".format(
+                ", ".join(["{}={}".format(key, values[0]) for key, values in color.items()]),
+                ", ".join(["{}={}".format(key, values[1]) for key, values in color.items()]),
+            )
+        )
+        if ref_pix_fmt is not None and ref_pix_fmt not in COLORSPACE_FORMATS:
+            cmp_chain.append("format={}".format(ref_pix_fmt))
+    else:
+        # Everything else is a single scale filter, which is much cheaper
+        options = []
+        if resize:
+            options += ["w={}".format(ref_info["width"]), "h={}".format(ref_info["height"])]
+            steps.append(
+                "size {}x{} -> {}x{}".format(
+                    enc_info["width"], enc_info["height"], ref_info["width"], ref_info["height"]
+                )
+            )
+        if ref_range is not None and enc_range != ref_range:
+            options += ["in_range={}".format(enc_range), "out_range={}".format(ref_range)]
+            steps.append("range {} -> {}".format(enc_range, ref_range))
+        convert_format = ref_pix_fmt is not None and enc_pix_fmt != ref_pix_fmt
+        if convert_format:
+            steps.append("pixel format {} -> {}".format(enc_pix_fmt, ref_pix_fmt))
+        if len(options) > 0 or convert_format:
+            options.append("flags={}".format(SCALE_FLAGS))
+            cmp_chain.append("scale={}".format(":".join(options)))
+        if convert_format:
+            cmp_chain.append("format={}".format(ref_pix_fmt))
+
+    if len(steps) == 0:
+        steps.append("none, the encoded video already matches the reference")
+    return {"cmp": ",".join(cmp_chain), "ref": ",".join(ref_chain), "steps": steps}
+
+
+def apply_offset(
+    plan: dict,
+    offset: int,
+) -> dict:
+    """Record a frame offset between the encoded and reference video in a plan from plan_normalization.
+
+    The offset itself is applied by seeking the input that starts early, which
+    leaves both inputs with timestamps that no longer start at 0, so both have
+    them reset.
+
+    Args:
+        plan (dict): The plan to update.
+        offset (int): Frames the encoded video is ahead of the reference video, negative when it is behind.
+
+    Returns:
+        dict: The updated plan.
+    """
+    plan = dict(plan, offset=offset, steps=list(plan["steps"]))
+    if offset == 0:
+        return plan
+    for chain in ["cmp", "ref"]:
+        if "setpts=PTS-STARTPTS" not in plan[chain]:
+            plan[chain] = ",".join([f for f in ["setpts=PTS-STARTPTS", plan[chain]] if f != ""])
+    if plan["steps"] == ["none, the encoded video already matches the reference"]:
+        plan["steps"] = []
+    if offset > 0:
+        plan["steps"].append("first {} frames of the encoded video skipped".format(offset))
+    else:
+        plan["steps"].append("first {} frames of the reference video skipped".format(-offset))
+    return plan
+
+
+def format_normalization(plan: dict) -> str:
+    """Describe the conversions of a plan from plan_normalization in a single line."""
+    return "Normalization: " + "; ".join(plan["steps"])
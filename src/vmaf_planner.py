@@ -0,0 +1,259 @@
+import multiprocessing as mp
+from typing import Optional
+
+from vmaf_admission import PEAK_MARGIN, estimate_memory, memory_key
+from vmaf_autotune import autotune_key
+from vmaf_scheduler import estimate_cost, estimate_makespan
+
+# Values of libvmaf's n_subsample the deadline planner tries, from the most
+# to the least accurate
+SUBSAMPLE_STEPS = [1, 2, 3, 5, 10]
+
+
+def record_throughput(
+    history,
+    key: str,
+    processes: int,
+    frames: int,
+    cost: float,
+    wall: float,
+):
+    """Add a finished job to the throughput measured for its workload at the given number of processes.
+
+    Args:
+        history (VMAF_History): Persistent measurements of this host.
+        key (str): Workload description from autotune_key.
+        processes (int): Number of processes running at the same time.
+        frames (int): Frames the job calculated, counting every encoded video of a batch.
+        cost (float): Estimated cost of the job from estimate_cost.
+        wall (float): Wall time of the job's process in seconds.
+    """
+    if wall is None or wall <= 0:
+        return
+    measured = dict(history.get("throughput", key, {}))
+    entry = measured.get(str(processes), {"frames": 0, "cost": 0.0, "wall": 0.0, "jobs": 0})
+    measured[str(processes)] = {
+        "frames": entry["frames"] + frames,
+        "cost": entry["cost"] + cost,
+        "wall": entry["wall"] + wall,
+        "jobs": entry["jobs"] + 1,
+    }
+    history.set("throughput", key, measured)
+
+
+def predict_rate(
+    history,
+    key: str,
+    processes: int,
+    cost_per_frame: float,
+    cpus: Optional[int] = None,
+) -> Optional[tuple]:
+    """Predict the cost every process gets through per second, for a workload at the given number of processes.
+
+    Rates are in the units of estimate_cost, so measurements of one workload
+    carry over to others with a different resolution, set of models or
+    subsampling. The closest measurement wins: the same workload and number of
+    processes from earlier runs, then from an autotune calibration, then any
+    workload at the same number of processes, and finally the nearest number
+    of processes of any workload, assuming the total throughput grows with the
+    processes until every CPU thread is busy.
+
+    Args:
+        history (VMAF_History): Persistent measurements of this host.
+        key (str): Workload description from autotune_key.
+        processes (int): Number of processes running at the same time.
+        cost_per_frame (float): Estimated cost of a single frame of the workload, to convert frames per second.
+        cpus (Optional[int]): Number of CPU threads. Defaults to all of them.
+
+    Returns:
+        Optional[tuple]: The rate and a description of where it came from, or None without any measurements.
+    """
+    if cpus is None:
+        cpus = mp.cpu_count()
+
+    # Every measurement as (workload, processes, rate)
+    measurements = []
+    for workload, measured in history.get_section("throughput").items():
+        for count, entry in measured.items():
+            if entry["wall"] > 0:
+                measurements.append((workload, int(count), entry["cost"] / entry["wall"]))
+    calibrated = []
+    for result in history.get("autotune", key, {}).get("results", []):
+        if result["fps"] > 0:
+            calibrated.append((key, result["processes"], result["fps"] / result["processes"] * cost_per_frame))
+
+    for found, source in [
+        ([m for m in measurements if m[0] == key and m[1] == processes], "earlier runs of this workload"),
+        ([m for m in calibrated if m[1] == processes], "the autotune calibration of this workload"),
+        ([m for m in measurements if m[1] == processes], "earlier runs of other workloads"),
+    ]:
+        if len(found) > 0:
+            return sum([m[2] for m in found]) / len(found), source
+
+    found = measurements + calibrated
+    if len(found) == 0:
+        return None
+    nearest = min(found, key=lambda m: (abs(m[1] - processes), m[0] != key))
+    rate = nearest[2] * nearest[1] / processes * min(processes, cpus) / min(nearest[1], cpus)
+    return rate, "{} processes, extrapolated".format(nearest[1])
+
+
+def predict_memory(
+    history,
+    width: int,
+    height: int,
+    pix_fmt: Optional[str],
+    models: dict,
+    features: Optional[list] = None,
+    branches: Optional[int] = 1,
+) -> int:
+    """Predict the peak memory of a job, like admission control does, from its measured peak or its estimate."""
+    measured = history.get("memory", memory_key(width, height, pix_fmt, models, features, branches))
+    if measured is not None:
+        return int(measured["peak"] * PEAK_MARGIN)
+    return estimate_memory(width, height, pix_fmt, len(models), features, branches)
+
+
+def predict_plan(
+    history,
+    jobs: list,
+    models: dict,
+    features: list,
+    subsamples: Optional[int],
+    processes: int,
+    cpus: Optional[int] = None,
+) -> dict:
+    """Predict the runtime and peak memory of calculating jobs with the given settings.
+
+    Every job is a dict with the "work" it does, in pixels x frames across
+    all of its encoded videos, the "width", "height" and "pix_fmt" of its
+    reference video and its number of "branches".
+
+    Args:
+        history (VMAF_History): Persistent measurements of this host.
+        jobs (list): Jobs to predict, in dispatch order.
+        models (dict): VMAF models calculated.
+        features (list): Extra libvmaf features calculated.
+        subsamples (Optional[int]): libvmaf's n_subsample.
+        processes (int): Number of processes running at the same time.
+        cpus (Optional[int]): Number of CPU threads. Defaults to all of them.
+
+    Returns:
+        dict: The predicted "seconds" of every job and in "total", None when there are no measurements to predict
+            from, the "memory" peak of the largest jobs running at the same time and the "sources" of the rates.
+    """
+    seconds = []
+    memories = []
+    sources = set()
+    for job in jobs:
+        per_pixel = estimate_cost(1, 1, 1, len(models), features, subsamples)
+        key = autotune_key(job["width"], job["height"], models, features, subsamples)
+        predicted = predict_rate(history, key, processes, per_pixel * job["width"] * job["height"], cpus)
+        if predicted is None:
+            seconds.append(None)
+        else:
+            seconds.append(job["work"] * per_pixel / predicted[0])
+            sources.add(predicted[1])
+        memories.append(
+            predict_memory(history, job["width"], job["height"], job["pix_fmt"], models, features, job["branches"])
+        )
+
+    total = None
+    if len(seconds) > 0 and None not in seconds:
+        total = estimate_makespan(seconds, processes)[0]
+    elif len(seconds) == 0:
+        total = 0.0
+    return {
+        "seconds": seconds,
+        "total": total,
+        "memory": sum(sorted(memories, reverse=True)[: max(1, processes)]),
+        "sources": sorted(sources),
+    }
+
+
+def budget_options(
+    models: dict,
+    features: list,
+    subsamples: Optional[int] = None,
+) -> list:
+    """Create the settings the deadline planner tries, from the most to the least accurate.
+
+    Extra features are dropped before the VMAF models are subsampled any
+    further, and the models are only cut down to the first one when nothing
+    else is fast enough.
+
+    Returns:
+        list: Dicts with the "models", "features" and "subsamples" to try, in order.
+    """
+    steps = [subsamples or 1] + [step for step in SUBSAMPLE_STEPS if step > (subsamples or 1)]
+    model_sets = [models]
+    if len(models) > 1:
+        first = list(models.keys())[0]
+        model_sets.append({first: models[first]})
+    feature_sets = [features]
+    if len(features) > 0:
+        feature_sets.append([])
+
+    options = []
+    for model_set in model_sets:
+        for step in steps:
+            for feature_set in feature_sets:
+                options.append({"models": model_set, "features": feature_set, "subsamples": step})
+    return options
+
+
+def process_counts(
+    processes: int,
+    cpus: Optional[int] = None,
+) -> list:
+    """Create the numbers of processes the deadline planner tries: powers of two up to the CPU threads, and the given one."""
+    if cpus is None:
+        cpus = mp.cpu_count()
+    counts = set([max(1, processes)])
+    count = 1
+    while count <= cpus:
+        counts.add(count)
+        count *= 2
+    return sorted(counts)
+
+
+def fit_deadline(
+    history,
+    jobs: list,
+    models: dict,
+    features: list,
+    subsamples: Optional[int],
+    processes: int,
+    deadline: float,
+    memory_budget: Optional[int] = None,
+    cpus: Optional[int] = None,
+) -> Optional[dict]:
+    """Find the most accurate settings that calculate the jobs before a deadline, with the fewest processes.
+
+    Args:
+        history (VMAF_History): Persistent measurements of this host.
+        jobs (list): Jobs to calculate, see predict_plan.
+        models (dict): VMAF models asked for.
+        features (list): Extra libvmaf features asked for.
+        subsamples (Optional[int]): libvmaf's n_subsample asked for.
+        processes (int): Number of processes asked for.
+        deadline (float): Seconds the calculations may take.
+        memory_budget (Optional[int]): Bytes the processes running at the same time may use. Defaults to None for
+            no limit.
+        cpus (Optional[int]): Number of CPU threads. Defaults to all of them.
+
+    Returns:
+        Optional[dict]: The "models", "features", "subsamples" and "processes" that fit, with their prediction from
+            predict_plan, or None if nothing fits.
+    """
+    for option in budget_options(models, features, subsamples):
+        for count in process_counts(processes, cpus):
+            prediction = predict_plan(
+                history, jobs, option["models"], option["features"], option["subsamples"], count, cpus
+            )
+            if prediction["total"] is None or prediction["total"] > deadline:
+                continue
+            if memory_budget is not None and prediction["memory"] > memory_budget:
+                continue
+            return dict(option, processes=count, prediction=prediction)
+    return None
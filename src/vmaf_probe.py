@@ -0,0 +1,106 @@
+import subprocess as sp
+from fractions import Fraction
+from json import loads
+from pathlib import Path
+
+import ffmpy
+
+
+def get_ffprobe(ffmpeg: str) -> str:
+    """Derive the FFprobe executable that sits next to the given FFmpeg executable.
+
+    Args:
+        ffmpeg (str): Path to (or name of) the FFmpeg executable.
+
+    Returns:
+        str: Path to (or name of) the matching FFprobe executable.
+    """
+    ffmpeg_path = Path(ffmpeg)
+    if ffmpeg_path.is_dir():
+        return str(ffmpeg_path.joinpath("ffprobe"))
+    name = ffmpeg_path.name.replace("ffmpeg", "ffprobe")
+    if ffmpeg_path.parent == Path("."):
+        return name
+    return str(ffmpeg_path.with_name(name))
+
+
+def parse_rate(rate) -> float:
+    """Convert an FFprobe rate string like "60000/1001" into a float, returning 0.0 for unknown rates."""
+    try:
+        rate = Fraction(str(rate))
+    except (ValueError, ZeroDivisionError):
+        return 0.0
+    return float(rate)
+
+
+def parse_time(value) -> float:
+    """Convert an FFprobe time string into seconds, returning 0.0 for unknown times."""
+    try:
+        return float(value or 0)
+    except ValueError:
+        return 0.0
+
+
+def probe_video(
+    ffprobe: str,
+    file: str,
+    count_frames: bool = False,
+) -> dict:
+    """Read the first video stream's properties of a file with FFprobe.
+
+    Args:
+        ffprobe (str): Path to the FFprobe executable.
+        file (str): Video file to probe.
+        count_frames (bool): Also count the video stream's packets, which reads the whole file without decoding
+            it, for an exact frame count from containers that do not store one. Defaults to False, which estimates
+            the frame count from the duration for those containers.
+
+    Raises:
+        OSError: The file does not contain a video stream.
+
+    Returns:
+        dict: Geometry, pixel format, color properties, frame rate, duration and frame count of the video stream.
+            The "exact_frames" key tells whether the frame count was stored or counted rather than estimated.
+    """
+    global_options = "-v error -select_streams v:0 -show_streams -show_format -of json"
+    if count_frames:
+        global_options += " -count_packets"
+    ff = ffmpy.FFprobe(
+        executable=ffprobe,
+        global_options=global_options,
+        inputs={str(file): None},
+    )
+    out = ff.run(stdout=sp.PIPE, stderr=sp.PIPE)[0]
+    data = loads(out.decode("utf-8"))
+
+    if len(data.get("streams", [])) == 0:
+        raise OSError("ERROR: Could not find a video stream in {}".format(file))
+
+    stream = data["streams"][0]
+    fps = parse_rate(stream.get("avg_frame_rate")) or parse_rate(stream.get("r_frame_rate"))
+    duration = float(stream.get("duration", data.get("format", {}).get("duration", 0)) or 0)
+    frames = int(stream.get("nb_frames", 0) or 0)
+    exact_frames = frames > 0
+    if frames == 0 and int(stream.get("nb_read_packets", 0) or 0) > 0:
+        frames = int(stream["nb_read_packets"])
+        exact_frames = True
+    if frames == 0:
+        frames = int(round(duration * fps))
+
+    return {
+        "width": int(stream.get("width", 0)),
+        "height": int(stream.get("height", 0)),
+        "sample_aspect_ratio": stream.get("sample_aspect_ratio"),
+        "pix_fmt": stream.get("pix_fmt"),
+        "color_range": stream.get("color_range"),
+        "color_space": stream.get("color_space"),
+        "color_transfer": stream.get("color_transfer"),
+        "color_primaries": stream.get("color_primaries"),
+        "field_order": stream.get("field_order"),
+        "fps": fps,
+        "r_frame_rate": parse_rate(stream.get("r_frame_rate")),
+        "start_time": parse_time(stream.get("start_time")),
+        "duration": duration,
+        "frames": frames,
+        "exact_frames": exact_frames,
+    }
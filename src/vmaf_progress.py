@@ -0,0 +1,207 @@
+import threading
+from collections import deque
+from time import time
+from typing import Callable, Optional
+
+from tqdm import tqdm
+
+
+class VMAF_Progress:
+    """Collects the live progress of every FFmpeg job from its "-progress" output.
+
+    FFmpeg writes blocks of key=value lines, ending every block with a
+    "progress=continue" or "progress=end" line. Lines can arrive from any
+    thread, so all state is guarded by a lock and read through copies.
+    """
+
+    def __init__(
+        self,
+        window: Optional[float] = 30.0,
+    ):
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._window = window
+        self._samples = deque()
+        self._start = time()
+
+    def add_job(
+        self,
+        job_id,
+        label: str,
+        frames: int,
+    ):
+        """Register a job before it starts, with the number of frames it is expected to process."""
+        with self._lock:
+            self._jobs[job_id] = {
+                "label": label,
+                "total": frames,
+                "frame": 0,
+                "fps": 0.0,
+                "speed": 0.0,
+                "started": None,
+                "finished": None,
+                "block": {},
+            }
+
+    def callback(self, job_id) -> Callable[[str], None]:
+        """Create the line callback for a job, to be given to the job engine as its stdout handler."""
+        return lambda line: self.parse_line(job_id, line)
+
+    def parse_line(
+        self,
+        job_id,
+        line: str,
+    ):
+        if "=" not in line:
+            return
+        key, value = line.split("=", 1)
+        key = key.strip()
+        value = value.strip()
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            if job["started"] is None:
+                job["started"] = time()
+            if key != "progress":
+                job["block"][key] = value
+                return
+
+            # A complete block was received, so publish its values
+            block = job["block"]
+            job["block"] = {}
+            try:
+                job["frame"] = int(block.get("frame", job["frame"]))
+                job["fps"] = float(block.get("fps", job["fps"]))
+                speed = block.get("speed", "").rstrip("x").strip()
+                if speed not in ("", "N/A"):
+                    job["speed"] = float(speed)
+            except ValueError:
+                pass
+            if value == "end":
+                job["finished"] = time()
+
+    def finish_job(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                if job["finished"] is None:
+                    job["finished"] = time()
+                job["frame"] = max(job["frame"], job["total"])
+
+    def remove_job(self, job_id):
+        """Forget a job that will never run, so it no longer counts towards the total frames."""
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    def get_job(self, job_id) -> Optional[dict]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return None if job is None else {k: v for k, v in job.items() if k != "block"}
+
+    def get_running(self) -> dict:
+        """Get copies of every job that has started but not finished yet."""
+        with self._lock:
+            return {
+                job_id: {k: v for k, v in job.items() if k != "block"}
+                for job_id, job in self._jobs.items()
+                if job["started"] is not None and job["finished"] is None
+            }
+
+    def get_totals(self) -> dict:
+        """Get the frames processed by all jobs, their combined frames per second and the estimated time left.
+
+        The combined frames per second is measured over a sliding window, so it
+        follows changes in throughput during long runs.
+        """
+        now = time()
+        with self._lock:
+            done = sum([min(job["frame"], job["total"]) for job in self._jobs.values()])
+            total = sum([job["total"] for job in self._jobs.values()])
+            self._samples.append((now, done))
+            while len(self._samples) > 2 and now - self._samples[0][0] > self._window:
+                self._samples.popleft()
+            first_time, first_done = self._samples[0]
+
+        # Until there is a second sample the window is empty, so fall back to
+        # the average since the start
+        if first_time == now:
+            first_time, first_done = self._start, 0
+        fps = (done - first_done) / (now - first_time) if now > first_time else 0.0
+        eta = (total - done) / fps if fps > 0 else None
+        return {"frames": done, "total": total, "fps": fps, "eta": eta}
+
+
+class VMAF_Progress_Display:
+    """Shows a VMAF_Progress as one tqdm bar for all frames, plus one bar per running job."""
+
+    def __init__(
+        self,
+        progress: VMAF_Progress,
+        desc: Optional[str] = "Processing VMAF calculations",
+    ):
+        self._progress = progress
+        self._desc = desc
+        self._pbar = None
+        self._job_bars = {}
+        self._positions = {}
+        self._free_positions = []
+        self._next_position = 1
+        self._postfix = {}
+
+    def __enter__(self):
+        self._pbar = tqdm(
+            desc=self._desc,
+            total=self._progress.get_totals()["total"],
+            unit="frames",
+            position=0,
+            leave=True,
+        )
+        return self
+
+    def __exit__(self, *exc):
+        for job_id in list(self._job_bars.keys()):
+            self._close_job_bar(job_id)
+        self._pbar.close()
+        return False
+
+    def set_postfix(self, postfix: dict):
+        self._postfix.update(postfix)
+
+    def refresh(self):
+        totals = self._progress.get_totals()
+        self._pbar.total = totals["total"]
+        self._pbar.update(totals["frames"] - self._pbar.n)
+        postfix = {"Total FPS": "{:.2f}".format(totals["fps"])}
+        if totals["eta"] is not None:
+            postfix["ETA"] = tqdm.format_interval(totals["eta"])
+        postfix.update(self._postfix)
+        self._pbar.set_postfix(postfix)
+
+        running = self._progress.get_running()
+        for job_id in list(self._job_bars.keys()):
+            if job_id not in running:
+                self._close_job_bar(job_id)
+        for job_id, job in running.items():
+            if job_id not in self._job_bars:
+                if len(self._free_positions) > 0:
+                    position = self._free_positions.pop(0)
+                else:
+                    position = self._next_position
+                    self._next_position += 1
+                self._positions[job_id] = position
+                self._job_bars[job_id] = tqdm(
+                    desc=job["label"],
+                    total=job["total"],
+                    unit="frames",
+                    position=position,
+                    leave=False,
+                )
+            bar = self._job_bars[job_id]
+            bar.update(min(job["frame"], job["total"]) - bar.n)
+            bar.set_postfix({"FPS": "{:.2f}".format(job["fps"]), "Speed": "{:.2f}x".format(job["speed"])})
+
+    def _close_job_bar(self, job_id):
+        self._job_bars.pop(job_id).close()
+        self._free_positions.append(self._positions.pop(job_id))
+        self._free_positions.sort()
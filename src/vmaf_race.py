@@ -0,0 +1,202 @@
+import math
+from typing import Optional
+
+# Lowest and highest possible VMAF score, used as the bounds of a candidate
+# that does not have enough samples for a confidence interval yet
+SCORE_RANGE = (0.0, 100.0)
+
+# Minimum number of segments every encoded video is split into when racing,
+# since every finished segment is one sample of its pooled score
+RACE_SEGMENTS = 8
+
+
+def t_probability(
+    t: float,
+    df: int,
+) -> float:
+    """Probability that Student's t distribution with df degrees of freedom falls within -t and t.
+
+    Uses the closed form for integer degrees of freedom from Abramowitz and
+    Stegun 26.7.3 and 26.7.4.
+    """
+    theta = math.atan(t / math.sqrt(df))
+    cos2 = math.cos(theta) ** 2
+    if df % 2 == 1:
+        total, term = 0.0, math.cos(theta)
+        for k in range(1, (df - 1) // 2 + 1):
+            total += term
+            term *= cos2 * 2 * k / (2 * k + 1)
+        return 2 / math.pi * (theta + math.sin(theta) * total)
+    total, term = 0.0, 1.0
+    for k in range(1, df // 2 + 1):
+        total += term
+        term *= cos2 * (2 * k - 1) / (2 * k)
+    return math.sin(theta) * total
+
+
+def t_quantile(
+    confidence: float,
+    df: int,
+) -> float:
+    """Half width in standard errors of a two-sided confidence interval from Student's t distribution.
+
+    The standard library has no inverse of the t distribution, so this
+    bisects its closed form. Like NormalDist().inv_cdf(0.5 + confidence / 2)
+    for the normal distribution, which it approaches as df grows.
+    """
+    low, high = 0.0, 1.0
+    while t_probability(high, df) < confidence:
+        low, high = high, high * 2
+    for _ in range(100):
+        middle = (low + high) / 2
+        if t_probability(middle, df) < confidence:
+            low = middle
+        else:
+            high = middle
+    return high
+
+
+def spread_order(count: int) -> list:
+    """Order segment indices so that every prefix of the order is spread evenly over the timeline.
+
+    The order follows the base 2 van der Corput sequence, so 8 segments are
+    ordered 0, 4, 2, 6, 1, 5, 3, 7.
+    """
+    order = []
+    seen = set()
+    k = 0
+    while len(order) < count:
+        position, denominator, n = 0.0, 1.0, k
+        while n > 0:
+            denominator *= 2
+            position += (n & 1) / denominator
+            n >>= 1
+        index = int(position * count)
+        if index not in seen:
+            seen.add(index)
+            order.append(index)
+        k += 1
+    return order
+
+
+class VMAF_Race:
+    """Keeps a running estimate of every candidate's pooled VMAF score, and finds the candidates that can no longer win.
+
+    A candidate is an encoded video split into segments. Every finished
+    segment is one sample of its pooled score, and the candidate's confidence
+    interval comes from the spread of its segment means, weighted by their
+    frame counts like a cluster sample, and widened by Student's t
+    distribution while only a few segments are finished. The interval shrinks
+    to the exact pooled score once every segment is finished. Candidates with
+    a full result from an earlier calculation take part with their exact
+    score.
+
+    A candidate loses once it can neither reach the top "top" scores nor the
+    "target" score: at least "top" other candidates are certainly better, and
+    its upper bound is below the target.
+    """
+
+    def __init__(
+        self,
+        top: int,
+        target: Optional[float] = 0.0,
+        confidence: Optional[float] = 0.95,
+        min_segments: Optional[int] = 2,
+    ):
+        self._top = top
+        self._target = target
+        self._confidence = confidence
+        self._quantiles = {}
+        self._min_segments = max(2, min_segments)
+        self._candidates = {}
+
+    def add_candidate(
+        self,
+        enc: str,
+        segments: int,
+    ):
+        """Start racing an encoded video that is split into the given number of segments."""
+        self._candidates[enc] = {"segments": segments, "samples": [], "exact": None, "eliminated": False}
+
+    def add_segment(
+        self,
+        enc: str,
+        scores: list,
+    ):
+        """Add the per-frame scores of one finished segment of a candidate."""
+        if enc in self._candidates and len(scores) > 0:
+            self._candidates[enc]["samples"].append((sum(scores), len(scores)))
+
+    def add_result(
+        self,
+        enc: str,
+        score: float,
+    ):
+        """Set the exact pooled score of a candidate, adding it to the race if needed."""
+        if enc not in self._candidates:
+            self.add_candidate(enc, 0)
+        self._candidates[enc]["exact"] = score
+
+    def eliminate(self, enc: str):
+        self._candidates[enc]["eliminated"] = True
+
+    def get_estimate(self, enc: str) -> dict:
+        """Get a candidate's estimated pooled score and its confidence interval.
+
+        Returns:
+            dict: The "mean", "low" and "high" scores, and the "frames" and "segments" the estimate is based on.
+        """
+        candidate = self._candidates[enc]
+        samples = candidate["samples"]
+        frames = sum([count for _, count in samples])
+        estimate = {
+            "mean": None,
+            "low": SCORE_RANGE[0],
+            "high": SCORE_RANGE[1],
+            "frames": frames,
+            "segments": len(samples),
+            "total_segments": candidate["segments"],
+        }
+        if candidate["exact"] is not None:
+            estimate.update({"mean": candidate["exact"], "low": candidate["exact"], "high": candidate["exact"]})
+            return estimate
+        if frames == 0:
+            return estimate
+
+        mean = sum([total for total, _ in samples]) / frames
+        estimate["mean"] = mean
+        n = len(samples)
+        if n < self._min_segments:
+            return estimate
+
+        # Variance of a ratio estimator over a sample of n out of N clusters,
+        # with the finite population correction making it exact at n == N.
+        # The spread of only a few segments is itself uncertain, so the
+        # interval follows Student's t distribution with n - 1 degrees of
+        # freedom instead of the normal distribution
+        average_frames = frames / n
+        spread = sum([(total - mean * count) ** 2 for total, count in samples]) / (n - 1)
+        correction = max(0.0, 1.0 - n / max(n, candidate["segments"]))
+        if n - 1 not in self._quantiles:
+            self._quantiles[n - 1] = t_quantile(self._confidence, n - 1)
+        margin = self._quantiles[n - 1] * math.sqrt(correction * spread / n) / average_frames
+        estimate["low"] = max(SCORE_RANGE[0], mean - margin)
+        estimate["high"] = min(SCORE_RANGE[1], mean + margin)
+        return estimate
+
+    def find_losers(self) -> list:
+        """Find every candidate still being calculated that can no longer reach the top scores or the target score."""
+        bounds = {
+            enc: self.get_estimate(enc) for enc, candidate in self._candidates.items() if not candidate["eliminated"]
+        }
+        losers = []
+        for enc, estimate in bounds.items():
+            candidate = self._candidates[enc]
+            if candidate["exact"] is not None or len(candidate["samples"]) < self._min_segments:
+                continue
+            beaten = len([other for other, bound in bounds.items() if other != enc and bound["low"] > estimate["high"]])
+            can_top = self._top > 0 and beaten < self._top
+            can_target = self._target > 0 and estimate["high"] >= self._target
+            if not can_top and not can_target:
+                losers.append(enc)
+        return losers
@@ -5,6 +5,7 @@ from pathlib import Path
 import defusedxml.ElementTree as xml
 
 from vmaf_common import print_err
+from vmaf_frame_store import STORE_FORMAT, read_store
 
 # from vmaf_config_handler import VMAF_Config_Handler
 from vmaf_file_handler import VMAF_File_Handler
@@ -26,6 +27,7 @@ class VMAF_Report_Handler(VMAF_File_Handler):
             filename = ""
             if file:
                 filename = file
+                self.file = filename
 
                 if Path(filename).exists() and Path(filename).is_file():
                     # Get file extension to determine report file type.
@@ -42,7 +44,15 @@ class VMAF_Report_Handler(VMAF_File_Handler):
 
     def check_type(self, filename):
         ext = Path(filename).suffix.replace(".", "")
-        if ext.lower() == "json":
+        if ext.lower() == STORE_FORMAT:
+            # Frame stores are binary, so none of the text checks apply
+            try:
+                read_store(filename)
+            except ValueError as ve:
+                raise OSError(str(ve))
+            self._type = STORE_FORMAT
+            return
+        elif ext.lower() == "json":
             self._type = "json"
         elif ext.lower() == "xml":
             self._type = "xml"
@@ -104,6 +114,8 @@ class VMAF_Report_Handler(VMAF_File_Handler):
             return self.read_xml()
         elif self._type == "csv":
             return self.read_csv()
+        elif self._type == STORE_FORMAT:
+            return self.read_bin()
 
     def read_xml(self):
         tree = xml.parse(self.file)
@@ -139,3 +151,24 @@ class VMAF_Report_Handler(VMAF_File_Handler):
                         data["MS-SSIM"].append(round(float(tmp), 3))
 
         return data
+
+    def read_bin(self):
+        header, _, values = read_store(self.file)
+        self.vmaf_version = header["version"]
+
+        # libvmaf's metric names for every datapoint
+        names = {
+            "VMAF": ["vmaf"],
+            "PSNR": ["psnr", "psnr_y"],
+            "SSIM": ["ssim", "float_ssim"],
+            "MS-SSIM": ["ms_ssim", "float_ms_ssim"],
+        }
+        data = {}
+        for point in self._datapoints:
+            data[point] = []
+            for name in names.get(point, []):
+                if name in values:
+                    data[point] = [round(float(value), 3) for value in values[name]]
+                    break
+
+        return data
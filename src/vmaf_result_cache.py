@@ -0,0 +1,166 @@
+import hashlib
+import os
+import shutil
+from datetime import datetime
+from json import dump, dumps, load
+from pathlib import Path
+from typing import Optional, Union
+
+# Number of evenly spaced blocks hashed for a file's fingerprint, and their size
+FINGERPRINT_SAMPLES = 16
+FINGERPRINT_BLOCK_SIZE = 64 * 1024
+
+# Fingerprints already calculated in this run, keyed on path, size and mtime
+_fingerprints = {}
+
+
+def fingerprint(
+    file: Union[str, Path],
+    samples: Optional[int] = FINGERPRINT_SAMPLES,
+    block_size: Optional[int] = FINGERPRINT_BLOCK_SIZE,
+) -> str:
+    """Create a fast fingerprint of a file's contents from its size and a hash of sampled blocks.
+
+    Only a few blocks spread over the whole file are read, including the start
+    and end where containers keep their headers and indexes, so even very large
+    video files are fingerprinted almost instantly. The fingerprint does not
+    depend on the file's name or location.
+
+    Args:
+        file (Union[str, Path]): File to fingerprint.
+        samples (Optional[int]): Number of blocks to hash. Defaults to FINGERPRINT_SAMPLES.
+        block_size (Optional[int]): Size of every block in bytes. Defaults to FINGERPRINT_BLOCK_SIZE.
+
+    Returns:
+        str: The file's size and the hex digest of its sampled blocks.
+    """
+    stat = os.stat(str(file))
+    memo_key = (str(Path(file).resolve()), stat.st_size, stat.st_mtime_ns, samples, block_size)
+    if memo_key in _fingerprints:
+        return _fingerprints[memo_key]
+
+    digest = hashlib.blake2b(digest_size=16)
+    with open(str(file), "rb") as reader:
+        if stat.st_size <= samples * block_size:
+            for chunk in iter(lambda: reader.read(1024 * 1024), b""):
+                digest.update(chunk)
+        else:
+            step = (stat.st_size - block_size) / (samples - 1)
+            for i in range(samples):
+                reader.seek(int(i * step))
+                digest.update(reader.read(block_size))
+
+    result = "{}-{}".format(stat.st_size, digest.hexdigest())
+    _fingerprints[memo_key] = result
+    return result
+
+
+def cache_key(
+    reference: str,
+    encoded: str,
+    graph: str,
+    models: list,
+) -> str:
+    """Combine everything that decides a calculation's results into a single cache key.
+
+    Args:
+        reference (str): Fingerprint of the reference video file.
+        encoded (str): Fingerprint of the encoded video file.
+        graph (str): The exact filter graph, built without a log path.
+        models (list): VMAF model versions used.
+
+    Returns:
+        str: Hex digest identifying the calculation.
+    """
+    data = dumps(
+        {"reference": reference, "encoded": encoded, "graph": graph, "models": sorted(models)},
+        sort_keys=True,
+    )
+    return hashlib.blake2b(data.encode("utf-8"), digest_size=20).hexdigest()
+
+
+class VMAF_Result_Cache:
+    """Keeps a copy of every finished per-frame log, addressed by the cache key of the calculation that made it.
+
+    Every entry is the log file itself plus a small JSON file with the scores,
+    so a matching calculation can be satisfied without running FFmpeg at all,
+    no matter what the reference and encoded video files are called or where
+    they are stored.
+    """
+
+    def __init__(self, directory: Union[str, Path]):
+        self._dir = Path(directory)
+        self._dir.mkdir(parents=True, exist_ok=True)
+
+    def _entry(self, key: str) -> Path:
+        return self._dir.joinpath(key[:2], key)
+
+    def lookup(
+        self,
+        key: str,
+        log_format: str,
+    ) -> Optional[dict]:
+        """Find a cached result.
+
+        Returns:
+            Optional[dict]: The cached "scores" and the "log" file, or None if nothing matches.
+        """
+        entry = self._entry(key)
+        meta_file = entry.with_suffix(".json")
+        log_file = entry.with_suffix("." + log_format)
+        if not meta_file.exists() or not log_file.exists():
+            return None
+        try:
+            with open(str(meta_file), "r") as reader:
+                meta = load(reader)
+        except (OSError, ValueError):
+            return None
+        meta["log"] = log_file
+        return meta
+
+    def store(
+        self,
+        key: str,
+        log_path: Union[str, Path],
+        log_format: str,
+        scores: dict,
+        source: Optional[str] = None,
+    ):
+        """Copy a finished log file into the cache along with its scores."""
+        entry = self._entry(key)
+        entry.parent.mkdir(exist_ok=True)
+
+        # Copy to temporary files first so an interrupted copy never looks
+        # like a valid entry
+        log_file = entry.with_suffix("." + log_format)
+        tmp_log = log_file.with_name(log_file.name + ".tmp")
+        shutil.copyfile(str(log_path), str(tmp_log))
+        os.replace(str(tmp_log), str(log_file))
+
+        meta_file = entry.with_suffix(".json")
+        tmp_meta = meta_file.with_name(meta_file.name + ".tmp")
+        with open(str(tmp_meta), "w") as writer:
+            dump(
+                {"scores": scores, "source": source, "date": datetime.now().isoformat(timespec="seconds")},
+                writer,
+                indent=4,
+                sort_keys=True,
+            )
+        os.replace(str(tmp_meta), str(meta_file))
+
+    def restore(
+        self,
+        key: str,
+        log_format: str,
+        log_path: Union[str, Path],
+    ) -> Optional[dict]:
+        """Copy a cached log file to the given location.
+
+        Returns:
+            Optional[dict]: The cached scores, or None if nothing matches.
+        """
+        meta = self.lookup(key, log_format)
+        if meta is None:
+            return None
+        shutil.copyfile(str(meta["log"]), str(log_path))
+        return meta["scores"]
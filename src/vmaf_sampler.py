@@ -0,0 +1,123 @@
+import random
+from typing import Optional
+
+from vmaf_segmenter import plan_segments
+
+# Percentiles of the per-frame scores reported by an estimate
+ESTIMATE_PERCENTILES = [1, 5, 25, 50]
+
+# Number of bootstrap resamples used for the confidence bounds of an estimate
+BOOTSTRAP_ROUNDS = 500
+
+
+def plan_samples(
+    total_frames: int,
+    fps: float,
+    count: int,
+    sample_frames: int,
+    scenes: Optional[list] = None,
+    seed: Optional[int] = 0,
+) -> list:
+    """Pick one short sample from every stratum of a video's timeline.
+
+    The timeline is split into "count" strata the same way segments are, so
+    strata boundaries follow scene changes, and every stratum gets one sample
+    at a random position inside of it. The seed keeps the samples the same
+    between runs, so their results can be reused.
+
+    Args:
+        total_frames (int): Number of frames in the video.
+        fps (float): Frame rate of the video.
+        count (int): Number of strata, and so samples, to pick.
+        sample_frames (int): Number of frames in every sample.
+        scenes (Optional[list]): Timestamps in seconds of scene changes. Defaults to None.
+        seed (Optional[int]): Seed of the sample positions. Defaults to 0.
+
+    Returns:
+        list: Dicts with the "start_frame" and "frames" of every sample, and the "weight" of its stratum.
+    """
+    rng = random.Random(seed)
+    sample_frames = max(1, min(sample_frames, total_frames))
+    strata = plan_segments(total_frames, fps, count, scenes, min_frames=sample_frames)
+    samples = []
+    for stratum in strata:
+        length = stratum["frames"] if stratum["frames"] is not None else total_frames - stratum["start_frame"]
+        frames = min(sample_frames, length)
+        samples.append(
+            {
+                "start_frame": stratum["start_frame"] + rng.randint(0, length - frames),
+                "frames": frames,
+                "weight": length / total_frames,
+            }
+        )
+    return samples
+
+
+def weighted_percentile(
+    values: list,
+    percentile: float,
+) -> float:
+    """Find a percentile of (value, weight) pairs."""
+    ordered = sorted(values)
+    total = sum([weight for _, weight in ordered])
+    threshold = total * percentile / 100
+    running = 0.0
+    for value, weight in ordered:
+        running += weight
+        if running >= threshold:
+            return value
+    return ordered[-1][0]
+
+
+def _summarize(samples: list) -> dict:
+    # Every frame of a sample stands for its share of the sample's stratum
+    values = [(value, weight / len(scores)) for weight, scores in samples for value in scores]
+    total = sum([weight for _, weight in values])
+    summary = {"mean": sum([value * weight for value, weight in values]) / total}
+    for percentile in ESTIMATE_PERCENTILES:
+        summary["p{}".format(percentile)] = weighted_percentile(values, percentile)
+    return summary
+
+
+def estimate_scores(
+    samples: list,
+    confidence: Optional[float] = 0.95,
+    rounds: Optional[int] = BOOTSTRAP_ROUNDS,
+    seed: Optional[int] = 0,
+) -> dict:
+    """Estimate the pooled mean and percentiles of a whole video's per-frame scores from its stratified samples.
+
+    Frames within a sample are strongly correlated, so the confidence bounds
+    come from a bootstrap that resamples whole samples rather than frames.
+
+    Args:
+        samples (list): (stratum weight, per-frame scores) pairs of every sample.
+        confidence (Optional[float]): Confidence level of the bounds. Defaults to 0.95.
+        rounds (Optional[int]): Number of bootstrap resamples. Defaults to BOOTSTRAP_ROUNDS.
+        seed (Optional[int]): Seed of the bootstrap. Defaults to 0.
+
+    Returns:
+        dict: The "mean" and every "p<percentile>" from ESTIMATE_PERCENTILES, each as a dict with its "value",
+            "low" and "high" bound.
+    """
+    samples = [(weight, scores) for weight, scores in samples if len(scores) > 0]
+    if len(samples) == 0:
+        raise ValueError("No samples with scores to estimate from")
+
+    estimate = _summarize(samples)
+    rng = random.Random(seed)
+    resampled = {key: [] for key in estimate.keys()}
+    for _ in range(rounds if len(samples) > 1 else 0):
+        for key, value in _summarize(rng.choices(samples, k=len(samples))).items():
+            resampled[key].append(value)
+
+    result = {}
+    for key, value in estimate.items():
+        bounds = sorted(resampled[key])
+        if len(bounds) == 0:
+            result[key] = {"value": value, "low": value, "high": value}
+            continue
+        low = bounds[int((1 - confidence) / 2 * (len(bounds) - 1))]
+        high = bounds[int((1 + confidence) / 2 * (len(bounds) - 1))]
+        result[key] = {"value": value, "low": min(low, value), "high": max(high, value)}
+    return result
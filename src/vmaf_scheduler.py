@@ -0,0 +1,92 @@
+import heapq
+from typing import Callable, Optional
+
+# Relative cost of every extra libvmaf feature compared to a VMAF model, per
+# pixel of every frame
+FEATURE_WEIGHTS = {
+    "float_ssim": 0.5,
+    "float_ms_ssim": 1.0,
+    "psnr": 0.1,
+    "psnr_hvs": 1.5,
+}
+
+
+def estimate_cost(
+    frames: int,
+    width: int,
+    height: int,
+    models: int,
+    features: Optional[list] = None,
+    subsamples: Optional[int] = None,
+) -> float:
+    """Estimate the relative amount of work of calculating one encoded video (or one segment of it).
+
+    The estimate is frames x pixels x metrics, where every VMAF model counts as
+    one metric and every extra feature counts by its weight in FEATURE_WEIGHTS.
+    Decoding every frame is counted as one more metric, since it is not
+    affected by subsampling.
+
+    Args:
+        frames (int): Number of frames to calculate.
+        width (int): Width of the videos.
+        height (int): Height of the videos.
+        models (int): Number of VMAF models calculated.
+        features (Optional[list]): Extra libvmaf features calculated. Defaults to None.
+        subsamples (Optional[int]): libvmaf's n_subsample, only every n-th frame gets its metrics calculated.
+
+    Returns:
+        float: Relative cost, only comparable with other estimates from this function.
+    """
+    metrics = models + sum([FEATURE_WEIGHTS.get(feature, 1.0) for feature in features or []])
+    return max(0, frames) * width * height * (1.0 + metrics / max(1, subsamples or 1))
+
+
+def order_jobs(
+    jobs: list,
+    cost: Callable[[dict], float],
+    group: Optional[Callable[[dict], str]] = None,
+) -> list:
+    """Order jobs so that the most expensive ones are dispatched first.
+
+    Dispatching the longest jobs first (LPT) to whichever slot frees up next
+    keeps a long job from running alone at the end. When jobs are grouped, like
+    all segments of one encoded video, the groups are ordered by their total
+    cost and each group's jobs stay together, so every encoded video finishes
+    as early as possible.
+
+    Args:
+        jobs (list): Jobs to order.
+        cost (Callable[[dict], float]): Gives the estimated cost of a job.
+        group (Optional[Callable[[dict], str]]): Gives the group of a job. Defaults to None for no grouping.
+
+    Returns:
+        list: The same jobs, in dispatch order.
+    """
+    if group is None:
+        return sorted(jobs, key=cost, reverse=True)
+
+    groups = {}
+    for job in jobs:
+        groups.setdefault(group(job), []).append(job)
+    ordered = sorted(groups.values(), key=lambda grouped: sum([cost(job) for job in grouped]), reverse=True)
+    return [job for grouped in ordered for job in sorted(grouped, key=cost, reverse=True)]
+
+
+def estimate_makespan(
+    costs: list,
+    slots: int,
+) -> tuple:
+    """Simulate dispatching jobs in the given order to the first free slot.
+
+    Args:
+        costs (list): Estimated cost of every job, in dispatch order.
+        slots (int): Number of jobs running at the same time.
+
+    Returns:
+        tuple: The total cost of the busiest slot, and the average total cost of all slots.
+    """
+    loads = [0.0] * max(1, slots)
+    heapq.heapify(loads)
+    for job_cost in costs:
+        heapq.heappush(loads, heapq.heappop(loads) + job_cost)
+    return max(loads), sum(loads) / len(loads)
@@ -0,0 +1,110 @@
+import re
+import subprocess as sp
+from typing import Optional
+
+import ffmpy
+
+SCENE_PTS = re.compile(r"pts_time:\s*([0-9.]+)")
+
+
+def detect_scene_changes(
+    ffmpeg: str,
+    file: str,
+    threshold: Optional[float] = 0.3,
+) -> list:
+    """Find the timestamps of scene changes in a video file with FFmpeg's scene detection.
+
+    The video is downscaled before the detection to keep this pass much cheaper
+    than the VMAF calculation itself.
+
+    Args:
+        ffmpeg (str): Path to the FFmpeg executable.
+        file (str): Video file to scan for scene changes.
+        threshold (Optional[float]): Scene change score above which a frame starts a new scene. Defaults to 0.3.
+
+    Returns:
+        list: Timestamps in seconds of every detected scene change.
+    """
+    ff = ffmpy.FFmpeg(
+        executable=ffmpeg,
+        global_options=["-hide_banner", "-nostats"],
+        inputs={str(file): None},
+        outputs={"-": "-an -sn -vf scale=320:-2,select='gt(scene\\,{})',showinfo -f null".format(threshold)},
+    )
+    err = ff.run(stdout=sp.PIPE, stderr=sp.PIPE)[1]
+
+    scenes = []
+    for line in err.decode("utf-8", errors="replace").split("\n"):
+        if "Parsed_showinfo" in line:
+            match = SCENE_PTS.search(line)
+            if match:
+                scenes.append(float(match.group(1)))
+    return scenes
+
+
+def plan_segments(
+    total_frames: int,
+    fps: float,
+    count: int,
+    scenes: Optional[list] = None,
+    min_frames: Optional[int] = None,
+) -> list:
+    """Split a video's timeline into consecutive segments, preferring to cut at scene changes.
+
+    Boundaries are first placed at equal intervals, then moved to the closest
+    scene change within a quarter of a segment's length.
+
+    Args:
+        total_frames (int): Number of frames in the video.
+        fps (float): Frame rate of the video.
+        count (int): Number of segments to split the video into.
+        scenes (Optional[list]): Timestamps in seconds of scene changes. Defaults to None.
+        min_frames (Optional[int]): Minimum number of frames per segment. Defaults to 2 seconds worth of frames.
+
+    Returns:
+        list: Dicts with the "start_frame" and "frames" of every segment, the last one having "frames" set to None.
+    """
+    if min_frames is None:
+        min_frames = max(1, int(round(fps * 2)))
+    count = max(1, min(count, total_frames // max(1, min_frames)))
+    if count == 1:
+        return [{"start_frame": 0, "frames": None}]
+
+    scene_frames = sorted(set(int(round(s * fps)) for s in (scenes or [])))
+    step = total_frames / count
+    tolerance = step / 4
+
+    boundaries = [0]
+    for i in range(1, count):
+        target = int(round(step * i))
+        candidates = [f for f in scene_frames if abs(f - target) <= tolerance]
+        if len(candidates) > 0:
+            target = min(candidates, key=lambda f: abs(f - target))
+        if target - boundaries[-1] >= min_frames and total_frames - target >= min_frames:
+            boundaries.append(target)
+
+    segments = []
+    for i, start in enumerate(boundaries):
+        frames = boundaries[i + 1] - start if i + 1 < len(boundaries) else None
+        segments.append({"start_frame": start, "frames": frames})
+    return segments
+
+
+def segment_input_options(
+    segment: dict,
+    fps: float,
+    offset: Optional[int] = 0,
+) -> str:
+    """Create the FFmpeg input options that limit an input to a single segment.
+
+    The seek point sits half a frame before the segment's first frame so that
+    rounding in the timestamps can never drop or repeat a frame at a boundary.
+    An offset moves the segment that many frames later in this input only, for
+    inputs that start with frames the other input does not have.
+    """
+    opts = []
+    if segment["start_frame"] + offset > 0:
+        opts.append("-ss {:.6f}".format((segment["start_frame"] + offset - 0.5) / fps))
+    if segment["frames"] is not None:
+        opts.append("-t {:.6f}".format(segment["frames"] / fps))
+    return " ".join(opts)
@@ -0,0 +1,174 @@
+from pathlib import Path
+from typing import Optional
+
+# A running job is a straggler once its throughput falls below this share of
+# the throughput expected from its estimated cost
+STRAGGLER_RATIO = 0.5
+
+# Seconds a job has to run before its throughput is trusted, since starting
+# FFmpeg and opening the video files makes every job slow at first
+STRAGGLER_WARMUP = 10.0
+
+
+def speculative_path(log_path: str) -> str:
+    """Location of the log file a speculative duplicate writes instead of the original job's log file."""
+    log = Path(log_path)
+    return str(log.with_name("{}.spec{}".format(log.stem, log.suffix))).replace("\\", "/")
+
+
+def speculative_job(job: dict) -> dict:
+    """Copy a job so the copy writes every log file to its speculative_path, and can run next to the original."""
+    parts = {}
+    for part in job["parts"]:
+        parts[id(part)] = dict(part, log_path=speculative_path(part["log_path"]))
+    duplicate = dict(job, parts=list(parts.values()), speculative=True)
+    if "clips" in job:
+        duplicate["clips"] = [dict(clip, parts=[parts[id(part)] for part in clip["parts"]]) for clip in job["clips"]]
+    return duplicate
+
+
+class VMAF_Speculator:
+    """Finds running jobs that are far slower than their estimated cost promises, and keeps track of their duplicates.
+
+    A job's expected throughput is the cost per second measured for the jobs
+    that already finished in this run, or else the rate predicted from
+    earlier runs, or else the median throughput of every running job. A job
+    running at less than "ratio" of it is a straggler, when a fresh duplicate
+    would finish before the job itself. Every straggler gets at most one
+    duplicate, and the first of the two to finish wins. A copy that failed
+    leaves the other copy running, and the job only fails once both did.
+    """
+
+    def __init__(
+        self,
+        rate: Optional[float] = None,
+        ratio: Optional[float] = STRAGGLER_RATIO,
+        warmup: Optional[float] = STRAGGLER_WARMUP,
+    ):
+        """
+        Args:
+            rate (Optional[float]): Cost per second every process is expected to get through, like from
+                predict_rate. Defaults to None until jobs of this run finish.
+            ratio (Optional[float]): Share of the expected throughput below which a job straggles. Defaults to
+                STRAGGLER_RATIO.
+            warmup (Optional[float]): Seconds a job runs before it can straggle. Defaults to STRAGGLER_WARMUP.
+        """
+        self._rate = rate
+        self._ratio = ratio
+        self._warmup = warmup
+        self._rates = []
+        self._partners = {}
+        self._duplicates = set()
+        self._tried = set()
+        self._failed = set()
+        self.stats = {"launched": 0, "won": 0, "failed": 0, "used": 0.0, "wasted": 0.0, "discarded": 0.0}
+
+    def add_finished(
+        self,
+        cost: float,
+        wall: Optional[float],
+    ):
+        """Add the estimated cost and wall time of a finished job to the throughput expected from every job."""
+        if cost > 0 and wall is not None and wall > 0:
+            self._rates.append(cost / wall)
+
+    def _expected_rate(self, live_rates: list) -> Optional[float]:
+        if len(self._rates) > 0:
+            rates = self._rates
+        elif self._rate is not None:
+            return self._rate
+        else:
+            rates = live_rates
+        if len(rates) == 0:
+            return None
+        rates = sorted(rates)
+        return rates[len(rates) // 2]
+
+    def find_stragglers(
+        self,
+        running: dict,
+        slots: int,
+    ) -> list:
+        """Find the running jobs that would finish sooner if they were started again.
+
+        Args:
+            running (dict): Every running job by its key, with its estimated "cost", the "frame" it is at, its
+                "total" frames and the seconds it has been running as "elapsed".
+            slots (int): Number of idle processes that can run a duplicate.
+
+        Returns:
+            list: Keys of up to slots stragglers that never had a duplicate, the one that would gain the most first.
+        """
+        live_rates = {}
+        for key, job in running.items():
+            if job["total"] > 0 and job["elapsed"] > 0:
+                live_rates[key] = job["cost"] * min(job["frame"], job["total"]) / job["total"] / job["elapsed"]
+        expected = self._expected_rate(list(live_rates.values()))
+        if expected is None or expected <= 0 or slots <= 0:
+            return []
+
+        gains = []
+        for key, rate in live_rates.items():
+            job = running[key]
+            if key in self._tried or job["elapsed"] < self._warmup or rate >= expected * self._ratio:
+                continue
+            left = job["cost"] * (1 - min(job["frame"], job["total"]) / job["total"])
+            remaining = left / rate if rate > 0 else float("inf")
+            fresh = job["cost"] / expected
+            if fresh < remaining:
+                gains.append((remaining - fresh, key))
+        gains.sort(key=lambda gain: gain[0], reverse=True)
+        return [key for _, key in gains[:slots]]
+
+    def add_duplicate(
+        self,
+        original,
+        duplicate,
+    ):
+        """Pair a straggling job with the speculative duplicate started for it."""
+        self._partners[original] = duplicate
+        self._partners[duplicate] = original
+        self._duplicates.add(duplicate)
+        self._tried |= set([original, duplicate])
+        self.stats["launched"] += 1
+
+    def partner(self, key):
+        """The other job of a straggler and its duplicate, or None for a job without a running duplicate."""
+        return self._partners.get(key)
+
+    def is_duplicate(self, key) -> bool:
+        return key in self._duplicates
+
+    def fail(self, key):
+        """Record that one copy of a straggler and its duplicate failed, while the other copy keeps running."""
+        self._failed.add(key)
+        self.stats["failed"] += 1
+
+    def has_failed(self, key) -> bool:
+        return key in self._failed
+
+    def settle(
+        self,
+        finished,
+        duplicate_wall: float,
+        loser_wall: float,
+        failed: Optional[bool] = False,
+    ):
+        """Record which of a straggler and its duplicate won, once the other one is stopped or failed.
+
+        Args:
+            finished: Key of the copy that finished last, the winner unless both copies failed.
+            duplicate_wall (float): Seconds the duplicate ran.
+            loser_wall (float): Seconds the copy that lost or failed first ran.
+            failed (Optional[bool]): Both copies failed. Defaults to False.
+        """
+        self._partners.pop(self._partners.pop(finished))
+        self.stats["used"] += duplicate_wall
+        if failed:
+            self.stats["failed"] += 1
+            self.stats["wasted"] += duplicate_wall
+        elif finished in self._duplicates:
+            self.stats["won"] += 1
+            self.stats["discarded"] += loser_wall
+        else:
+            self.stats["wasted"] += duplicate_wall
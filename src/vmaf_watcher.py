@@ -0,0 +1,268 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+from pathlib import Path
+from time import sleep, time
+from typing import Iterable, List, Optional, Union
+
+# inotify event masks, from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE_SELF
+
+# wd, mask, cookie and name length of every inotify event
+EVENT_HEADER = struct.Struct("iIII")
+
+# Seconds a file has to keep the same size and modification time after its
+# writer closed it, in case the writer opens it again right away
+CLOSED_SETTLE = 1.0
+
+
+def _load_inotify():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+class VMAF_Folder_Watcher:
+    """Watches directories for new video files, and hands out every file once it is completely written.
+
+    On Linux the directories are watched with inotify, so new files are seen
+    as soon as they appear, and a file is complete once its writer closed it
+    or it was moved into place. Everywhere else, or when forced to, the
+    directories are polled, which also sees files written by other computers
+    to network shares, where inotify sees nothing. Either way a file is only
+    handed out once its size and modification time stopped changing.
+    """
+
+    def __init__(
+        self,
+        directories: Iterable[Union[str, Path]],
+        exts: Iterable[str],
+        recurse: Optional[bool] = False,
+        settle: Optional[float] = 5.0,
+        interval: Optional[float] = 10.0,
+        polling: Optional[bool] = False,
+        ignore: Optional[Iterable[Union[str, Path]]] = None,
+    ):
+        """
+        Args:
+            directories (Iterable[Union[str, Path]]): Directories to watch.
+            exts (Iterable[str]): Extensions of the files to look for, without the leading dot.
+            recurse (Optional[bool]): Watch every subdirectory as well. Defaults to False.
+            settle (Optional[float]): Seconds a file's size and modification time have to stay the same before it
+                is handed out. Defaults to 5.0.
+            interval (Optional[float]): Seconds between scans when polling. Defaults to 10.0.
+            polling (Optional[bool]): Poll even where inotify is available. Defaults to False.
+            ignore (Optional[Iterable[Union[str, Path]]]): Directories whose files are never handed out, like the
+                one finished files are moved to. Defaults to None.
+        """
+        self._directories = [Path(directory) for directory in directories]
+        self._exts = set([ext.lower().lstrip(".") for ext in exts])
+        self._recurse = recurse
+        self._settle = settle
+        self._interval = interval
+        self._ignore = [Path(directory).resolve() for directory in ignore or []]
+        # Files not handed out yet, with their last seen size and modification
+        # time, when those last changed, and whether their writer closed them
+        self._pending = {}
+        # Size and modification time of every file handed out, so a different
+        # file appearing under the same name later is handed out again
+        self._handed_out = {}
+        self._next_scan = 0.0
+
+        self._fd = None
+        self._watches = {}
+        libc = None if polling else _load_inotify()
+        if libc is not None:
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd >= 0:
+                self._libc = libc
+                self._fd = fd
+                for directory in self._directories:
+                    self._add_watch(directory)
+            else:
+                print("Could not start inotify, polling instead: {}".format(os.strerror(ctypes.get_errno())))
+        self._scan()
+
+    @property
+    def uses_inotify(self) -> bool:
+        return self._fd is not None
+
+    def _add_watch(self, directory: Path):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(str(directory)), WATCH_MASK)
+        if wd < 0:
+            print("Could not watch {}: {}".format(directory, os.strerror(ctypes.get_errno())))
+            return
+        self._watches[wd] = directory
+        if self._recurse:
+            try:
+                for entry in os.scandir(str(directory)):
+                    if entry.is_dir(follow_symlinks=False) and not self._ignored(Path(entry.path)):
+                        self._add_watch(Path(entry.path))
+            except OSError:
+                pass
+
+    def _ignored(self, path: Path) -> bool:
+        resolved = path.resolve()
+        return any([resolved == ignore or ignore in resolved.parents for ignore in self._ignore])
+
+    def _wanted(self, path: Path) -> bool:
+        return path.suffix.lower().lstrip(".") in self._exts and not self._ignored(path.parent)
+
+    def _track(
+        self,
+        path: Path,
+        closed: Optional[bool] = False,
+    ):
+        key = str(path).replace("\\", "/")
+        if not self._wanted(path):
+            return
+        try:
+            stat = os.stat(key)
+        except OSError:
+            self._pending.pop(key, None)
+            return
+        identity = (stat.st_size, stat.st_mtime_ns)
+        if self._handed_out.get(key) == identity:
+            return
+        entry = self._pending.get(key)
+        if entry is None or entry["identity"] != identity:
+            self._pending[key] = {"identity": identity, "since": time(), "closed": closed}
+        elif closed:
+            entry["closed"] = True
+
+    def _scan(
+        self,
+        directories: Optional[List[Path]] = None,
+    ):
+        # os.scandir gets the file names and types from a single directory
+        # read, so only candidate files are stat'ed
+        stack = list(directories or self._directories)
+        while len(stack) > 0:
+            directory = stack.pop()
+            try:
+                entries = list(os.scandir(str(directory)))
+            except OSError:
+                continue
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if self._recurse and not self._ignored(Path(entry.path)):
+                        stack.append(Path(entry.path))
+                elif entry.is_file():
+                    self._track(Path(entry.path))
+
+    def _read_events(self):
+        try:
+            data = os.read(self._fd, 65536)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + EVENT_HEADER.size : offset + EVENT_HEADER.size + length].rstrip(b"\0")
+            offset += EVENT_HEADER.size + length
+
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost, so look at everything again
+                self._scan()
+                continue
+            directory = self._watches.get(wd)
+            if directory is None:
+                continue
+            if mask & (IN_IGNORED | IN_DELETE_SELF):
+                self._watches.pop(wd, None)
+                continue
+            path = directory.joinpath(os.fsdecode(name))
+            if mask & IN_ISDIR:
+                if self._recurse and mask & (IN_CREATE | IN_MOVED_TO) and not self._ignored(path):
+                    # Files may have been written before the watch existed
+                    self._add_watch(path)
+                    self._scan([path])
+                continue
+            entry = self._pending.get(str(path).replace("\\", "/"))
+            if mask == IN_MODIFY and entry is not None:
+                # Writers cause one event per write, so only note that the
+                # file is still changing instead of looking at it every time
+                entry["since"] = time()
+                entry["closed"] = False
+                continue
+            self._track(path, closed=bool(mask & (IN_CLOSE_WRITE | IN_MOVED_TO)))
+
+    def _ready(self) -> List[str]:
+        now = time()
+        ready = []
+        for key, entry in list(self._pending.items()):
+            settle = CLOSED_SETTLE if entry["closed"] else self._settle
+            if now - entry["since"] < settle:
+                continue
+            # Look at the file once more, it may have changed without an event
+            # reaching us
+            previous = entry["identity"]
+            self._track(Path(key), closed=entry["closed"])
+            entry = self._pending.get(key)
+            if entry is None or entry["identity"] != previous:
+                continue
+            del self._pending[key]
+            self._handed_out[key] = previous
+            ready.append(key)
+        return ready
+
+    def _next_deadline(self) -> Optional[float]:
+        deadlines = [
+            entry["since"] + (CLOSED_SETTLE if entry["closed"] else self._settle) for entry in self._pending.values()
+        ]
+        if self._fd is None:
+            deadlines.append(self._next_scan)
+        return min(deadlines) if len(deadlines) > 0 else None
+
+    def wait(self, timeout: Optional[float] = 0.0) -> List[str]:
+        """Wait up to timeout seconds for files that are completely written.
+
+        Returns as soon as there are any, and every file is only handed out
+        once, unless it is replaced by a different file with the same name.
+
+        Returns:
+            List[str]: The new files, with forward slashes like search_handler's results.
+        """
+        end = time() + max(0.0, timeout)
+        while True:
+            now = time()
+            if self._fd is None and now >= self._next_scan:
+                self._scan()
+                self._next_scan = now + self._interval
+            ready = self._ready()
+            if len(ready) > 0 or now >= end:
+                return ready
+
+            deadline = self._next_deadline()
+            wait = end - now if deadline is None else max(0.0, min(end, deadline) - now)
+            if self._fd is not None:
+                readable = select.select([self._fd], [], [], wait)[0]
+                if len(readable) > 0:
+                    self._read_events()
+            else:
+                sleep(wait)
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
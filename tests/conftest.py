@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The calculator's modules import each other by their bare names
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.joinpath("src")))
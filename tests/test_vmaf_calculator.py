@@ -0,0 +1,58 @@
+import concurrent.futures as cf
+import sys
+from argparse import Namespace
+
+import pytest
+
+pytest.importorskip("gooey")
+
+from vmaf_calculator import is_timed_out, stop_timed_out  # noqa: E402
+from vmaf_job_engine import VMAF_Job_Engine  # noqa: E402
+from vmaf_log_merger import write_frames  # noqa: E402
+from vmaf_progress import VMAF_Progress  # noqa: E402
+
+
+class Saved_State:
+    def __init__(self):
+        self.saved = []
+
+    def save(self, io, encs=None):
+        self.saved.append(set(encs))
+
+
+def test_timed_out_job_leaves_the_others_running(tmp_path):
+    args = Namespace(No_Checkpoints=False, Log_Format="json", Subsamples=None, Timeout=1)
+    ctx = {"io": {}, "state": Saved_State()}
+    infos = []
+    for i, enc in enumerate(["slow.mkv", "fast.mkv"]):
+        log_path = str(tmp_path.joinpath("{}.json".format(enc)))
+        ctx["io"][enc] = {"status": "STARTED", "log_path": log_path}
+        part = {"enc": enc, "segment": None, "log_path": log_path, "resume": 0, "ctx": ctx}
+        infos.append({"id": i, "job": {"parts": [part], "frames": 100}, "parts": [part], "ctx": ctx})
+
+    progress = VMAF_Progress()
+    engine = VMAF_Job_Engine(2, kill_grace=0.5)
+    try:
+        # The slow job already logged its first frames when it runs into the timeout
+        header = {"version": "", "params": {}, "fps": 1.0}
+        write_frames(infos[0]["parts"][0]["log_path"], "json", header, [(n, {"vmaf": 90.0}) for n in range(10)])
+        slow = engine.submit([sys.executable, "-c", "import time; time.sleep(30)"], timeout=args.Timeout)
+        fast = engine.submit([sys.executable, "-c", "import time; time.sleep(3)"], timeout=args.Timeout * 10)
+        for info in infos:
+            progress.add_job(info["id"], info["parts"][0]["enc"], 100)
+
+        cf.wait([slow], timeout=10)
+        assert is_timed_out(slow)
+        stop_timed_out(args, slow, infos[0], progress)
+        assert not fast.done()
+        fast.result(timeout=10)
+        assert not is_timed_out(fast)
+    finally:
+        engine.shutdown(cancel=True)
+
+    io = ctx["io"]
+    assert io["slow.mkv"]["status"] == "TIMED OUT"
+    assert io["slow.mkv"]["checkpoints"][0]["frames"] == 10
+    assert io["fast.mkv"]["status"] == "STARTED"
+    assert ctx["state"].saved == [{"slow.mkv"}]
+    assert progress.get_job(0) is None
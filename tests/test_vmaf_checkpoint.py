@@ -0,0 +1,92 @@
+from pathlib import Path
+
+from vmaf_checkpoint import (
+    check_checkpoints,
+    checkpoint_path,
+    checkpointed_frames,
+    finish_checkpoints,
+    resume_segment,
+    save_checkpoint,
+)
+from vmaf_log_merger import read_frames, write_frames
+
+HEADER = {"version": "2.3.1", "params": {}, "fps": 10.0}
+
+
+def write_log(log_path, nums: list):
+    write_frames(str(log_path), "json", HEADER, [(num, {"vmaf": 50.0 + num}) for num in nums])
+
+
+def test_save_checkpoint_keeps_unbroken_frames(tmp_path):
+    unit = {"log_path": str(tmp_path.joinpath("video.json"))}
+    cancelled = tmp_path.joinpath("video.run.json")
+    write_log(cancelled, [0, 1, 2, 3, 5, 6])
+
+    assert save_checkpoint(unit, str(cancelled), "json") == 4
+    assert not cancelled.exists()
+    assert unit["checkpoints"] == [{"log_path": checkpoint_path(unit["log_path"], 0), "frames": 4, "subsample": 1}]
+    assert [num for num, _ in read_frames(unit["checkpoints"][0]["log_path"], "json")[1]] == [0, 1, 2, 3]
+
+
+def test_save_checkpoint_leaves_a_frame_to_calculate(tmp_path):
+    unit = {"log_path": str(tmp_path.joinpath("video.json"))}
+    cancelled = tmp_path.joinpath("video.run.json")
+    write_log(cancelled, range(10))
+    assert save_checkpoint(unit, str(cancelled), "json", frames=10) == 9
+
+    missing = tmp_path.joinpath("missing.json")
+    assert save_checkpoint(unit, str(missing), "json") == 0
+    assert len(unit["checkpoints"]) == 1
+
+
+def test_save_checkpoint_with_subsampling(tmp_path):
+    unit = {"log_path": str(tmp_path.joinpath("video.json"))}
+    cancelled = tmp_path.joinpath("video.run.json")
+    write_log(cancelled, [0, 3, 6, 9, 12, 15, 18])
+
+    # At least one of the 20 frames is left to calculate, so the sampled frame 18 is not kept
+    assert save_checkpoint(unit, str(cancelled), "json", frames=20, subsample=3) == 18
+    assert unit["checkpoints"][0]["subsample"] == 3
+
+    unit = {"log_path": str(tmp_path.joinpath("video.json"))}
+    write_log(cancelled, [0, 1, 2])
+    assert save_checkpoint(unit, str(cancelled), "json", subsample=3) == 3
+
+
+def test_finish_checkpoints_with_subsampling(tmp_path):
+    unit = {"log_path": str(tmp_path.joinpath("video.json"))}
+    cancelled = tmp_path.joinpath("video.run.json")
+    write_log(cancelled, [0, 3, 6, 9])
+    assert save_checkpoint(unit, str(cancelled), "json", frames=20, subsample=3) == 12
+    assert checkpointed_frames(unit) == 12
+    assert resume_segment({"start_frame": 0, "frames": 20}, 12) == {"start_frame": 12, "frames": 8}
+
+    # The resumed calculation numbers its frames from 0 again
+    rest = tmp_path.joinpath("video.rest.json")
+    write_log(rest, [0, 3, 6])
+    pooled = finish_checkpoints(unit, str(rest), "json")
+
+    frames = read_frames(unit["log_path"], "json")[1]
+    assert [num for num, _ in frames] == [0, 3, 6, 9, 12, 15, 18]
+    assert pooled["vmaf"]["min"] == 50.0
+    assert "checkpoints" not in unit
+    assert not rest.exists()
+    assert not Path(checkpoint_path(unit["log_path"], 0)).exists()
+
+
+def test_check_checkpoints(tmp_path):
+    unit = {"log_path": str(tmp_path.joinpath("video.json"))}
+    cancelled = tmp_path.joinpath("video.run.json")
+    write_log(cancelled, [0, 2, 4])
+    save_checkpoint(unit, str(cancelled), "json", subsample=2)
+
+    check_checkpoints(unit, 2)
+    assert len(unit["checkpoints"]) == 1
+    check_checkpoints(unit, 1)
+    assert "checkpoints" not in unit
+
+    write_log(cancelled, [0, 2, 4])
+    save_checkpoint(unit, str(cancelled), "json", subsample=2)
+    Path(unit["checkpoints"][0]["log_path"]).unlink()
+    check_checkpoints(unit, 2)
+    assert "checkpoints" not in unit
@@ -0,0 +1,152 @@
+import concurrent.futures as cf
+import json
+import socket
+import sys
+import threading
+from time import sleep, time
+
+import ffmpy
+import pytest
+
+from vmaf_common import escape_filter_value
+from vmaf_distributed import VMAF_Coordinator, VMAF_Worker, parse_address
+from vmaf_job_engine import VMAF_Job_Timeout
+
+# Seconds without a heartbeat after which the coordinator requeues a job
+HEARTBEAT_TIMEOUT = 2.0
+
+
+def python_cmd(code: str) -> list:
+    # Workers replace the executable with their own, which is Python here
+    return ["ffmpeg", "-c", code]
+
+
+def wait_for(condition, timeout: float = 10.0):
+    deadline = time() + timeout
+    while not condition():
+        assert time() < deadline
+        sleep(0.05)
+
+
+@pytest.fixture
+def coordinator():
+    coordinator = VMAF_Coordinator("127.0.0.1:0", heartbeat_timeout=HEARTBEAT_TIMEOUT)
+    yield coordinator
+    coordinator.shutdown(cancel=True, timeout=10)
+
+
+@pytest.fixture
+def start_workers(coordinator):
+    started = []
+
+    def start(count: int, slots: int = 1):
+        address = "{}:{}".format(*coordinator.get_address())
+        for _ in range(count):
+            worker = VMAF_Worker(address, ffmpeg=sys.executable, slots=slots, heartbeat=0.5, retry=1.0)
+            thread = threading.Thread(target=worker.run, daemon=True)
+            thread.start()
+            started.append((worker, thread))
+        expected = len(started) * slots
+        wait_for(lambda: coordinator.get_max_jobs() >= expected)
+
+    yield start
+    for worker, thread in started:
+        worker.stop()
+    for worker, thread in started:
+        thread.join(10)
+
+
+def test_parse_address():
+    assert parse_address("10.0.0.1:9000") == ("10.0.0.1", 9000)
+    assert parse_address("9000") == ("127.0.0.1", 9000)
+    assert parse_address("[::1]:9000") == ("::1", 9000)
+
+
+def test_jobs_run_on_several_workers(coordinator, start_workers, tmp_path):
+    start_workers(2, slots=2)
+    assert coordinator.get_max_jobs() == 4
+
+    futures = []
+    for i in range(8):
+        log = tmp_path.joinpath("job{}.log".format(i))
+        code = "import sys, time; time.sleep(1); open(sys.argv[1].replace('\\\\:', ':'), 'w').write('log {}'); ".format(
+            i
+        )
+        code += "print('frame={}'); print('err', file=sys.stderr)".format(i)
+        lines = []
+        usage = {}
+        future = coordinator.submit(
+            python_cmd(code) + [escape_filter_value(log)], on_stdout=lines.append, logs=[log], usage=usage
+        )
+        futures.append((future, log, lines, usage))
+
+    start = time()
+    for i, (future, log, lines, usage) in enumerate(futures):
+        stdout, stderr = future.result(timeout=30)
+        assert stdout == "frame={}".format(i).encode("utf-8")
+        assert stderr == b"err"
+        assert lines == ["frame={}".format(i)]
+        assert log.read_text() == "log {}".format(i)
+        assert usage["wall"] >= 1.0
+    # Eight jobs of a second on four slots
+    assert time() - start < 6.0
+
+
+def test_failed_job(coordinator, start_workers):
+    start_workers(1)
+    future = coordinator.submit(python_cmd("import sys; print('broken', file=sys.stderr); sys.exit(3)"))
+    with pytest.raises(ffmpy.FFRuntimeError) as error:
+        future.result(timeout=30)
+    assert not isinstance(error.value, VMAF_Job_Timeout)
+    assert error.value.exit_code == 3
+    assert b"broken" in error.value.stderr
+
+
+def test_timeout(coordinator, start_workers):
+    start_workers(1)
+    future = coordinator.submit(python_cmd("import time; time.sleep(30)"), timeout=1)
+    with pytest.raises(VMAF_Job_Timeout):
+        future.result(timeout=20)
+
+    # The slot is free for the next job right away
+    assert coordinator.submit(python_cmd("print('next')")).result(timeout=20)[0] == b"next"
+
+
+def test_cancel(coordinator, start_workers):
+    start_workers(1)
+    running = coordinator.submit(python_cmd("import time; time.sleep(30)"))
+    queued = coordinator.submit(python_cmd("print('queued')"))
+    wait_for(running.running)
+    assert coordinator.cancel(queued)
+    assert queued.cancelled()
+
+    start = time()
+    assert coordinator.cancel(running)
+    with pytest.raises(cf.CancelledError):
+        running.result(timeout=1)
+    # The worker killed the cancelled job, and runs the next one
+    assert coordinator.submit(python_cmd("print('next')")).result(timeout=20)[0] == b"next"
+    assert time() - start < 20
+
+
+def test_stalled_worker_is_requeued(coordinator, start_workers):
+    stalled = socket.create_connection(coordinator.get_address())
+    try:
+        stalled.sendall((json.dumps({"type": "hello", "host": "stalled"}) + "\n").encode("utf-8"))
+        stalled.sendall((json.dumps({"type": "request"}) + "\n").encode("utf-8"))
+        future = coordinator.submit(python_cmd("print('requeued')"))
+        reader = stalled.makefile("rb")
+        job = json.loads(reader.readline().decode("utf-8"))
+        assert job["type"] == "job"
+        assert job["attempt"] == 1
+
+        # The stalled worker never sends a heartbeat, so its job goes to the
+        # next worker once the heartbeat timeout passes
+        start = time()
+        start_workers(1)
+        assert future.result(timeout=HEARTBEAT_TIMEOUT + 10)[0] == b"requeued"
+        assert time() - start < HEARTBEAT_TIMEOUT + 3
+        # And the coordinator drops the stalled connection
+        assert reader.readline() == b""
+    finally:
+        stalled.close()
@@ -0,0 +1,58 @@
+import math
+
+import pytest
+
+from vmaf_frame_store import VMAF_Frame_Store_Writer, pool_store, read_store, write_store
+
+HEADER = {"version": "2.3.1", "params": {"model": "vmaf_v0.6.1"}, "fps": 10.0}
+
+
+def test_write_and_read_store(tmp_path):
+    file = tmp_path.joinpath("video.bin")
+    write_store(file, HEADER, [(0, {"vmaf": 90.0, "psnr_y": 40.5}), (1, {"vmaf": 80.0}), (7, {"vmaf": 70.0})])
+
+    header, nums, values = read_store(file)
+    assert header["version"] == "2.3.1"
+    assert header["params"] == {"model": "vmaf_v0.6.1"}
+    assert header["metrics"] == ["vmaf", "psnr_y"]
+    assert nums.tolist() == [0, 1, 7]
+    assert values["vmaf"].tolist() == [90.0, 80.0, 70.0]
+    assert values["psnr_y"][0] == 40.5
+    assert math.isnan(values["psnr_y"][1])
+
+
+def test_pool_store_skips_missing_metrics(tmp_path):
+    file = tmp_path.joinpath("video.bin")
+    write_store(file, HEADER, [(0, {"vmaf": 90.0, "psnr_y": 40.0}), (1, {"vmaf": 60.0})])
+
+    pooled = pool_store(file)
+    assert pooled["vmaf"]["min"] == 60.0
+    assert pooled["vmaf"]["max"] == 90.0
+    assert pooled["vmaf"]["mean"] == 75.0
+    assert pooled["vmaf"]["harmonic_mean"] == pytest.approx(2 / (1 / 91.0 + 1 / 61.0) - 1)
+    assert pooled["psnr_y"]["mean"] == 40.0
+
+
+def test_writer_only_keeps_finished_files(tmp_path):
+    file = tmp_path.joinpath("video.bin")
+    writer = VMAF_Frame_Store_Writer(file)
+    writer.set_header(fps=25.0)
+    writer.add(0, {"vmaf": 90.0})
+    assert not file.exists()
+    with pytest.raises(ValueError):
+        writer.set_header(fps=30.0)
+    writer.close(keep=False)
+    assert list(tmp_path.iterdir()) == []
+
+    writer = VMAF_Frame_Store_Writer(file)
+    writer.close()
+    header, nums, values = read_store(file)
+    assert header["metrics"] == []
+    assert len(nums) == 0
+
+
+def test_read_store_of_other_files(tmp_path):
+    file = tmp_path.joinpath("video.xml")
+    file.write_text("<VMAF />")
+    with pytest.raises(ValueError):
+        read_store(file)
@@ -0,0 +1,53 @@
+import concurrent.futures as cf
+import sys
+
+import ffmpy
+import pytest
+
+from vmaf_job_engine import VMAF_Job_Engine, VMAF_Job_Timeout
+
+
+@pytest.fixture
+def engine():
+    engine = VMAF_Job_Engine(3, kill_grace=0.5)
+    yield engine
+    engine.shutdown(cancel=True)
+
+
+def python_cmd(code: str) -> list:
+    return [sys.executable, "-c", code]
+
+
+def test_submit(engine):
+    usage = {}
+    stdout, stderr = engine.submit(
+        python_cmd("print('out'); import sys; print('err', file=sys.stderr)"), usage=usage
+    ).result()
+    assert stdout == b"out"
+    assert stderr == b"err"
+    assert usage["wall"] > 0
+
+
+def test_failed_job(engine):
+    with pytest.raises(ffmpy.FFRuntimeError) as error:
+        engine.submit(python_cmd("import sys; sys.exit(3)")).result()
+    assert error.value.exit_code == 3
+    assert not isinstance(error.value, VMAF_Job_Timeout)
+
+
+def test_timeout_only_stops_its_own_job(engine):
+    slow = engine.submit(python_cmd("import time; time.sleep(30)"), timeout=0.5)
+    other = engine.submit(python_cmd("import time; time.sleep(2); print('done')"))
+    cf.wait([slow], timeout=10)
+    assert isinstance(slow.exception(), VMAF_Job_Timeout)
+    assert not other.done()
+    assert other.result(timeout=10)[0] == b"done"
+
+
+def test_cancel(engine):
+    task = engine.submit(python_cmd("import time; time.sleep(30)"))
+    queued = [engine.submit(python_cmd("import time; time.sleep(30)")) for _ in range(3)]
+    assert engine.cancel(queued[-1])
+    engine.cancel(task)
+    cf.wait([task, queued[-1]], timeout=10)
+    assert task.cancelled() and queued[-1].cancelled()
@@ -0,0 +1,37 @@
+import pytest
+
+from vmaf_log_merger import merge_logs, pool_metrics, read_frames, write_frames
+
+HEADER = {"version": "2.3.1", "params": {"model": "vmaf_v0.6.1"}, "fps": 10.0}
+
+
+def make_frames(start: int, count: int) -> list:
+    return [(num, {"vmaf": 80.0 + num, "psnr_y": 40.0 + num / 4}) for num in range(start, start + count)]
+
+
+@pytest.mark.parametrize("log_format", ["xml", "json", "csv", "bin"])
+def test_merge_logs_round_trip(tmp_path, log_format):
+    segment_logs = []
+    for i, (start, count) in enumerate([(0, 4), (4, 6), (10, 4)]):
+        seg_log = tmp_path.joinpath("video.seg{}.{}".format(i, log_format))
+        # Every segment numbers its frames from 0
+        write_frames(str(seg_log), log_format, HEADER, [(num - start, m) for num, m in make_frames(start, count)])
+        segment_logs.append((str(seg_log), start))
+
+    log_path = tmp_path.joinpath("video.{}".format(log_format))
+    pooled = merge_logs(segment_logs, str(log_path), log_format)
+
+    expected = make_frames(0, 14)
+    header, frames = read_frames(str(log_path), log_format)
+    assert [num for num, _ in frames] == [num for num, _ in expected]
+    for (_, metrics), (_, expected_metrics) in zip(frames, expected):
+        assert metrics == pytest.approx(expected_metrics, abs=1e-5)
+    assert pooled["vmaf"]["mean"] == pytest.approx(pool_metrics(expected)["vmaf"]["mean"], abs=1e-5)
+    if log_format != "csv":
+        assert header["version"] == "2.3.1"
+    assert not any([tmp_path.joinpath("video.seg{}.{}".format(i, log_format)).exists() for i in range(3)])
+
+
+def test_merge_logs_without_logs(tmp_path):
+    with pytest.raises(ValueError):
+        merge_logs([], str(tmp_path.joinpath("video.json")), "json")
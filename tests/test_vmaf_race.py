@@ -0,0 +1,79 @@
+import pytest
+
+from vmaf_race import VMAF_Race, spread_order, t_quantile
+
+
+def test_spread_order():
+    assert spread_order(8) == [0, 4, 2, 6, 1, 5, 3, 7]
+    assert sorted(spread_order(5)) == [0, 1, 2, 3, 4]
+    assert spread_order(1) == [0]
+    assert spread_order(0) == []
+
+
+def test_find_losers_keeps_the_top_candidates():
+    race = VMAF_Race(1)
+    race.add_candidate("good.mkv", 8)
+    race.add_candidate("bad.mkv", 8)
+    for offset in [-1.0, 1.0, -0.5, 0.5]:
+        race.add_segment("good.mkv", [95.0 + offset] * 10)
+        race.add_segment("bad.mkv", [70.0 + offset] * 10)
+    assert race.find_losers() == ["bad.mkv"]
+
+    race.eliminate("bad.mkv")
+    assert race.find_losers() == []
+
+
+def test_find_losers_needs_enough_segments():
+    race = VMAF_Race(1, min_segments=3)
+    race.add_candidate("good.mkv", 8)
+    race.add_candidate("bad.mkv", 8)
+    for offset in [-1.0, 1.0]:
+        race.add_segment("good.mkv", [95.0 + offset] * 10)
+        race.add_segment("bad.mkv", [70.0 + offset] * 10)
+    assert race.find_losers() == []
+
+
+def test_find_losers_keeps_candidates_that_reach_the_target():
+    race = VMAF_Race(0, target=90.0)
+    race.add_result("done.mkv", 97.0)
+    race.add_candidate("close.mkv", 8)
+    race.add_candidate("far.mkv", 8)
+    for offset in [-1.0, 1.0, -0.5, 0.5]:
+        race.add_segment("close.mkv", [91.0 + offset] * 10)
+        race.add_segment("far.mkv", [60.0 + offset] * 10)
+    assert race.find_losers() == ["far.mkv"]
+    assert race.get_estimate("done.mkv")["low"] == 97.0
+
+
+def test_get_estimate_is_exact_once_every_segment_is_done():
+    race = VMAF_Race(1)
+    race.add_candidate("video.mkv", 2)
+    race.add_segment("video.mkv", [80.0] * 10)
+    race.add_segment("video.mkv", [90.0] * 30)
+    estimate = race.get_estimate("video.mkv")
+    assert estimate["mean"] == 87.5
+    assert estimate["low"] == estimate["high"] == 87.5
+
+
+def test_t_quantile():
+    assert t_quantile(0.95, 1) == pytest.approx(12.706, abs=1e-3)
+    assert t_quantile(0.95, 4) == pytest.approx(2.776, abs=1e-3)
+    assert t_quantile(0.99, 10) == pytest.approx(3.169, abs=1e-3)
+    assert t_quantile(0.95, 1000) == pytest.approx(1.962, abs=1e-3)
+
+
+def test_find_losers_waits_for_more_than_two_noisy_segments():
+    race = VMAF_Race(1)
+    race.add_candidate("good.mkv", 8)
+    race.add_candidate("noisy.mkv", 8)
+    for offset in [-0.5, 0.5, -0.25, 0.25]:
+        race.add_segment("good.mkv", [95.0 + offset] * 10)
+    # A normal interval of these two segments would end below 84
+    race.add_segment("noisy.mkv", [70.0] * 10)
+    race.add_segment("noisy.mkv", [80.0] * 10)
+    assert race.get_estimate("noisy.mkv")["high"] > 95.0
+    assert race.find_losers() == []
+
+    race.add_segment("noisy.mkv", [75.0] * 10)
+    race.add_segment("noisy.mkv", [75.0] * 10)
+    assert race.find_losers() == ["noisy.mkv"]
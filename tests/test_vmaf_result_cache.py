@@ -0,0 +1,35 @@
+from vmaf_result_cache import cache_key, fingerprint
+
+
+def test_fingerprint_ignores_name_and_location(tmp_path):
+    data = bytes(range(256)) * 100
+    first = tmp_path.joinpath("first.mkv")
+    first.write_bytes(data)
+    tmp_path.joinpath("sub").mkdir()
+    second = tmp_path.joinpath("sub", "second.mp4")
+    second.write_bytes(data)
+    assert fingerprint(first) == fingerprint(second)
+    assert fingerprint(first).startswith("{}-".format(len(data)))
+
+
+def test_fingerprint_of_sampled_blocks(tmp_path):
+    # Larger than samples * block_size, so only sampled blocks are hashed
+    data = bytearray(64 * 1024)
+    file = tmp_path.joinpath("video.mkv")
+    file.write_bytes(bytes(data))
+    before = fingerprint(file, samples=4, block_size=1024)
+
+    changed = tmp_path.joinpath("changed.mkv")
+    data[-1] = 1
+    changed.write_bytes(bytes(data))
+    assert fingerprint(changed, samples=4, block_size=1024) != before
+    assert fingerprint(file, samples=4, block_size=1024) == before
+
+
+def test_cache_key():
+    key = cache_key("ref", "enc", "graph", ["vmaf_v0.6.1", "vmaf_4k_v0.6.1"])
+    assert key == cache_key("ref", "enc", "graph", ["vmaf_4k_v0.6.1", "vmaf_v0.6.1"])
+    assert len(key) == 40
+    assert key != cache_key("enc", "ref", "graph", ["vmaf_v0.6.1", "vmaf_4k_v0.6.1"])
+    assert key != cache_key("ref", "enc", "other graph", ["vmaf_v0.6.1", "vmaf_4k_v0.6.1"])
+    assert key != cache_key("ref", "enc", "graph", ["vmaf_v0.6.1"])
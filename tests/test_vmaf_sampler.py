@@ -0,0 +1,43 @@
+import pytest
+
+from vmaf_sampler import estimate_scores, plan_samples, weighted_percentile
+
+
+def test_plan_samples_one_per_stratum():
+    samples = plan_samples(1000, 25.0, 4, 50)
+    assert len(samples) == 4
+    for i, sample in enumerate(samples):
+        assert 250 * i <= sample["start_frame"] <= 250 * (i + 1) - 50
+        assert sample["frames"] == 50
+        assert sample["weight"] == 0.25
+    assert plan_samples(1000, 25.0, 4, 50) == samples
+
+
+def test_weighted_percentile():
+    values = [(10.0, 1.0), (20.0, 1.0), (30.0, 2.0)]
+    assert weighted_percentile(values, 25) == 10.0
+    assert weighted_percentile(values, 50) == 20.0
+    assert weighted_percentile(values, 51) == 30.0
+
+
+def test_estimate_scores_weights_strata():
+    estimate = estimate_scores([(0.75, [80.0, 80.0]), (0.25, [100.0])])
+    assert estimate["mean"]["value"] == pytest.approx(85.0)
+    assert estimate["p50"]["value"] == 80.0
+    assert estimate["mean"]["low"] <= 85.0 <= estimate["mean"]["high"]
+    assert estimate == estimate_scores([(0.75, [80.0, 80.0]), (0.25, [100.0])])
+
+
+def test_estimate_scores_bounds():
+    single = estimate_scores([(1.0, [70.0, 90.0])])
+    assert single["mean"] == {"value": 80.0, "low": 80.0, "high": 80.0}
+
+    samples = [(0.25, [60.0 + 10.0 * i] * 5) for i in range(4)]
+    estimate = estimate_scores(samples, confidence=0.9)
+    assert estimate["mean"]["value"] == pytest.approx(75.0)
+    assert 60.0 <= estimate["mean"]["low"] < 75.0 < estimate["mean"]["high"] <= 90.0
+
+
+def test_estimate_scores_without_scores():
+    with pytest.raises(ValueError):
+        estimate_scores([(1.0, [])])
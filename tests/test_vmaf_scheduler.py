@@ -0,0 +1,33 @@
+import pytest
+
+from vmaf_scheduler import estimate_cost, estimate_makespan, order_jobs
+
+
+def test_estimate_cost():
+    assert estimate_cost(10, 4, 2, 1) == 10 * 4 * 2 * 2.0
+    assert estimate_cost(10, 4, 2, 1, ["psnr"], subsamples=2) == pytest.approx(10 * 4 * 2 * 1.55)
+    assert estimate_cost(-5, 4, 2, 1) == 0
+
+
+def test_order_jobs_longest_first():
+    jobs = [{"name": "a", "cost": 1}, {"name": "b", "cost": 5}, {"name": "c", "cost": 3}]
+    ordered = order_jobs(jobs, lambda job: job["cost"])
+    assert [job["name"] for job in ordered] == ["b", "c", "a"]
+
+
+def test_order_jobs_keeps_groups_together():
+    jobs = [
+        {"enc": "x", "cost": 4},
+        {"enc": "y", "cost": 5},
+        {"enc": "x", "cost": 3},
+        {"enc": "y", "cost": 1},
+    ]
+    ordered = order_jobs(jobs, lambda job: job["cost"], lambda job: job["enc"])
+    # Group x costs 7 in total and goes before group y, even though y has the longest job
+    assert [(job["enc"], job["cost"]) for job in ordered] == [("x", 4), ("x", 3), ("y", 5), ("y", 1)]
+
+
+def test_estimate_makespan():
+    assert estimate_makespan([6, 4, 3, 3, 2], 2) == (9.0, 9.0)
+    assert estimate_makespan([2, 3, 3, 4, 6], 2) == (11.0, 9.0)
+    assert estimate_makespan([2, 2], 0) == (4.0, 4.0)
@@ -0,0 +1,27 @@
+from vmaf_segmenter import plan_segments, segment_input_options
+
+
+def test_plan_segments_covers_every_frame():
+    segments = plan_segments(1000, 25.0, 4)
+    assert [segment["start_frame"] for segment in segments] == [0, 250, 500, 750]
+    assert [segment["frames"] for segment in segments] == [250, 250, 250, None]
+
+
+def test_plan_segments_moves_boundaries_to_close_scene_changes():
+    # 10.4s is frame 260, within a quarter segment of 250, while 14s is too far from it
+    segments = plan_segments(1000, 25.0, 4, scenes=[10.4, 14.0])
+    assert segments[1]["start_frame"] == 260
+    assert segments[0]["frames"] == 260
+
+
+def test_plan_segments_keeps_minimum_length():
+    assert plan_segments(60, 25.0, 8) == [{"start_frame": 0, "frames": None}]
+    assert len(plan_segments(200, 25.0, 8)) == 4
+    assert len(plan_segments(200, 25.0, 8, min_frames=10)) == 8
+
+
+def test_segment_input_options():
+    assert segment_input_options({"start_frame": 0, "frames": None}, 25.0) == ""
+    assert segment_input_options({"start_frame": 0, "frames": 250}, 25.0) == "-t 10.000000"
+    assert segment_input_options({"start_frame": 250, "frames": None}, 25.0) == "-ss 9.980000"
+    assert segment_input_options({"start_frame": 250, "frames": 50}, 25.0, offset=2) == "-ss 10.060000 -t 2.000000"
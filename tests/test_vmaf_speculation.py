@@ -0,0 +1,95 @@
+from vmaf_speculation import VMAF_Speculator, speculative_job, speculative_path
+
+
+def running_job(frame: int, elapsed: float, cost: float = 100.0, total: int = 100) -> dict:
+    return {"cost": cost, "frame": frame, "total": total, "elapsed": elapsed}
+
+
+def test_speculative_job():
+    part = {"enc": "a.mkv", "log_path": "logs/a.json"}
+    job = {"parts": [part], "clips": [{"parts": [part]}], "cost": 1.0}
+    duplicate = speculative_job(job)
+    assert speculative_path("logs/a.json") == "logs/a.spec.json"
+    assert duplicate["parts"][0]["log_path"] == "logs/a.spec.json"
+    assert duplicate["clips"][0]["parts"][0] is duplicate["parts"][0]
+    assert duplicate["speculative"]
+    assert part["log_path"] == "logs/a.json"
+
+
+def test_find_stragglers():
+    speculator = VMAF_Speculator(rate=10.0, ratio=0.5, warmup=10.0)
+    running = {
+        "fast": running_job(90, 10.0),
+        "slow": running_job(10, 20.0),
+        "slower": running_job(5, 20.0),
+        "young": running_job(0, 5.0),
+        "almost_done": running_job(98, 200.0),
+    }
+    # A fresh copy of "almost_done" needs 10 seconds, longer than the rest of it
+    assert speculator.find_stragglers(running, 4) == ["slower", "slow"]
+    assert speculator.find_stragglers(running, 1) == ["slower"]
+    assert speculator.find_stragglers(running, 0) == []
+
+
+def test_find_stragglers_prefers_measured_rates():
+    speculator = VMAF_Speculator(rate=1.0)
+    running = {"slow": running_job(10, 20.0)}
+    assert speculator.find_stragglers(running, 1) == []
+    speculator.add_finished(100.0, 10.0)
+    assert speculator.find_stragglers(running, 1) == ["slow"]
+
+
+def test_find_stragglers_only_once():
+    speculator = VMAF_Speculator(rate=10.0)
+    running = {"slow": running_job(10, 20.0), "duplicate": running_job(0, 20.0)}
+    speculator.add_duplicate("slow", "duplicate")
+    assert speculator.partner("slow") == "duplicate"
+    assert speculator.is_duplicate("duplicate")
+    assert not speculator.is_duplicate("slow")
+    assert speculator.find_stragglers(running, 2) == []
+
+
+def test_settle_duplicate_wins():
+    speculator = VMAF_Speculator(rate=10.0)
+    speculator.add_duplicate("slow", "duplicate")
+    speculator.settle("duplicate", 10.0, 30.0)
+    assert speculator.partner("slow") is None
+    assert speculator.partner("duplicate") is None
+    assert speculator.stats == {"launched": 1, "won": 1, "failed": 0, "used": 10.0, "wasted": 0.0, "discarded": 30.0}
+
+
+def test_settle_original_wins():
+    speculator = VMAF_Speculator(rate=10.0)
+    speculator.add_duplicate("slow", "duplicate")
+    speculator.settle("slow", 10.0, 10.0)
+    assert speculator.stats == {"launched": 1, "won": 0, "failed": 0, "used": 10.0, "wasted": 10.0, "discarded": 0.0}
+
+
+def test_settle_after_the_original_failed():
+    speculator = VMAF_Speculator(rate=10.0)
+    speculator.add_duplicate("slow", "duplicate")
+    speculator.fail("slow")
+    assert speculator.has_failed("slow")
+    assert not speculator.has_failed("duplicate")
+    assert speculator.partner("duplicate") == "slow"
+
+    speculator.settle("duplicate", 10.0, 30.0)
+    assert speculator.partner("slow") is None
+    assert speculator.stats == {"launched": 1, "won": 1, "failed": 1, "used": 10.0, "wasted": 0.0, "discarded": 30.0}
+
+
+def test_settle_after_the_duplicate_failed():
+    speculator = VMAF_Speculator(rate=10.0)
+    speculator.add_duplicate("slow", "duplicate")
+    speculator.fail("duplicate")
+    speculator.settle("slow", 5.0, 5.0)
+    assert speculator.stats == {"launched": 1, "won": 0, "failed": 1, "used": 5.0, "wasted": 5.0, "discarded": 0.0}
+
+
+def test_settle_after_both_failed():
+    speculator = VMAF_Speculator(rate=10.0)
+    speculator.add_duplicate("slow", "duplicate")
+    speculator.fail("slow")
+    speculator.settle("duplicate", 10.0, 30.0, failed=True)
+    assert speculator.partner("slow") is None
+    assert speculator.stats == {"launched": 1, "won": 0, "failed": 2, "used": 10.0, "wasted": 10.0, "discarded": 0.0}